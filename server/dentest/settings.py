@@ -88,6 +88,20 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/1.7/topics/cache/
+# Shared by the web workers and the management command workers (webhooks, reconciliation, cancellation, provisioning),
+# so an entry invalidated by one process is gone for all of them. Production uses memcached (see settings_prod.py);
+# here the database keeps setup simple. Create the table with `python manage.py createcachetable` after migrating.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    }
+}
+
+
 
 
 # Internationalization
@@ -122,7 +136,8 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES':(
-        'rest_framework.authentication.TokenAuthentication',
+        'restful_auth.authentication.AccessTokenAuthentication',
+        'restful_auth.authentication.CachedTokenAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
     ),
 }
@@ -154,6 +169,7 @@ TEMPLATE_DIRS = (
 )
 # Password Requirements
 PASSWORD_MIN_LENGTH = 8
+PASSWORD_BREACHED_FILTER = None # Path of a filter built with manage.py build_breached_password_filter
 PASSWORD_COMPLEXITY = { # You can omit any or all of these for no limit for that particular set
     "UPPER": 1,        # Uppercase
     "LOWER": 1,        # Lowercase
@@ -98,6 +98,20 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/1.7/topics/cache/
+# Shared by the web workers and the management command workers (webhooks, reconciliation, cancellation, provisioning),
+# so an entry invalidated by one process is gone for all of them. Memcached rather than the database, as the caches
+# exist to keep lookups off the database.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    }
+}
+
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.7/topics/i18n/
@@ -136,7 +150,8 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES':(
-        'rest_framework.authentication.TokenAuthentication',
+        'restful_auth.authentication.AccessTokenAuthentication',
+        'restful_auth.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
 }
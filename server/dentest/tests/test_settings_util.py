@@ -4,6 +4,14 @@ from django.test import TestCase
 
 class SettingsUtilityTestCase(TestCase):
 
+    def setUp(self):
+        self.settings_module = os.environ['DJANGO_SETTINGS_MODULE']
+
+    def tearDown(self):
+        # Other apps read their settings through the utility, so put the real settings back
+        os.environ['DJANGO_SETTINGS_MODULE'] = self.settings_module
+        reload(settings_util)
+
     def test_settings_retrieval(self):
         # Test retrieval from environment variable
         os.environ['DJANGO_SETTINGS_MODULE'] = 'dentest.tests.settings_1'
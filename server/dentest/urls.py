@@ -19,8 +19,14 @@ urlpatterns = patterns('',
     #REST ENDPOINTS
     url(r'^questions/question_number/(?P<question_number>[0-9]{1,100})/$',
         q_views.QuestionRetrieveView.as_view()),
+    url(r'^questions/question_number/(?P<question_number>[0-9]{1,100})/similar/$',
+        q_views.SimilarQuestionsView.as_view()),
     url(r'questions/by_topic/(?P<topic>[\w ]{1,80})/$',q_views.QuestionsListByTopic.as_view()),
     url(r'questions/by_subtopic/(?P<topic>[\w ]{1,80})/(?P<subtopic>[\w ]{1,255})/$',q_views.QuestionsListBySubtopic.as_view()),
+    url(r'^questions/by_topic/(?P<topic>[\w ]{1,80})/search/(?P<search_terms>.*)/$',
+        q_views.QuestionsBySearchInTopic.as_view()),
+    url(r'^questions/by_subtopic/(?P<topic>[\w ]{1,80})/(?P<subtopic>[\w ]{1,255})/search/(?P<search_terms>.*)/$',
+        q_views.QuestionsBySearchInSubtopic.as_view()),
     url(r'^questions/$',q_views.QuestionListCreateView.as_view()),
     url(r'^questions_search/(?P<search_terms>.*)/$',q_views.QuestionsBySearch.as_view()),
     url(r'^topics/$',q_views.TopicView.as_view()),
@@ -31,12 +37,15 @@ urlpatterns = patterns('',
 
     # Subscription
     url(r'^generate_token/$',s_views.GenerateClientTokenView.as_view()),
+    url(r'^client_token_pool_metrics/$',s_views.ClientTokenPoolMetricsView.as_view()),
+    url(r'^braintree_transport_metrics/$',s_views.BraintreeTransportMetricsView.as_view()),
     url(r'^plan_info/$',s_views.PlanInfoView.as_view()),
     url(r'^subscribe/$',s_views.SubscriptionCreationView.as_view()),
     url(r'^renew_subscription/$',s_views.SubscriptionRenewalView.as_view()),
     url(r'^cancel_subscription/$',s_views.SubscriptionCancelView.as_view()),
     url(r'^subscription_status/$',s_views.SubscriptionStatusView.as_view()),
     url(r'^change_payment_method/$',s_views.SubscriptionChangePaymentMethodView.as_view()),
+    url(r'^braintree_webhook/$',s_views.SubscriptionWebhookView.as_view()),
 
     # REST Framework Authentication (only need to be able to log in to REST view
     url(r'^api-auth/',include('rest_framework.urls',namespace='rest_framework')),
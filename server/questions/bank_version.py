@@ -0,0 +1,50 @@
+"""
+Version stamp for the question bank. It lives in the shared cache so every server process notices when a Topic,
+Subtopic or Question changes and can rebuild any in-memory structures derived from the bank.
+"""
+import time
+import threading
+from django.core.cache import cache
+
+BANK_VERSION_KEY = 'questions:bank_version'
+
+
+def _fresh_version():
+    # Start from the clock rather than 1 so a version lost from the cache is never mistaken for an old one
+    return int(time.time() * 1000)
+
+
+def get_bank_version():
+    """Returns the current version of the question bank"""
+    version = cache.get(BANK_VERSION_KEY)
+    if version is None:
+        cache.add(BANK_VERSION_KEY, _fresh_version(), None)
+        version = cache.get(BANK_VERSION_KEY)
+    return version
+
+
+def bump_bank_version():
+    """Marks everything derived from the question bank as out of date"""
+    try:
+        cache.incr(BANK_VERSION_KEY)
+    except ValueError:
+        cache.set(BANK_VERSION_KEY, _fresh_version(), None)
+
+
+class BankDerivedCache(object):
+    """Holds a single structure built from the question bank in process memory, rebuilding it when the bank changes"""
+
+    def __init__(self, build):
+        self._build = build
+        self._value = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = get_bank_version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._value = self._build()
+                    self._version = version
+        return self._value
@@ -0,0 +1,106 @@
+"""
+In-memory subtopic index used to facet and filter search results. Each process keeps a numpy array mapping question id
+to a subtopic code, along with a sorted posting list of question ids for every subtopic and topic. Facet counts for a
+set of matching ids are then a single bincount, and topic/subtopic filters are posting list intersections, so neither
+needs another database query. The index is rebuilt lazily whenever the question bank version changes.
+"""
+import numpy
+
+from bank_version import BankDerivedCache
+
+NO_SUBTOPIC = -1
+
+
+def _merge_postings(postings):
+    if not postings:
+        return numpy.array([], dtype=numpy.intp)
+    return numpy.sort(numpy.concatenate(postings))
+
+
+class SubtopicIndex(object):
+    """Maps question ids to the subtopic (and topic) they belong to"""
+
+    def __init__(self, question_ids, subtopic_ids, subtopics):
+        """
+        :param question_ids: ids of all questions in the bank
+        :param subtopic_ids: the subtopic id of each of those questions
+        :param subtopics: (id, topic name, subtopic name) for every subtopic
+        """
+        self.subtopics = [(topic, name) for _, topic, name in subtopics]
+        self.topics = sorted(set(topic for topic, _ in self.subtopics))
+        code_for_subtopic_id = dict((subtopic[0], code) for code, subtopic in enumerate(subtopics))
+        topic_codes = dict((topic, code) for code, topic in enumerate(self.topics))
+        self.topic_of_subtopic = numpy.array([topic_codes[topic] for topic, _ in self.subtopics], dtype=numpy.intp)
+
+        question_ids = numpy.asarray(question_ids, dtype=numpy.intp)
+        codes = numpy.array([code_for_subtopic_id[subtopic_id] for subtopic_id in subtopic_ids], dtype=numpy.intp)
+        size = question_ids.max() + 1 if len(question_ids) else 0
+        self.subtopic_of = numpy.empty(size, dtype=numpy.intp)
+        self.subtopic_of.fill(NO_SUBTOPIC)
+        self.subtopic_of[question_ids] = codes
+
+        # Posting lists of question ids, sorted so they can be intersected cheaply
+        order = numpy.lexsort((question_ids, codes))
+        sorted_ids, sorted_codes = question_ids[order], codes[order]
+        bounds = numpy.searchsorted(sorted_codes, numpy.arange(len(self.subtopics) + 1))
+        self.subtopic_postings = [sorted_ids[bounds[code]:bounds[code + 1]] for code in range(len(self.subtopics))]
+        self.topic_postings = []
+        for topic_code in range(len(self.topics)):
+            codes_in_topic = numpy.flatnonzero(self.topic_of_subtopic == topic_code)
+            self.topic_postings.append(_merge_postings([self.subtopic_postings[code] for code in codes_in_topic]))
+
+    @classmethod
+    def build(cls):
+        """Build the index from the database (two queries)"""
+        from models import Question, Subtopic
+        subtopics = list(Subtopic.objects.order_by('topic', 'name').values_list('id', 'topic', 'name'))
+        questions = list(Question.objects.order_by().values_list('id', 'subtopic'))
+        question_ids = [question_id for question_id, _ in questions]
+        subtopic_ids = [subtopic_id for _, subtopic_id in questions]
+        return cls(question_ids, subtopic_ids, subtopics)
+
+    def subtopic_codes(self, question_ids):
+        """Subtopic code of each of the given question ids (NO_SUBTOPIC for ids the index doesn't know about)"""
+        question_ids = numpy.asarray(question_ids, dtype=numpy.intp)
+        codes = numpy.empty(len(question_ids), dtype=numpy.intp)
+        codes.fill(NO_SUBTOPIC)
+        known = question_ids < len(self.subtopic_of)
+        codes[known] = self.subtopic_of[question_ids[known]]
+        return codes
+
+    def facet_counts(self, question_ids):
+        """Count the given questions per topic and per subtopic, leaving out anything with no hits"""
+        codes = self.subtopic_codes(question_ids)
+        subtopic_counts = numpy.bincount(codes[codes != NO_SUBTOPIC], minlength=len(self.subtopics))
+        topic_counts = numpy.bincount(self.topic_of_subtopic, weights=subtopic_counts, minlength=len(self.topics))
+        return {
+            'topics': [{'topic': topic, 'count': int(count)}
+                       for topic, count in zip(self.topics, topic_counts) if count],
+            'subtopics': [{'topic': topic, 'subtopic': name, 'count': int(count)}
+                          for (topic, name), count in zip(self.subtopics, subtopic_counts) if count],
+        }
+
+    def posting_list(self, topic=None, subtopic=None):
+        """Sorted ids of all questions in the given topic and/or subtopic (subtopic names are matched in any topic
+        when no topic is given)"""
+        if subtopic is None:
+            if topic not in self.topics:
+                return numpy.array([], dtype=numpy.intp)
+            return self.topic_postings[self.topics.index(topic)]
+        return _merge_postings([self.subtopic_postings[code] for code, (topic_name, name) in enumerate(self.subtopics)
+                                if name == subtopic and (topic is None or topic_name == topic)])
+
+    def restrict(self, question_ids, topic=None, subtopic=None):
+        """Intersect the given ids with the posting list for a topic/subtopic, keeping the order they were given in"""
+        question_ids = numpy.asarray(question_ids, dtype=numpy.intp)
+        if topic is None and subtopic is None:
+            return question_ids
+        return question_ids[numpy.in1d(question_ids, self.posting_list(topic, subtopic))]
+
+
+_index = BankDerivedCache(SubtopicIndex.build)
+
+
+def get_subtopic_index():
+    """Returns the subtopic index for the current version of the question bank, rebuilding it if needed"""
+    return _index.get()
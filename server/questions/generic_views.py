@@ -3,16 +3,16 @@ from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
 from django.http import Http404
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListCreateAPIView, RetrieveAPIView, ListAPIView
+from rest_framework.response import Response
 from rest_framework import permissions
-from watson.search import filter as watson_filter
 
 from serializers import *
 from mixins import QuestionApiMixin
 from pagination import *
-
-from watson.search import filter as watsonfilter
-
-from subscriptions.subscription_manager import SubscriptionManager
+from search import normalize_search_terms, question_search_engine
+from facets import get_subtopic_index
+from similarity import get_similarity_index, get_similar_question_ids, SIMILAR_QUESTIONS_DEFAULT, \
+    SIMILAR_QUESTIONS_MAX
 
 LOGGER = logging.getLogger(__name__)
 
@@ -59,7 +59,7 @@ class QuestionListCreateView(QuestionApiMixin, ListCreateAPIView):
         """
 
         # No filtering. Just display all questions user has permissions for
-        if SubscriptionManager.can_user_access_subscription_content(self.request.user):
+        if self.can_access_subscription_content():
             return Question.objects.all()
         else:
             return Question.objects.filter(restricted=False)
@@ -114,11 +114,40 @@ class QuestionRetrieveView(QuestionApiMixin, RetrieveAPIView):
         except ObjectDoesNotExist:
             raise Http404
 
-        if question.restricted and not SubscriptionManager.can_user_access_subscription_content(self.request.user):
+        if question.restricted and not self.can_access_subscription_content():
             raise PermissionDenied
         return question
 
 
+class SimilarQuestionsView(QuestionApiMixin, ListAPIView):
+    """
+    List the questions most similar to the given question, best first. Used to build remediation sets after a wrong
+    answer. The number returned can be set with k (default 10, at most 50)
+    """
+    lookup_url_kwarg = 'question_number'
+    pagination_class = None
+
+    def get_queryset(self):
+        question_id = int(self.kwargs[self.lookup_url_kwarg])
+        try:
+            k = int(self.request.query_params.get('k', SIMILAR_QUESTIONS_DEFAULT))
+        except ValueError:
+            raise ValidationError("k must be a number")
+        if k < 1 or k > SIMILAR_QUESTIONS_MAX:
+            raise ValidationError("k must be between 1 and %s" % SIMILAR_QUESTIONS_MAX)
+
+        index = get_similarity_index()
+        if question_id not in index:
+            raise Http404
+        can_access_all = self.can_access_subscription_content()
+        if index.is_restricted(question_id) and not can_access_all:
+            raise PermissionDenied
+
+        similar_ids = get_similar_question_ids(question_id, k, include_restricted=can_access_all)
+        questions = Question.objects.select_related('subtopic').in_bulk(similar_ids)
+        return [questions[similar_id] for similar_id in similar_ids if similar_id in questions]
+
+
 class QuestionsListByTopic(QuestionApiMixin, ListAPIView):
     """List all questions which belong to the named topic"""
     lookup_field = 'topic'
@@ -133,7 +162,7 @@ class QuestionsListByTopic(QuestionApiMixin, ListAPIView):
         if not questions_r.exists():
             raise Http404  # Topic is empty (contains no questions)
 
-        if SubscriptionManager.can_user_access_subscription_content(self.request.user):
+        if self.can_access_subscription_content():
             return questions_r  # Give privileged user all questions
 
         questions = Question.objects.filter(subtopic__in=subtopics, restricted=False)
@@ -159,7 +188,7 @@ class QuestionsListBySubtopic(QuestionApiMixin, ListAPIView):
             if not questions_r.exists():
                 # User picked an empty topic
                 raise Http404
-            if SubscriptionManager.can_user_access_subscription_content(self.request.user):
+            if self.can_access_subscription_content():
                 return questions_r
             questions = Question.objects.filter(subtopic=subtopic_pk, restricted=False)
 
@@ -171,21 +200,74 @@ class QuestionsListBySubtopic(QuestionApiMixin, ListAPIView):
 
 
 class QuestionsBySearch(QuestionApiMixin, ListAPIView):
-    """Return questions which match user-provided search terms"""
+    """
+    Return questions which match user-provided search terms. Results can be narrowed with the topic and subtopic
+    query parameters, and facets=true adds hit counts per topic and subtopic (counted before narrowing).
+    """
 
     def get_queryset(self):
         search_terms = self.kwargs.get('search_terms', None)
         if search_terms is None:
             raise ValidationError("Must provide a search term")
+        search_terms = normalize_search_terms(search_terms)
+        if not search_terms:
+            raise Http404  # Nothing searchable left once markup and punctuation are removed
 
-        if SubscriptionManager.can_user_access_subscription_content(self.request.user):
+        if self.can_access_subscription_content():
             questions = Question.objects.all()
         else:
             questions = Question.objects.filter(restricted=False)
-        relevant_questions = watsonfilter(questions, search_terms)
-        if relevant_questions.exists():
-            return relevant_questions
-        else:
+        return question_search_engine.filter(self.get_search_scope(questions), search_terms)
+
+    def get_search_scope(self, questions):
+        """Narrow the questions searched. Global search covers the whole bank"""
+        return questions
+
+    def list(self, request, *args, **kwargs):
+        """
+        Only the ids of the matching questions are fetched. Facets and topic/subtopic filters are worked out from
+        the in-memory subtopic index, then just the requested page of questions is loaded.
+        """
+        matching_ids = [question_id for question_id, _ in self.get_queryset().values_list('id', 'watson_rank')]
+        index = get_subtopic_index()
+
+        facets = None
+        if request.query_params.get('facets', '').lower() in ('1', 'true', 'yes'):
+            facets = index.facet_counts(matching_ids)
+
+        question_ids = index.restrict(matching_ids,
+                                      topic=request.query_params.get('topic', None),
+                                      subtopic=request.query_params.get('subtopic', None)).tolist()
+        if not question_ids:
             raise Http404
 
+        page = self.paginate_queryset(question_ids)
+        page_ids = page if page is not None else question_ids
+        questions = Question.objects.select_related('subtopic').in_bulk(page_ids)
+        serializer = self.get_serializer([questions[question_id] for question_id in page_ids
+                                          if question_id in questions], many=True)
+        if page is not None:
+            response = self.get_paginated_response(serializer.data)
+        else:
+            response = Response(serializer.data)
+        if facets is not None:
+            response.data['facets'] = facets
+        return response
+
 
+class QuestionsBySearchInTopic(QuestionsBySearch):
+    """Search only the questions in the named topic. The scope is part of the search query itself"""
+
+    def get_search_scope(self, questions):
+        return questions.filter(subtopic__topic=self.kwargs['topic'])
+
+
+class QuestionsBySearchInSubtopic(QuestionsBySearch):
+    """Search only the questions in the named topic,subtopic pair"""
+
+    def get_search_scope(self, questions):
+        try:
+            subtopic = Subtopic.objects.get(topic=self.kwargs['topic'], name=self.kwargs['subtopic'])
+        except ObjectDoesNotExist:
+            raise Http404
+        return questions.filter(subtopic=subtopic)
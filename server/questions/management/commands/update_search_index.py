@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from questions.search import flush_index_queue, SEARCH_INDEX_BATCH_SIZE
+
+
+
+class Command(BaseCommand):
+    help = 'Update the question search index for every question queued since the last run'
+
+    option_list = BaseCommand.option_list + (
+        make_option("-b",
+                    "--batch-size",
+                    action="store",
+                    type="int",
+                    dest="batch_size",
+                    default=SEARCH_INDEX_BATCH_SIZE,
+                    help='Number of questions to index per batch (default %s)' % SEARCH_INDEX_BATCH_SIZE
+        ),
+        make_option("-w",
+                    "--watch",
+                    action="store_true",
+                    dest="watch",
+                    default=False,
+                    help='Keep running as a worker, flushing the queue every --interval seconds'
+        ),
+        make_option("-i",
+                    "--interval",
+                    action="store",
+                    type="int",
+                    dest="interval",
+                    default=10,
+                    help='Seconds between flushes when running with --watch (default 10)'
+        ),
+    )
+
+
+    def handle(self, *args, **options):
+        while True:
+            indexed = flush_index_queue(batch_size=options['batch_size'])
+            self.stdout.write("Indexed %s questions" % indexed)
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
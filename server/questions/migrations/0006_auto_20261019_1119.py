@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from questions.search import clean_search_text
+
+
+def populate_indexed_text(apps, schema_editor):
+    """Clean the text of all existing questions. Run manage.py buildwatson afterwards to rebuild the index"""
+    Question = apps.get_model('questions', 'Question')
+    for question in Question.objects.all():
+        question.indexed_question = clean_search_text(question.question)
+        question.indexed_answer = clean_search_text(question.answer)
+        question.save(update_fields=['indexed_question', 'indexed_answer'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0005_auto_20150403_1406'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='indexed_answer',
+            field=models.TextField(default=b'', editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='indexed_question',
+            field=models.TextField(default=b'', editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_indexed_text),
+    ]
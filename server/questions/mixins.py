@@ -2,11 +2,16 @@ from rest_framework import permissions
 
 from pagination import ClientControllablePagination
 from serializers import QuestionSerializer
+from subscriptions.entitlements import can_access_subscription_content
 
 class QuestionApiMixin(object):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = QuestionSerializer
     pagination_class = ClientControllablePagination
 
+    def can_access_subscription_content(self):
+        """Whether the requesting user may see restricted questions (resolved once per request)"""
+        return can_access_subscription_content(self.request.user)
+
 
 
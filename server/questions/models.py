@@ -1,6 +1,7 @@
 from django.db import models
+from django.utils import timezone
 
-import watson.search
+from search import QuestionSearchAdapter, clean_search_text, question_search_engine
 
 # Must be unicode! This is how they are stored in the database
 class Topic(models.Model):
@@ -37,6 +38,16 @@ class Question(models.Model):
     answer = models.TextField()
     restricted = models.BooleanField(default=False)
 
+    # Markup-free copies of question and answer, used to build the search index
+    indexed_question = models.TextField(blank=True, default='', editable=False)
+    indexed_answer = models.TextField(blank=True, default='', editable=False)
+
+    def save(self, *args, **kwargs):
+        """Refresh the cleaned search text so it is only computed once per edit"""
+        self.indexed_question = clean_search_text(self.question)
+        self.indexed_answer = clean_search_text(self.answer)
+        super(Question, self).save(*args, **kwargs)
+
     def __str__(self):
         return str({
             'Topic->Subtopic':str(self.subtopic),
@@ -51,6 +62,17 @@ class Question(models.Model):
 
 
 
+class PendingIndexUpdate(models.Model):
+    """A question whose search index entry is out of date. Flushed in batches by the update_search_index command"""
+    question_id = models.IntegerField(primary_key=True)
+    queued_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return 'PendingIndexUpdate: ' + str(self.question_id)
+
+
 # Register Watson Models
 
-watson.search.register(Question)
\ No newline at end of file
+question_search_engine.register(Question, QuestionSearchAdapter)
+
+from signal_receivers import * # Makes sure signal receivers are registered on startup
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""
+Search indexing for questions. Question and answer text is entered through TinyMCE, so it is stored as HTML. The text
+is cleaned once when a question is saved (markup stripped, entities decoded, lowercased and lightly stemmed) and the
+cleaned copy is what ends up in the watson index. Search terms are passed through the same normalization so they line
+up with the indexed text.
+
+Index maintenance is deferred: saving a question only queues its id, and the queue is flushed in batches by the
+update_search_index management command.
+"""
+import re
+import logging
+from contextlib import contextmanager
+from threading import local
+
+from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.html import strip_tags
+from django.utils.text import unescape_entities
+from watson.search import SearchAdapter, SearchEngine, search_context_manager
+
+from dentest.settings_utility import get_setting_with_default
+
+LOGGER = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+MIN_STEM_LENGTH = 3
+UNDOUBLED_CONSONANTS = 'bdfgmnprt'
+# aches, headaches and caches, but not teaches or coaches
+ACHE_RE = re.compile(r'(^|[^aeiou])aches$')
+SEARCH_INDEX_BATCH_SIZE = get_setting_with_default('SEARCH_INDEX_BATCH_SIZE', 200)
+
+
+def stem_word(word):
+    """
+    Very light suffix stripping (plurals, -ing and -ed). It doesn't need to be linguistically perfect, only consistent,
+    as both the index and the search terms are stemmed with it, but the forms of a word should share a stem.
+    """
+    if len(word) <= MIN_STEM_LENGTH:
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('sses'):
+        return word[:-2]
+    # boxes -> box, wishes -> wish, but headaches -> headache (as ache isn't ach)
+    if word.endswith(('xes', 'zzes', 'shes', 'ches')) and not ACHE_RE.search(word):
+        return word[:-2]
+    for suffix in ('ing', 'ed'):
+        # bleed and speed aren't past tenses
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH and not word.endswith('eed'):
+            word = word[:-len(suffix)]
+            # running -> run, stopped -> stop
+            if word[-1] == word[-2] and word[-1] in UNDOUBLED_CONSONANTS:
+                word = word[:-1]
+            return word
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def clean_search_text(text):
+    """Strip markup from the given text and normalize it into a space separated string of stemmed words"""
+    if not text:
+        return u''
+    text = unescape_entities(strip_tags(force_text(text))).lower()
+    return u' '.join(stem_word(word) for word in WORD_RE.findall(text))
+
+
+def normalize_search_terms(search_terms):
+    """Search terms go through the same cleaning as the indexed text so stems match"""
+    return clean_search_text(search_terms)
+
+
+class QuestionSearchAdapter(SearchAdapter):
+    """
+    Indexes the cleaned text cached on each Question rather than the raw TinyMCE markup. The question text is used as
+    the title (highest ranking), the topic and subtopic names as the description and the answer as the content.
+    """
+
+    def get_title(self, obj):
+        return obj.indexed_question[:1000]
+
+    def get_description(self, obj):
+        subtopic = obj.subtopic
+        return clean_search_text(subtopic.topic_id + u' ' + subtopic.name)
+
+    def get_content(self, obj):
+        return obj.indexed_answer
+
+
+class QueuedSearchEngine(SearchEngine):
+    """A watson search engine which queues saved objects for a batched index update instead of indexing them inline"""
+
+    def _post_save_receiver(self, instance, **kwargs):
+        queue_index_update(instance.pk)
+
+
+question_search_engine = QueuedSearchEngine('questions')
+
+# Thread local stack of sets collecting the questions saved while indexing is suspended
+_suspended = local()
+
+
+def _suspended_stack():
+    if not hasattr(_suspended, 'stack'):
+        _suspended.stack = []
+    return _suspended.stack
+
+
+def queue_index_update(question_id):
+    """Mark a question as needing its search entry refreshed"""
+    stack = _suspended_stack()
+    if stack:
+        stack[-1].add(question_id)
+        return
+    from questions.models import PendingIndexUpdate
+    PendingIndexUpdate.objects.update_or_create(question_id=question_id, defaults={'queued_at': timezone.now()})
+
+
+def index_questions(question_ids, batch_size=None):
+    """Refresh the search entries of the given questions, writing new entries in bulk"""
+    from questions.models import Question
+    batch_size = batch_size or SEARCH_INDEX_BATCH_SIZE
+    question_ids = list(question_ids)
+    for start in range(0, len(question_ids), batch_size):
+        questions = Question.objects.filter(pk__in=question_ids[start:start + batch_size]).select_related('subtopic')
+        with search_context_manager.update_index():
+            for question in questions:
+                search_context_manager.add_to_context(question_search_engine, question)
+
+
+def flush_index_queue(batch_size=None):
+    """
+    Index everything queued up to now, one batch at a time. Questions saved again while the flush is running keep
+    their place in the queue. Returns the number of questions indexed.
+    """
+    from questions.models import PendingIndexUpdate
+    batch_size = batch_size or SEARCH_INDEX_BATCH_SIZE
+    cutoff = timezone.now()
+    processed = 0
+    while True:
+        pending = PendingIndexUpdate.objects.filter(queued_at__lte=cutoff).order_by('queued_at')
+        question_ids = list(pending.values_list('question_id', flat=True)[:batch_size])
+        if not question_ids:
+            break
+        index_questions(question_ids, batch_size)
+        PendingIndexUpdate.objects.filter(question_id__in=question_ids, queued_at__lte=cutoff).delete()
+        processed += len(question_ids)
+    if processed:
+        LOGGER.info("Updated search index for %s questions", processed)
+    return processed
+
+
+@contextmanager
+def suspended_indexing():
+    """
+    Suspend index maintenance for the enclosed block, e.g. during an import. Nothing is queued while suspended, the
+    questions saved inside the block are indexed once when it exits.
+    """
+    stack = _suspended_stack()
+    stack.append(set())
+    try:
+        yield
+    finally:
+        question_ids = stack.pop()
+        if stack:
+            stack[-1].update(question_ids)
+        elif question_ids:
+            index_questions(question_ids)
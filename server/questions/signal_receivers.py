@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from bank_version import bump_bank_version
+from models import Topic, Subtopic, Question
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+@receiver(post_save, sender=Subtopic)
+@receiver(post_delete, sender=Subtopic)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_bank_changed(sender, **kwargs):
+    """Invalidate the in-memory search structures whenever the bank is edited"""
+    bump_bank_version()
@@ -0,0 +1,122 @@
+"""
+"Similar questions" recommendations. TF-IDF vectors for the whole bank are built from the cleaned search text cached on
+each question and held in process memory as CSR style numpy arrays (scipy isn't a dependency), together with their
+transpose. Scoring one question against the bank is then a single sparse dot product: gather the postings of the
+question's terms and bincount their weighted contributions per question.
+
+Results are cached per question id under the question bank version, so they are dropped as soon as any question
+changes.
+"""
+from collections import Counter
+
+import numpy
+from django.core.cache import cache
+
+from bank_version import BankDerivedCache, get_bank_version
+from dentest.settings_utility import get_setting_with_default
+
+SIMILAR_QUESTIONS_DEFAULT = 10
+SIMILAR_QUESTIONS_MAX = 50
+SIMILAR_QUESTIONS_CACHE_TIMEOUT = get_setting_with_default('SIMILAR_QUESTIONS_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+class SimilarityIndex(object):
+    """L2 normalized TF-IDF vectors for every question in the bank"""
+
+    def __init__(self, question_ids, documents, restricted):
+        """
+        :param question_ids: ids of all questions in the bank
+        :param documents: the cleaned search text of each question
+        :param restricted: whether each question is restricted to subscribers
+        """
+        self.question_ids = numpy.asarray(question_ids, dtype=numpy.intp)
+        self.restricted = numpy.asarray(restricted, dtype=bool)
+        self.row_of = dict((question_id, row) for row, question_id in enumerate(question_ids))
+
+        vocabulary = {}
+        indptr, indices, term_counts = [0], [], []
+        for document in documents:
+            counts = Counter(vocabulary.setdefault(term, len(vocabulary)) for term in document.split())
+            indices.extend(counts.keys())
+            term_counts.extend(counts.values())
+            indptr.append(len(indices))
+        self.indptr = numpy.asarray(indptr, dtype=numpy.intp)
+        self.indices = numpy.asarray(indices, dtype=numpy.intp)
+
+        # Sublinear term frequency with smoothed idf, then normalize every row to unit length
+        rows = numpy.repeat(numpy.arange(len(documents)), numpy.diff(self.indptr))
+        document_frequency = numpy.bincount(self.indices, minlength=len(vocabulary))
+        idf = numpy.log((1.0 + len(documents)) / (1.0 + document_frequency)) + 1.0
+        data = (1.0 + numpy.log(numpy.asarray(term_counts, dtype=float))) * idf[self.indices]
+        norms = numpy.sqrt(numpy.bincount(rows, weights=data ** 2, minlength=len(documents)))
+        norms[norms == 0] = 1.0
+        self.data = data / norms[rows]
+
+        # Transpose (term -> questions) used to score a question against the whole bank
+        order = numpy.argsort(self.indices, kind='mergesort')
+        self.term_indptr = numpy.concatenate(([0], numpy.cumsum(document_frequency))).astype(numpy.intp)
+        self.term_rows = rows[order]
+        self.term_data = self.data[order]
+
+    @classmethod
+    def build(cls):
+        """Build the index from the database (one query)"""
+        from models import Question
+        questions = list(Question.objects.order_by('id').values_list('id', 'indexed_question', 'indexed_answer',
+                                                                     'restricted'))
+        return cls([question[0] for question in questions],
+                   [question[1] + u' ' + question[2] for question in questions],
+                   [question[3] for question in questions])
+
+    def __contains__(self, question_id):
+        return question_id in self.row_of
+
+    def is_restricted(self, question_id):
+        return bool(self.restricted[self.row_of[question_id]])
+
+    def scores(self, question_id):
+        """Cosine similarity of the given question with every question in the bank"""
+        row = self.row_of[question_id]
+        terms = self.indices[self.indptr[row]:self.indptr[row + 1]]
+        weights = self.data[self.indptr[row]:self.indptr[row + 1]]
+        starts = self.term_indptr[terms]
+        lengths = self.term_indptr[terms + 1] - starts
+        # Positions of every posting of every query term, laid end to end
+        postings = numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths) + numpy.arange(lengths.sum())
+        return numpy.bincount(self.term_rows[postings],
+                              weights=self.term_data[postings] * numpy.repeat(weights, lengths),
+                              minlength=len(self.question_ids))
+
+    def most_similar(self, question_id, k, include_restricted=True):
+        """Ids of the k questions most similar to the given one, best first. Unrelated questions are left out"""
+        scores = self.scores(question_id)
+        scores[self.row_of[question_id]] = 0
+        if not include_restricted:
+            scores[self.restricted] = 0
+        candidates = numpy.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[numpy.argpartition(-scores[candidates], k - 1)[:k]]
+        # Sort by score, breaking ties on question id so results are stable
+        candidates = candidates[numpy.lexsort((self.question_ids[candidates], -scores[candidates]))]
+        return self.question_ids[candidates].tolist()
+
+
+_index = BankDerivedCache(SimilarityIndex.build)
+
+
+def get_similarity_index():
+    """Returns the similarity index for the current version of the question bank, rebuilding it if needed"""
+    return _index.get()
+
+
+def get_similar_question_ids(question_id, k=SIMILAR_QUESTIONS_DEFAULT, include_restricted=True):
+    """
+    Ids of the questions most similar to the given one. The top SIMILAR_QUESTIONS_MAX are cached for each question,
+    and the cache entry is keyed on the bank version so editing any question invalidates it.
+    """
+    key = 'questions:similar:%s:%s:%s' % (get_bank_version(), question_id, int(include_restricted))
+    similar_ids = cache.get(key)
+    if similar_ids is None:
+        similar_ids = get_similarity_index().most_similar(question_id, SIMILAR_QUESTIONS_MAX, include_restricted)
+        cache.set(key, similar_ids, SIMILAR_QUESTIONS_CACHE_TIMEOUT)
+    return similar_ids[:k]
@@ -4,6 +4,7 @@ from django.contrib.auth.models import User, Group
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 from questions.models import *
+from questions.search import flush_index_queue
 from subscriptions.subscription_manager import SubscriptionManager
 
 class BaseQuestionAPITestCase(TestCase):
@@ -79,6 +80,7 @@ class BaseQuestionAPITestCase(TestCase):
                                      answer="Yeah, I've ran out...",
                                      subtopic=s3,
                                      restricted=True)
+        flush_index_queue()
 
         when(SubscriptionManager).can_user_access_subscription_content(self.premium_user).thenReturn(True)
         when(SubscriptionManager).can_user_access_subscription_content(self.free_user).thenReturn(False)
@@ -0,0 +1,190 @@
+import json
+from rest_framework import status
+from base_test_case import BaseQuestionAPITestCase
+from watson.models import SearchEntry
+from questions.models import Question, Subtopic, PendingIndexUpdate
+from questions.search import stem_word, clean_search_text, normalize_search_terms, flush_index_queue, suspended_indexing
+
+
+class SearchIndexingTestCase(BaseQuestionAPITestCase):
+    def setUp(self):
+        super(SearchIndexingTestCase, self).setUp()
+        self.markup_question = Question.objects.create(id=5,
+                                                       question='<p><strong>Which teeth</strong> erupt&nbsp;first?</p>',
+                                                       answer='<ul><li>Lower central incisors</li></ul>',
+                                                       subtopic=Subtopic.objects.get(name='Subtopic 1'),
+                                                       restricted=False)
+        flush_index_queue()
+
+    def test_clean_search_text(self):
+        """Markup and entities should be removed and words lowercased and stemmed"""
+        self.assertEqual(clean_search_text('<p><strong>Bleeding</strong>&nbsp;GUMS</p>'), 'bleed gum')
+        self.assertEqual(clean_search_text('Cavities stopped running'), 'cavity stop run')
+        self.assertEqual(clean_search_text(None), '')
+        self.assertEqual(normalize_search_terms('BlaBlaBla1233:::'), 'blablabla1233')
+
+    def test_word_forms_share_stem(self):
+        """Related forms of a word are stemmed alike, so a search for one finds the others"""
+        for forms in (('bleed', 'bleeds', 'bleeding'), ('speed', 'speeding'), ('process', 'processes'),
+                      ('box', 'boxes'), ('brush', 'brushes'), ('catch', 'catches'), ('buzz', 'buzzes'),
+                      ('headache', 'headaches'), ('size', 'sizes'), ('stop', 'stopped')):
+            self.assertEqual(set([forms[0]]), set(stem_word(form) for form in forms))
+
+    def test_cleaned_text_cached_on_save(self):
+        """Cleaned text is stored on the question when it is saved"""
+        question = Question.objects.get(pk=5)
+        self.assertEqual(question.indexed_question, 'which teeth erupt first')
+        self.assertEqual(question.indexed_answer, 'lower central incisor')
+
+        question.answer = '<em>Upper</em> incisors'
+        question.save()
+        self.assertEqual(Question.objects.get(pk=5).indexed_answer, 'upper incisor')
+
+    def test_search_ignores_markup(self):
+        """Tag names should not be searchable, but the text inside tags should"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.free_token.key)
+        response = self.client.get('/questions_search/strong/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get('/questions_search/Incisors/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)['results']
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['id'], 5)
+
+    def test_search_nothing_searchable(self):
+        """Search terms made only of punctuation should find nothing"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.free_token.key)
+        response = self.client.get('/questions_search/:::/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DeferredIndexingTestCase(BaseQuestionAPITestCase):
+    def test_save_queues_index_update(self):
+        """Saving a question should queue it rather than touch the index"""
+        question = Question.objects.get(pk=1)
+        question.question = 'What is my surname?'
+        question.save()
+        self.assertTrue(PendingIndexUpdate.objects.filter(question_id=1).exists())
+        self.assertFalse(SearchEntry.objects.filter(object_id_int=1, title__contains='surname').exists())
+
+        self.assertEqual(flush_index_queue(), 1)
+        self.assertFalse(PendingIndexUpdate.objects.exists())
+        self.assertTrue(SearchEntry.objects.filter(object_id_int=1, title__contains='surname').exists())
+
+    def test_flush_in_batches(self):
+        """All queued questions are indexed regardless of batch size"""
+        for question in Question.objects.all():
+            question.save()
+        self.assertEqual(PendingIndexUpdate.objects.count(), 4)
+        self.assertEqual(flush_index_queue(batch_size=3), 4)
+        self.assertFalse(PendingIndexUpdate.objects.exists())
+
+    def test_suspended_indexing(self):
+        """Nothing is queued while indexing is suspended, questions are indexed once on exit"""
+        subtopic = Subtopic.objects.get(name='Subtopic 1')
+        with suspended_indexing():
+            for question_id in range(10, 15):
+                Question.objects.create(id=question_id, question='Imported question', answer='Imported',
+                                        subtopic=subtopic)
+            self.assertFalse(SearchEntry.objects.filter(object_id_int__gte=10).exists())
+        self.assertFalse(PendingIndexUpdate.objects.exists())
+        self.assertEqual(SearchEntry.objects.filter(object_id_int__gte=10).count(), 5)
+
+
+class FacetedSearchTestCase(BaseQuestionAPITestCase):
+    def setUp(self):
+        super(FacetedSearchTestCase, self).setUp()
+        Question.objects.create(id=5, question='What about the molars?', answer='Molars',
+                                subtopic=Subtopic.objects.get(name='Subtopic 2'), restricted=True)
+        Question.objects.create(id=6, question='What about the incisors?', answer='Incisors',
+                                subtopic=Subtopic.objects.get(name='Subtopic 3'), restricted=False)
+        flush_index_queue()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.premium_token.key)
+
+    def test_search_facets(self):
+        """Facet counts should cover every hit, grouped by topic and subtopic"""
+        response = self.client.get('/questions_search/What about/', {'facets': 'true'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['facets']['topics'], [{'topic': 'Topic 1', 'count': 1},
+                                                    {'topic': 'Topic 2', 'count': 2}])
+        self.assertEqual(data['facets']['subtopics'], [
+            {'topic': 'Topic 1', 'subtopic': 'Subtopic 2', 'count': 1},
+            {'topic': 'Topic 2', 'subtopic': 'Subtopic 3', 'count': 2},
+        ])
+
+    def test_search_no_facets_by_default(self):
+        """Facets are only included when asked for"""
+        response = self.client.get('/questions_search/What about/', format='json')
+        self.assertFalse('facets' in json.loads(response.content))
+
+    def test_search_topic_filter(self):
+        """Filtering on a topic or subtopic narrows the hits but not the facets"""
+        response = self.client.get('/questions_search/What about/', {'topic': 'Topic 1', 'facets': 'true'},
+                                   format='json')
+        data = json.loads(response.content)
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['id'], 5)
+        self.assertEqual(len(data['facets']['topics']), 2)
+
+        response = self.client.get('/questions_search/What about/', {'topic': 'Topic 2', 'subtopic': 'Subtopic 3'},
+                                   format='json')
+        data = json.loads(response.content)
+        self.assertEqual(sorted(question['id'] for question in data['results']), [4, 6])
+
+        response = self.client.get('/questions_search/What about/', {'topic': 'Topic 3'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_facets_respect_restrictions(self):
+        """Free users should only have unrestricted questions counted"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.free_token.key)
+        response = self.client.get('/questions_search/What about/', {'facets': 'true'}, format='json')
+        data = json.loads(response.content)
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['facets']['topics'], [{'topic': 'Topic 2', 'count': 1}])
+
+
+class ScopedSearchTestCase(BaseQuestionAPITestCase):
+    def setUp(self):
+        super(ScopedSearchTestCase, self).setUp()
+        Question.objects.create(id=5, question='What is enamel made of?', answer='Hydroxyapatite',
+                                subtopic=Subtopic.objects.get(name='Subtopic 2'), restricted=False)
+        Question.objects.create(id=6, question='Where is enamel thickest?', answer='Cusps',
+                                subtopic=Subtopic.objects.get(name='Subtopic 3'), restricted=False)
+        flush_index_queue()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.premium_token.key)
+
+    def test_search_within_topic(self):
+        """Only hits inside the topic are returned"""
+        response = self.client.get('/questions/by_topic/Topic 1/search/enamel/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)['results']
+        self.assertEqual([question['id'] for question in data], [5])
+
+        response = self.client.get('/questions/by_topic/Topic 3/search/enamel/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_within_subtopic(self):
+        """Only hits inside the subtopic are returned"""
+        response = self.client.get('/questions/by_subtopic/Topic 2/Subtopic 3/search/enamel/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)['results']
+        self.assertEqual([question['id'] for question in data], [6])
+
+        response = self.client.get('/questions/by_subtopic/Topic 2/Subtopic 3/search/hydroxyapatite/',
+                                   format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_within_unknown_subtopic(self):
+        """Searching a subtopic that doesn't exist returns 404"""
+        response = self.client.get('/questions/by_subtopic/Topic 2/NonExistantSubtopic/search/enamel/',
+                                   format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_scoped_search_respects_restrictions(self):
+        """Free users still only see unrestricted questions within a scope"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.free_token.key)
+        response = self.client.get('/questions/by_topic/Topic 2/search/What about/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,75 @@
+import json
+from rest_framework import status
+from base_test_case import BaseQuestionAPITestCase
+from questions.models import Question, Subtopic
+from questions.similarity import SimilarityIndex
+
+
+class SimilarQuestionsTestCase(BaseQuestionAPITestCase):
+    def setUp(self):
+        super(SimilarQuestionsTestCase, self).setUp()
+        s1 = Subtopic.objects.get(name='Subtopic 1')
+        Question.objects.create(id=5, question='Which nerve supplies the lower molars?',
+                                answer='Inferior alveolar nerve', subtopic=s1, restricted=False)
+        Question.objects.create(id=6, question='Which nerve supplies the upper molars?',
+                                answer='Posterior superior alveolar nerve', subtopic=s1, restricted=False)
+        Question.objects.create(id=7, question='Which nerve supplies the lower incisors?',
+                                answer='Incisive nerve', subtopic=s1, restricted=True)
+        Question.objects.create(id=8, question='Name a local anaesthetic',
+                                answer='Lidocaine', subtopic=s1, restricted=False)
+
+    def test_similarity_index(self):
+        """Scores are cosine similarities, so a question is most similar to itself"""
+        index = SimilarityIndex([1, 2, 3], [u'lower molar nerve', u'upper molar nerve', u'lidocaine'],
+                                [False, False, False])
+        scores = index.scores(1)
+        self.assertAlmostEqual(scores[0], 1.0)
+        self.assertTrue(scores[1] > 0)
+        self.assertEqual(scores[2], 0)
+        self.assertEqual(index.most_similar(1, 5), [2])
+
+    def test_similar_questions(self):
+        """The most similar questions come first, the question itself and unrelated questions are left out"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.premium_token.key)
+        response = self.client.get('/questions/question_number/5/similar/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        ids = [question['id'] for question in data]
+        self.assertEqual(ids[:2], [6, 7])
+        self.assertFalse(5 in ids)
+        self.assertFalse(8 in ids)
+
+        response = self.client.get('/questions/question_number/5/similar/', {'k': 1}, format='json')
+        self.assertEqual([question['id'] for question in json.loads(response.content)], [6])
+
+    def test_similar_questions_unprivileged(self):
+        """Free users are never recommended restricted questions and can't look up restricted ones"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.free_token.key)
+        response = self.client.get('/questions/question_number/5/similar/', format='json')
+        ids = [question['id'] for question in json.loads(response.content)]
+        self.assertTrue(6 in ids)
+        self.assertFalse(7 in ids)
+
+        response = self.client.get('/questions/question_number/7/similar/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_similar_questions_invalidated_on_change(self):
+        """Editing a question drops cached recommendations"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.premium_token.key)
+        response = self.client.get('/questions/question_number/5/similar/', format='json')
+        self.assertTrue(6 in [question['id'] for question in json.loads(response.content)])
+
+        question = Question.objects.get(pk=6)
+        question.question = 'What colour is healthy gingiva?'
+        question.answer = 'Coral pink'
+        question.save()
+        response = self.client.get('/questions/question_number/5/similar/', format='json')
+        self.assertFalse(6 in [question['id'] for question in json.loads(response.content)])
+
+    def test_similar_questions_bad_requests(self):
+        """Unknown questions give 404 and out of range k gives 400"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.premium_token.key)
+        response = self.client.get('/questions/question_number/999/similar/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/questions/question_number/5/similar/', {'k': 500}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -8,6 +8,8 @@ urlpatterns = patterns('',
     # Fetch question by ID
     url(r'^questions/question_number/(?P<question_number>[0-9]{1,100})/$',
         views.QuestionRetrieveView.as_view()),
+    url(r'^questions/question_number/(?P<question_number>[0-9]{1,100})/similar/$',
+        views.SimilarQuestionsView.as_view()),
 
     # Fetch questions by topic/subtopic
     url(r'questions/by_topic/(?P<topic>[\w ]{1,80})/$',views.QuestionsListByTopic.as_view()),
@@ -20,6 +22,12 @@ urlpatterns = patterns('',
     # Text search for questions
     url(r'^questions_search/(?P<search_terms>.*)/$',views.QuestionsBySearch.as_view()),
 
+    # Text search within a topic or subtopic
+    url(r'^questions/by_topic/(?P<topic>[\w ]{1,80})/search/(?P<search_terms>.*)/$',
+        views.QuestionsBySearchInTopic.as_view()),
+    url(r'^questions/by_subtopic/(?P<topic>[\w ]{1,80})/(?P<subtopic>[\w ]{1,255})/search/(?P<search_terms>.*)/$',
+        views.QuestionsBySearchInSubtopic.as_view()),
+
     #======================================TOPIC VIEWS=================================================================#
     url(r'^topics/$',views.TopicView.as_view()),
     url(r'^topic/(?P<topic_name>[\w ]{1,80})/$',views.TopicRetrieveView.as_view()),
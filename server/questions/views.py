@@ -1,25 +1,21 @@
 import json
 from itertools import chain
-from rest_framework.exceptions import ValidationError, PermissionDenied
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions
 
 from serializers import *
 
-from subscriptions.subscription_manager import SubscriptionManager
+from subscriptions.entitlements import HasSubscriptionAccess
 
 class QuizView(APIView):
     '''
     Provide a list of topics and subtopics
     '''
-    permission_classes = (permissions.IsAuthenticated,)
+    permission_classes = (permissions.IsAuthenticated, HasSubscriptionAccess) # Restrict access to paid users
 
     def post(self,request,format=None):
-        # Restrict access to paid users
-        if not SubscriptionManager.can_user_access_subscription_content(request.user):
-            raise PermissionDenied
-
         # Get raw questions
         topic_list = request.data['topic_list']
         max_questions = int(request.data['max_questions'])
@@ -0,0 +1,45 @@
+"""
+Short lived, signed access tokens. An access token carries the user's id, username, staff flag and subscription tier
+along with its expiry, signed with the SECRET_KEY, so it can be validated without touching the database. Clients get
+a new one (and a new refresh token) from the token_refresh endpoint using the refresh token stored in RefreshToken.
+
+Because nothing is looked up, a change of tier or deactivation is only seen once the access token expires, which bounds
+how stale the embedded details can be to ACCESS_TOKEN_LIFETIME.
+"""
+import time
+
+from django.core import signing
+
+from dentest.settings_utility import get_setting_with_default
+
+ACCESS_TOKEN_LIFETIME = get_setting_with_default('ACCESS_TOKEN_LIFETIME', 60 * 15)
+ACCESS_TOKEN_SALT = 'restful_auth.access_token'
+
+
+class AccessTokenError(Exception):
+    """Raised for access tokens which are malformed, tampered with or expired"""
+    pass
+
+
+def issue_access_token(user, tier):
+    """Returns a signed access token for the user, valid for ACCESS_TOKEN_LIFETIME seconds, and its expiry timestamp"""
+    expires = int(time.time()) + ACCESS_TOKEN_LIFETIME
+    payload = {
+        'uid': user.pk,
+        'usr': user.username,
+        'stf': user.is_staff,
+        'tier': tier,
+        'exp': expires,
+    }
+    return signing.dumps(payload, salt=ACCESS_TOKEN_SALT), expires
+
+
+def read_access_token(token):
+    """Returns the payload of a valid access token, raising AccessTokenError otherwise"""
+    try:
+        payload = signing.loads(token, salt=ACCESS_TOKEN_SALT)
+    except signing.BadSignature:
+        raise AccessTokenError('Invalid access token.')
+    if payload.get('exp', 0) <= time.time():
+        raise AccessTokenError('Access token has expired.')
+    return payload
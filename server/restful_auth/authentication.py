@@ -0,0 +1,143 @@
+"""
+Token authentication which avoids the Token + User join on every request. A token key resolves to the user's id,
+username and is_staff/is_active flags, held in a small per process LRU in front of the shared Django cache. The user
+handed to views is a deferred User instance built from those fields, so any other field is loaded from the database
+only if a view actually reads it (and saving it only writes the fields which were loaded or set).
+
+Entries are evicted from the shared cache when a token is deleted (e.g. by PasswordReset.confirm) and whenever a user is
+saved, see signal_receivers. Other processes may keep serving a stale entry from their local LRU for up to
+TOKEN_LOCAL_CACHE_TIMEOUT seconds, so keep that short.
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.query_utils import deferred_class_factory
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication, get_authorization_header
+
+from access_tokens import AccessTokenError, read_access_token
+from dentest.settings_utility import get_setting_with_default
+from subscriptions.entitlements import ENTITLEMENT_ATTR
+
+TOKEN_CACHE_KEY = 'restful_auth:token:%s'
+TOKEN_CACHE_TIMEOUT = get_setting_with_default('TOKEN_CACHE_TIMEOUT', 60 * 5)
+TOKEN_LOCAL_CACHE_SIZE = get_setting_with_default('TOKEN_LOCAL_CACHE_SIZE', 10000)
+TOKEN_LOCAL_CACHE_TIMEOUT = get_setting_with_default('TOKEN_LOCAL_CACHE_TIMEOUT', 30)
+
+# Fields of the user which are cached with the token, everything else is deferred
+CACHED_USER_FIELDS = ('id', 'username', 'is_staff', 'is_active')
+
+
+class LocalLRUCache(object):
+    """Bounded, thread safe least recently used cache whose entries also expire after a timeout"""
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                return None
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + self.timeout)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local_cache = LocalLRUCache(TOKEN_LOCAL_CACHE_SIZE, TOKEN_LOCAL_CACHE_TIMEOUT)
+
+
+def evict_token(key):
+    """Drop a token from both the local and the shared cache"""
+    _local_cache.delete(key)
+    cache.delete(TOKEN_CACHE_KEY % key)
+
+
+def evict_user_tokens(user_id):
+    """Drop any cached token belonging to the given user"""
+    from rest_framework.authtoken.models import Token
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        evict_token(key)
+
+
+def build_user(user_fields):
+    """A User with only the cached fields loaded, the rest are fetched on first access"""
+    deferred_fields = [field.attname for field in User._meta.concrete_fields if field.attname not in CACHED_USER_FIELDS]
+    user_class = deferred_class_factory(User, deferred_fields)
+    return user_class(**dict(zip(CACHED_USER_FIELDS, user_fields)))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication which resolves the token from cache, so most requests authenticate with no query"""
+
+    def authenticate_credentials(self, key):
+        user_fields = _local_cache.get(key)
+        if user_fields is None:
+            user_fields = cache.get(TOKEN_CACHE_KEY % key)
+            if user_fields is None:
+                user_fields = self.fetch_user_fields(key)
+                cache.set(TOKEN_CACHE_KEY % key, user_fields, TOKEN_CACHE_TIMEOUT)
+            _local_cache.set(key, user_fields)
+
+        user = build_user(user_fields)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (user, self.model(key=key, user=user))
+
+    def fetch_user_fields(self, key):
+        try:
+            return self.model.objects.filter(key=key).values_list(*['user__' + field for field in CACHED_USER_FIELDS])[0]
+        except IndexError:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+
+class AccessTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates signed access tokens sent as "Authorization: Bearer <token>". Nothing is looked up: the user is built
+    from the token and the subscription tier it carries is preset on them, so entitlement checks need no query either.
+    """
+    keyword = 'bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid bearer header.'))
+        try:
+            payload = read_access_token(auth[1])
+        except AccessTokenError as e:
+            raise exceptions.AuthenticationFailed(e.args[0])
+
+        user = build_user((payload['uid'], payload['usr'], payload['stf'], True))
+        setattr(user, ENTITLEMENT_ATTR, payload['tier'])
+        return (user, payload)
+
+    def authenticate_header(self, request):
+        return 'Bearer'
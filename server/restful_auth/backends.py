@@ -2,47 +2,45 @@ from django.contrib.auth.models import User
 from django.contrib.auth.backends import ModelBackend
 from django.db.models import Q
 
+import hashing
+from models import EmailAddress
+
 
 class UsernameOrEmailBackend(ModelBackend):
 
     def authenticate(self, **credentials):
-        """Try first to authenticate the user by email, then username"""
-        ret = self._authenticate_by_email(**credentials)
-        if not ret:
-            ret = self._authenticate_by_username(**credentials)
-        return ret
-
-
-    def _authenticate_by_username(self, **credentials):
-        """Authenticate the user by username"""
-        username_field = 'username'
-        username = credentials.get('username')
-        password = credentials.get('password')
-
-        if not username_field or username is None or password is None:
-            return None
-        try:
-            # Username query is case insensitive
-            query = {username_field+'__iexact': username}
-            user = User.objects.get(**query)
-            if user.check_password(password):
-                return user
-        except User.DoesNotExist:
-            return None
-
-    def _authenticate_by_email(self, **credentials):
-        """Authenticate the user by email"""
+        """
+        Authenticate the user by email or username. Candidates for both are fetched in one query and the password is
+        checked at most once, against the email match if there is one (as emails are unique) and the username otherwise.
+        """
         # Even though allauth will pass along `email`, other apps may
         # not respect this setting. For example, when using
         # django-tastypie basic authentication, the login is always
         # passed as `username`.  So let's place nice with other apps
         # and use username as fallback
+        login = credentials.get('email', credentials.get('username'))
+        password = credentials.get('password')
+        if not login or password is None:
+            return None
 
-        email = credentials.get('email', credentials.get('username'))
-        if email:
-            users = User.objects.filter(Q(email__iexact=email)
-                                        | Q(email_address__email__iexact=email))
-            for user in users:
-                if user.check_password(credentials["password"]):
-                    return user
-        return None
\ No newline at end of file
+        user = self._find_user(login)
+        if user is None:
+            # Run the hasher anyway so a missing user takes as long as a wrong password
+            hashing.make_password(password)
+            return None
+        if hashing.check_user_password(user, password):
+            return user
+        return None
+
+    def _find_user(self, login):
+        """The user whose email (on the User or an EmailAddress) or username matches, case insensitively"""
+        # The EmailAddress lookup is a subquery rather than a join so users aren't duplicated
+        users = list(User.objects.filter(Q(username__iexact=login)
+                                         | Q(email__iexact=login)
+                                         | Q(pk__in=EmailAddress.objects.filter(email__iexact=login).values('user_id'))))
+        if not users:
+            return None
+        # Anyone who isn't a username match got here through their email, and those take precedence
+        login = login.lower()
+        users.sort(key=lambda user: user.username.lower() == login and user.email.lower() != login)
+        return users[0]
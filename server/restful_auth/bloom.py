@@ -0,0 +1,115 @@
+"""
+Memory mapped Bloom filter of breached passwords. The filter file is a small header followed by the bit array, and is
+opened with mmap so every worker process on a host shares the same pages through the OS page cache. A lookup hashes
+the password once and reads num_hashes bits, so it costs the same however many passwords the filter was built from.
+
+Passwords are keyed on their SHA-1 digest, so the filter can be built either from plain text password lists or from
+lists of SHA-1 hashes such as the Pwned Passwords downloads. Use the build_breached_password_filter command.
+"""
+import hashlib
+import math
+import mmap
+import struct
+
+import numpy
+
+MAGIC = b'DTBF'
+VERSION = 1
+HEADER = struct.Struct('<4sIQI')  # magic, version, number of bits, number of hashes
+HEADER_SIZE = 32
+BUILD_CHUNK_SIZE = 1000000
+
+
+class BloomFilterError(Exception):
+    """Raised for filter files which are missing or not valid"""
+    pass
+
+
+def password_digest(password):
+    """The key a password is stored under: its SHA-1 digest, as in the Pwned Passwords lists"""
+    if not isinstance(password, bytes):
+        password = password.encode('utf-8')
+    return hashlib.sha1(password).digest()
+
+
+def _hash_pair(digest):
+    """Two 64 bit hashes taken from a digest, combined by double hashing to give every bit position"""
+    return struct.unpack('<QQ', digest[:16])
+
+
+def optimal_parameters(expected_items, false_positive_rate):
+    """Number of bits and hashes giving the requested false positive rate for the expected number of items"""
+    expected_items = max(1, expected_items)
+    num_bits = int(math.ceil(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)))
+    num_bits = max(8, (num_bits + 7) // 8 * 8)
+    num_hashes = max(1, int(round(float(num_bits) / expected_items * math.log(2))))
+    return num_bits, num_hashes
+
+
+class BloomFilter(object):
+    """Read only view of a Bloom filter file"""
+
+    def __init__(self, path):
+        try:
+            with open(path, 'rb') as filter_file:
+                self._map = mmap.mmap(filter_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError) as e:
+            raise BloomFilterError("Could not open Bloom filter %s: %s" % (path, e))
+        magic, version, self.num_bits, self.num_hashes = HEADER.unpack(self._map[:HEADER.size])
+        if magic != MAGIC or version != VERSION:
+            raise BloomFilterError("%s is not a Bloom filter file" % path)
+        if len(self._map) < HEADER_SIZE + self.num_bits // 8:
+            raise BloomFilterError("Bloom filter %s is truncated" % path)
+
+    def contains_digest(self, digest):
+        first, second = _hash_pair(digest)
+        for i in range(self.num_hashes):
+            position = (first + i * second) % self.num_bits
+            if not ord(self._map[HEADER_SIZE + (position >> 3)]) & (1 << (position & 7)):
+                return False
+        return True
+
+    def __contains__(self, password):
+        return self.contains_digest(password_digest(password))
+
+    def close(self):
+        self._map.close()
+
+
+def build_bloom_filter(path, digests, expected_items, false_positive_rate=0.001):
+    """
+    Write a Bloom filter holding the given SHA-1 digests to path. The bit array is written through a numpy memmap and
+    digests are added in chunks, so memory use stays bounded however large the filter is. Returns the number of
+    digests added.
+    """
+    num_bits, num_hashes = optimal_parameters(expected_items, false_positive_rate)
+    with open(path, 'wb') as filter_file:
+        filter_file.write(HEADER.pack(MAGIC, VERSION, num_bits, num_hashes).ljust(HEADER_SIZE, b'\0'))
+        filter_file.truncate(HEADER_SIZE + num_bits // 8)
+    bits = numpy.memmap(path, dtype=numpy.uint8, mode='r+', offset=HEADER_SIZE, shape=(num_bits // 8,))
+
+    added = 0
+    chunk = []
+    for digest in digests:
+        chunk.append(digest[:16])
+        if len(chunk) >= BUILD_CHUNK_SIZE:
+            added += _add_chunk(bits, chunk, num_bits, num_hashes)
+            chunk = []
+    if chunk:
+        added += _add_chunk(bits, chunk, num_bits, num_hashes)
+    bits.flush()
+    del bits
+    return added
+
+
+def _add_chunk(bits, chunk, num_bits, num_hashes):
+    hashes = numpy.frombuffer(b''.join(chunk), dtype='<u8').reshape(-1, 2)
+    first, second = hashes[:, 0], hashes[:, 1]
+    modulus = numpy.uint64(num_bits)
+    # Reduce first so the sums can't overflow 64 bits; (a + i*b) mod m is unchanged
+    first, second = first % modulus, second % modulus
+    for i in range(num_hashes):
+        positions = (first + numpy.uint64(i) * second % modulus) % modulus
+        numpy.bitwise_or.at(bits, (positions >> numpy.uint64(3)).astype(numpy.intp),
+                            (numpy.uint8(1) << (positions & numpy.uint64(7)).astype(numpy.uint8)))
+    return len(chunk)
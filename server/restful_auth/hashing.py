@@ -0,0 +1,154 @@
+"""
+Password hashing for the login and registration paths. PBKDF2 is deliberately slow, and done inline it pins the request
+worker for the whole hash. With PASSWORD_HASHING_POOL_SIZE set, hashes are computed in a bounded pool of worker
+processes instead, so a burst of logins queues up behind the pool rather than occupying every web worker. The default
+of 0 hashes inline, exactly as before.
+
+A hash which isn't computed within PASSWORD_HASHING_TIMEOUT, because the pool is swamped, raises HashingTimeout, and
+the login and registration views answer 503 rather than making the caller wait any longer.
+
+Timings of every hash are recorded (per process) and exposed to staff by HashingMetricsView.
+"""
+import time
+import logging
+from multiprocessing import Pool, TimeoutError
+from threading import Lock
+
+from django.contrib.auth import hashers
+
+from dentest.settings_utility import get_setting_with_default
+
+LOGGER = logging.getLogger(__name__)
+
+PASSWORD_HASHING_POOL_SIZE = get_setting_with_default('PASSWORD_HASHING_POOL_SIZE', 0)
+PASSWORD_HASHING_TIMEOUT = get_setting_with_default('PASSWORD_HASHING_TIMEOUT', 10)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class HashingTimeout(Exception):
+    """The hashing pool didn't compute a hash within PASSWORD_HASHING_TIMEOUT"""
+    pass
+
+
+class HashingMetrics(object):
+    """Thread safe counters and a latency histogram for password hashing"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total_time = 0.0
+            self.max_time = 0.0
+            self.upgrades = 0
+            self.timeouts = 0
+            self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, elapsed):
+        with self._lock:
+            self.count += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed <= bound:
+                    break
+            else:
+                i = len(LATENCY_BUCKETS)
+            self.buckets[i] += 1
+
+    def record_upgrade(self):
+        with self._lock:
+            self.upgrades += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def as_dict(self):
+        with self._lock:
+            labels = ['<=%s' % bound for bound in LATENCY_BUCKETS] + ['>%s' % LATENCY_BUCKETS[-1]]
+            return {
+                'pool_size': PASSWORD_HASHING_POOL_SIZE,
+                'count': self.count,
+                'upgrades': self.upgrades,
+                'timeouts': self.timeouts,
+                'mean_seconds': self.total_time / self.count if self.count else 0.0,
+                'max_seconds': self.max_time,
+                'latency_histogram': dict(zip(labels, self.buckets)),
+            }
+
+
+metrics = HashingMetrics()
+
+_pool = None
+_pool_lock = Lock()
+
+
+def _get_pool():
+    """The hashing pool, started on first use so it is created after any web server fork"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            LOGGER.info("Starting password hashing pool with %s processes", PASSWORD_HASHING_POOL_SIZE)
+            _pool = Pool(PASSWORD_HASHING_POOL_SIZE)
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the hashing pool, if it was started. It is started again on next use"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool.join()
+            _pool = None
+
+
+def _run(function, *args):
+    """
+    Run a hashing function inline or in the pool, recording how long it took. Raises HashingTimeout if the pool doesn't
+    finish it within PASSWORD_HASHING_TIMEOUT
+    """
+    start = time.time()
+    if PASSWORD_HASHING_POOL_SIZE > 0:
+        try:
+            result = _get_pool().apply_async(function, args).get(PASSWORD_HASHING_TIMEOUT)
+        except TimeoutError:
+            metrics.record_timeout()
+            LOGGER.warning("Password hash not computed within %ss, the hashing pool is saturated",
+                           PASSWORD_HASHING_TIMEOUT)
+            raise HashingTimeout("Password hash not computed within %ss" % PASSWORD_HASHING_TIMEOUT)
+    else:
+        result = function(*args)
+    metrics.record(time.time() - start)
+    return result
+
+
+def _verify(password, encoded):
+    return hashers.check_password(password, encoded)
+
+
+def make_password(password):
+    """Hash a password with the preferred hasher"""
+    return _run(hashers.make_password, password)
+
+
+def check_user_password(user, password):
+    """
+    Check the user's password. Passwords stored with an outdated hasher or work factor are rehashed and saved on a
+    successful check, as User.check_password would.
+    """
+    encoded = user.password
+    if not _run(_verify, password, encoded):
+        return False
+    hasher = hashers.identify_hasher(encoded)
+    preferred = hashers.get_hasher()
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        user.password = make_password(password)
+        user.save(update_fields=['password'])
+        metrics.record_upgrade()
+    return True
@@ -0,0 +1,89 @@
+import random
+import string
+import time
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from rest_framework.serializers import ValidationError
+from restful_auth.validators import DictionaryValidator, PASSWORD_DICTIONARY
+
+
+
+class Command(BaseCommand):
+    help = 'Time the dictionary password validator against the reference dynamic programming implementation'
+
+    option_list = BaseCommand.option_list + (
+        make_option("-d",
+                    "--dictionary",
+                    action="store",
+                    dest="dictionary",
+                    default=PASSWORD_DICTIONARY,
+                    help='Word list to validate against (default PASSWORD_DICTIONARY, or random words if unset)'
+        ),
+        make_option("-w",
+                    "--words",
+                    action="store",
+                    type="int",
+                    dest="words",
+                    default=20000,
+                    help='Number of random words to generate when there is no dictionary (default 20000)'
+        ),
+        make_option("-p",
+                    "--passwords",
+                    action="store",
+                    type="int",
+                    dest="passwords",
+                    default=20,
+                    help='Number of random passwords to validate (default 20)'
+        ),
+        make_option("--skip-reference",
+                    action="store_true",
+                    dest="skip_reference",
+                    default=False,
+                    help="Don't time the reference implementation, which is slow on large dictionaries"
+        ),
+    )
+
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        if options['dictionary']:
+            validator = DictionaryValidator(dictionary=options['dictionary'])
+        else:
+            words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+                     for _ in range(options['words'])]
+            validator = DictionaryValidator(words=words)
+        passwords = [''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(rng.randint(8, 14)))
+                     for _ in range(options['passwords'])]
+        self.stdout.write("Validating %s passwords against %s words" % (len(passwords), len(validator.haystacks)))
+
+        start = time.time()
+        validator.get_index()
+        self.stdout.write("Index built in %.3fs" % (time.time() - start))
+
+        indexed_time, indexed_results = self.time_validation(validator.__call__, passwords)
+        self.stdout.write("Indexed: %.4fs per password" % (indexed_time / len(passwords)))
+        if options['skip_reference']:
+            return
+
+        def reference(value):
+            for haystack in validator.haystacks:
+                distance = validator.fuzzy_substring_dp(value, haystack)
+                longest = max(len(value), len(haystack))
+                if float(longest - distance) / longest >= validator.threshold:
+                    raise ValidationError(validator.message)
+        reference_time, reference_results = self.time_validation(reference, passwords)
+        self.stdout.write("Reference: %.4fs per password (%.1fx slower)"
+                          % (reference_time / len(passwords), reference_time / max(indexed_time, 1e-9)))
+        if reference_results != indexed_results:
+            self.stderr.write("Results differ from the reference implementation!")
+
+    def time_validation(self, validate, passwords):
+        results = []
+        start = time.time()
+        for password in passwords:
+            try:
+                validate(password)
+                results.append(True)
+            except ValidationError:
+                results.append(False)
+        return time.time() - start, results
@@ -0,0 +1,73 @@
+import binascii
+import time
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from restful_auth.bloom import build_bloom_filter, password_digest
+
+
+
+class Command(BaseCommand):
+    args = '<password list> [<password list> ...]'
+    help = 'Compile lists of breached passwords into a Bloom filter for the PASSWORD_BREACHED_FILTER setting'
+
+    option_list = BaseCommand.option_list + (
+        make_option("-o",
+                    "--output",
+                    action="store",
+                    dest="output",
+                    help='Path to write the filter to'
+        ),
+        make_option("-r",
+                    "--false-positive-rate",
+                    action="store",
+                    type="float",
+                    dest="false_positive_rate",
+                    default=0.001,
+                    help='Fraction of unbreached passwords which may be rejected (default 0.001)'
+        ),
+        make_option("-n",
+                    "--expected-items",
+                    action="store",
+                    type="int",
+                    dest="expected_items",
+                    default=None,
+                    help='Number of passwords in the lists. Counted with an extra pass over the lists if not given'
+        ),
+        make_option("--sha1",
+                    action="store_true",
+                    dest="sha1",
+                    default=False,
+                    help='Lists hold hex SHA-1 hashes of passwords (optionally followed by ":count"), '
+                         'as in the Pwned Passwords downloads, rather than the passwords themselves'
+        ),
+    )
+
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError("No password lists given")
+        if not options['output']:
+            raise CommandError("--output is required")
+        expected_items = options['expected_items']
+        if expected_items is None:
+            expected_items = sum(1 for _ in self.read_digests(args, options['sha1']))
+
+        start = time.time()
+        added = build_bloom_filter(options['output'], self.read_digests(args, options['sha1']), expected_items,
+                                   options['false_positive_rate'])
+        self.stdout.write("Added %s passwords to %s in %.1fs" % (added, options['output'], time.time() - start))
+
+    def read_digests(self, paths, sha1):
+        for path in paths:
+            with open(path, 'rb') as password_list:
+                for line in password_list:
+                    line = line.rstrip(b'\r\n')
+                    if not line:
+                        continue
+                    if sha1:
+                        try:
+                            yield binascii.unhexlify(line.split(b':', 1)[0].strip())
+                        except (TypeError, binascii.Error):
+                            raise CommandError("%s: %r is not a SHA-1 hash" % (path, line))
+                    else:
+                        yield password_digest(line)
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from restful_auth.models import EmailAddress, EmailConfirmation
+
+
+
+class Command(BaseCommand):
+    help = 'Send a new activation email to every user who has not confirmed their email address'
+
+    option_list = BaseCommand.option_list + (
+        make_option("-b",
+                    "--batch-size",
+                    action="store",
+                    type="int",
+                    dest="batch_size",
+                    default=500,
+                    help='Number of users to handle per transaction (default 500)'
+        ),
+    )
+
+
+    def handle(self, *args, **options):
+        start = time.time()
+        unverified = EmailAddress.objects.filter(verified=False, user__is_active=True).select_related('user') \
+            .order_by('pk')
+        queued = 0
+        last_pk = 0
+        while True:
+            email_addresses = list(unverified.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not email_addresses:
+                break
+            EmailConfirmation.resend_all(email_addresses)
+            queued += len(email_addresses)
+            last_pk = email_addresses[-1].pk
+        elapsed = time.time() - start
+        self.stdout.write("Queued %s activation emails in %.2fs (%.0f per second)"
+                          % (queued, elapsed, queued / elapsed if elapsed else 0))
@@ -0,0 +1,53 @@
+import time
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from restful_auth.outbox import send_queued_emails, EMAIL_OUTBOX_BATCH_SIZE, EMAIL_OUTBOX_WORKERS
+
+
+
+class Command(BaseCommand):
+    help = 'Deliver the emails waiting in the outbox'
+
+    option_list = BaseCommand.option_list + (
+        make_option("-b",
+                    "--batch-size",
+                    action="store",
+                    type="int",
+                    dest="batch_size",
+                    default=EMAIL_OUTBOX_BATCH_SIZE,
+                    help='Number of emails to claim per batch (default %s)' % EMAIL_OUTBOX_BATCH_SIZE
+        ),
+        make_option("-t",
+                    "--threads",
+                    action="store",
+                    type="int",
+                    dest="workers",
+                    default=EMAIL_OUTBOX_WORKERS,
+                    help='Number of sending threads, each with its own mail connection (default %s)'
+                         % EMAIL_OUTBOX_WORKERS
+        ),
+        make_option("-w",
+                    "--watch",
+                    action="store_true",
+                    dest="watch",
+                    default=False,
+                    help='Keep running as a worker, checking the outbox every --interval seconds'
+        ),
+        make_option("-i",
+                    "--interval",
+                    action="store",
+                    type="int",
+                    dest="interval",
+                    default=5,
+                    help='Seconds between checks when running with --watch (default 5)'
+        ),
+    )
+
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_queued_emails(batch_size=options['batch_size'], workers=options['workers'])
+            self.stdout.write("Sent %s emails" % sent)
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+# Logins look users up with case insensitive matches on auth_user.username, auth_user.email and
+# restful_auth_emailaddress.email. auth_user.email isn't indexed at all, and on PostgreSQL __iexact compiles to
+# UPPER(column) = UPPER(%s), which only an index on UPPER(column) can serve. MySQL compares with a case insensitive
+# collation, and SQLite uses LIKE, so plain indexes are enough there.
+PLAIN_INDEXES = [
+    ('restful_auth_user_email', 'auth_user', 'email'),
+]
+UPPER_INDEXES = [
+    ('restful_auth_user_username_upper', 'auth_user', 'username'),
+    ('restful_auth_user_email_upper', 'auth_user', 'email'),
+    ('restful_auth_emailaddress_email_upper', 'restful_auth_emailaddress', 'email'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for name, table, column in PLAIN_INDEXES:
+        schema_editor.execute('CREATE INDEX %s ON %s (%s)' % (quote(name), quote(table), quote(column)))
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, table, column in UPPER_INDEXES:
+            schema_editor.execute('CREATE INDEX %s ON %s (UPPER(%s::text))' % (quote(name), quote(table), quote(column)))
+
+
+def drop_indexes(apps, schema_editor):
+    quote = schema_editor.quote_name
+    indexes = list(PLAIN_INDEXES)
+    if schema_editor.connection.vendor == 'postgresql':
+        indexes += UPPER_INDEXES
+    for name, table, column in indexes:
+        if schema_editor.connection.vendor == 'mysql':
+            schema_editor.execute('DROP INDEX %s ON %s' % (quote(name), quote(table)))
+        else:
+            schema_editor.execute('DROP INDEX %s' % quote(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0001_initial'),
+        ('restful_auth', '0007_refreshtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restful_auth', '0008_login_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('to_email', models.EmailField(max_length=75)),
+                ('from_email', models.EmailField(max_length=75)),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('html_body', models.TextField(default=b'', blank=True)),
+                ('time_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('time_sent', models.DateTimeField(default=None, null=True, blank=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, db_index=True)),
+                ('last_error', models.TextField(default=b'', blank=True)),
+            ],
+            options={
+                'verbose_name_plural': 'OutgoingEmails',
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -13,6 +13,11 @@ from signal_receivers import * # Makes sure signal receivers are registered on s
 EMAIL_UNIQUE = get_setting_with_default('EMAIL_UNIQUE',True)
 EMAIL_EXPIRATION_DAYS = get_setting('EMAIL_CONFIRMATION_DAYS_VALID')
 PASSWORD_RESET_EXPIRATION_DAYS = get_setting('PASSWORD_RESET_DAYS_VALID')
+ACTIVATION_EMAIL_SUBJECT = 'activation_email_subject.txt'
+ACTIVATION_EMAIL_BODY = 'activation_email_body.txt'
+REFRESH_TOKEN_EXPIRATION_DAYS = get_setting_with_default('REFRESH_TOKEN_DAYS_VALID',30)
+# Most refresh tokens a user holds at once, one per signed in device or browser
+REFRESH_TOKENS_PER_USER = get_setting_with_default('REFRESH_TOKENS_PER_USER',10)
 
 # Overrides basic User with whatever custom model is in use.
 class Profile(models.Model):
@@ -88,7 +93,7 @@ class EmailConfirmation(models.Model):
             return True
         return False
 
-    def send(self):
+    def get_email_context(self):
         context =  {
             'user':self.email_address.user,
             'domain': get_setting('DOMAIN'),
@@ -98,12 +103,32 @@ class EmailConfirmation(models.Model):
             'protocol': get_setting('DEFAULT_PROTOCOL')
         }
         context['url'] = get_setting('ACTIVATION_URL').format(**context)
+        return context
+
+    def send(self):
         from_email = get_setting('FROM_EMAIL')
-        utils.send_email(self.email_address.email,from_email,context,'activation_email_subject.txt'
-                         ,'activation_email_body.txt')
+        utils.queue_email(self.email_address.email,from_email,self.get_email_context(),ACTIVATION_EMAIL_SUBJECT
+                         ,ACTIVATION_EMAIL_BODY)
         self.time_sent = timezone.now()
         self.save()
 
+    @classmethod
+    def resend_all(cls, email_addresses):
+        """
+        Replace the confirmations of the given EmailAddresses with new ones and queue all of their activation emails,
+        using a handful of queries however many addresses there are. Returns the new confirmations.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            cls.objects.filter(email_address__in=email_addresses).delete()
+            confirmations = [cls(email_address=email_address,key=get_random_string(64).lower(),time_sent=now)
+                             for email_address in email_addresses]
+            cls.objects.bulk_create(confirmations)
+            utils.queue_emails([email_address.email for email_address in email_addresses],get_setting('FROM_EMAIL'),
+                               [confirmation.get_email_context() for confirmation in confirmations],
+                               ACTIVATION_EMAIL_SUBJECT,ACTIVATION_EMAIL_BODY)
+        return confirmations
+
 
 class PasswordReset(models.Model):
     user = models.ForeignKey(User)
@@ -134,6 +159,7 @@ class PasswordReset(models.Model):
                 Token.objects.filter(user=self.user).all().delete()
                 token = Token.objects.create(user=self.user)
                 token.save()
+                RefreshToken.objects.filter(user=self.user).delete()
             return True
         return False
 
@@ -159,7 +185,76 @@ class PasswordReset(models.Model):
         }
         context['url'] = get_setting('PASSWORD_RESET_CONFIRM_URL').format(**context)
         from_email = get_setting('FROM_EMAIL')
-        utils.send_email(self.user.email,from_email,context,'password_reset_email_subject.txt'
+        utils.queue_email(self.user.email,from_email,context,'password_reset_email_subject.txt'
                          ,'password_reset_email_body.txt')
         self.time_sent = timezone.now()
-        self.save()
\ No newline at end of file
+        self.save()
+
+
+class RefreshToken(models.Model):
+    """
+    Long lived token which can be exchanged once for a new access token and refresh token. Refresh tokens are rotated
+    on every use and all of a user's refresh tokens are dropped when their password is reset. Tokens of abandoned
+    sessions are dropped when the user is next issued one, once expired or beyond REFRESH_TOKENS_PER_USER.
+    """
+    user = models.ForeignKey(User,related_name='refresh_tokens')
+    key = models.CharField(max_length=64,unique=True)
+    time_created = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def create(cls, user):
+        """Issue a new refresh token for the user, deleting their expired tokens and their oldest beyond the limit"""
+        cutoff = timezone.now() - datetime.timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS)
+        with transaction.atomic():
+            tokens = cls._default_manager.filter(user=user).order_by('-time_created','-pk') \
+                .values_list('pk','time_created')
+            # Keep room for the new one
+            stale = [pk for i, (pk, time_created) in enumerate(tokens)
+                     if time_created <= cutoff or i >= REFRESH_TOKENS_PER_USER - 1]
+            if stale:
+                cls._default_manager.filter(pk__in=stale).delete()
+            key = get_random_string(64)
+            return cls._default_manager.create(user=user,
+                                               key=key)
+
+    def key_expired(self):
+        """Returns True if this refresh token can no longer be used"""
+        expiration_date = self.time_created + datetime.timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS)
+        return expiration_date <= timezone.now()
+
+    def rotate(self):
+        """Use up this refresh token, returning its replacement. Returns None if it was already used or has expired"""
+        with transaction.atomic():
+            # Lock the row so only one of several concurrent requests with the same token gets a replacement
+            try:
+                RefreshToken.objects.select_for_update().get(pk=self.pk)
+            except RefreshToken.DoesNotExist:
+                return None
+            self.delete()
+            if self.key_expired():
+                return None
+            return RefreshToken.create(self.user)
+
+
+class OutgoingEmail(models.Model):
+    """
+    An email waiting in the outbox. Emails are rendered and queued in the same transaction as whatever caused them,
+    then delivered in batches by the send_queued_email command (see outbox.py).
+    """
+    to_email = models.EmailField()
+    from_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True,default='')
+    time_created = models.DateTimeField(default=timezone.now)
+    time_sent = models.DateTimeField(null=True,default=None,blank=True)
+    # Delivery is attempted again (with backoff) until it succeeds or the attempts run out
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now,db_index=True)
+    last_error = models.TextField(blank=True,default='')
+
+    class Meta:
+        verbose_name_plural = 'OutgoingEmails'
+
+    def __str__(self):
+        return "OutgoingEmail: {To: " + self.to_email + ", Subject: " + self.subject + ", Sent: " + str(self.time_sent) + "}"
@@ -0,0 +1,123 @@
+"""
+Delivery of queued emails. A batch of due emails is claimed in the database (by pushing their next attempt past the
+claim timeout, so concurrent workers don't send the same email), then split across a thread pool. Each thread opens one
+connection to the mail server and sends its whole share over it. Threads never touch the database: results are
+written back by the calling thread in a single transaction. Failed emails are retried with exponential backoff until
+EMAIL_OUTBOX_MAX_ATTEMPTS is reached, after which they are left in the table with their last error.
+"""
+import logging
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from dentest.settings_utility import get_setting_with_default
+
+LOGGER = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_BATCH_SIZE = get_setting_with_default('EMAIL_OUTBOX_BATCH_SIZE', 100)
+EMAIL_OUTBOX_WORKERS = get_setting_with_default('EMAIL_OUTBOX_WORKERS', 4)
+EMAIL_OUTBOX_MAX_ATTEMPTS = get_setting_with_default('EMAIL_OUTBOX_MAX_ATTEMPTS', 8)
+EMAIL_OUTBOX_RETRY_DELAY = get_setting_with_default('EMAIL_OUTBOX_RETRY_DELAY', 30)
+EMAIL_OUTBOX_MAX_RETRY_DELAY = get_setting_with_default('EMAIL_OUTBOX_MAX_RETRY_DELAY', 60 * 60 * 6)
+# How long a claimed batch is reserved for one worker before others may pick it up again
+EMAIL_OUTBOX_CLAIM_TIMEOUT = get_setting_with_default('EMAIL_OUTBOX_CLAIM_TIMEOUT', 60 * 5)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after the given number of failed attempts"""
+    return min(EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), EMAIL_OUTBOX_MAX_RETRY_DELAY)
+
+
+def claim_batch(batch_size):
+    """Reserve up to batch_size due emails for this worker and return them"""
+    from models import OutgoingEmail
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(OutgoingEmail.objects.select_for_update()
+                      .filter(time_sent__isnull=True, attempts__lt=EMAIL_OUTBOX_MAX_ATTEMPTS, next_attempt__lte=now)
+                      .order_by('next_attempt')[:batch_size])
+        if emails:
+            OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]) \
+                .update(next_attempt=now + timedelta(seconds=EMAIL_OUTBOX_CLAIM_TIMEOUT))
+    return emails
+
+
+def build_message(email):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email, [email.to_email])
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _send_share(share):
+    """Send a list of (id, message) pairs over one connection. Returns (id, error) pairs, error is None on success"""
+    results = []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        return [(email_id, 'Could not connect: %s' % e) for email_id, message in share]
+    try:
+        for email_id, message in share:
+            message.connection = connection
+            try:
+                message.send()
+                results.append((email_id, None))
+            except Exception as e:
+                results.append((email_id, '%s: %s' % (e.__class__.__name__, e)))
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            LOGGER.warning("Error closing mail connection", exc_info=True)
+    return results
+
+
+def record_results(emails, results):
+    """Mark sent emails as sent and schedule a retry for the ones that failed"""
+    from models import OutgoingEmail
+    emails = dict((email.pk, email) for email in emails)
+    now = timezone.now()
+    sent = [email_id for email_id, error in results if error is None]
+    with transaction.atomic():
+        if sent:
+            OutgoingEmail.objects.filter(pk__in=sent).update(time_sent=now)
+        for email_id, error in results:
+            if error is None:
+                continue
+            attempts = emails[email_id].attempts + 1
+            OutgoingEmail.objects.filter(pk=email_id).update(
+                attempts=attempts, last_error=error, next_attempt=now + timedelta(seconds=retry_delay(attempts)))
+            if attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+                LOGGER.error("Giving up sending email %s after %s attempts: %s", email_id, attempts, error)
+            else:
+                LOGGER.warning("Failed to send email %s (attempt %s): %s", email_id, attempts, error)
+    return len(sent)
+
+
+def send_queued_emails(batch_size=None, workers=None):
+    """Deliver every email which is due, one batch at a time. Returns the number of emails sent"""
+    batch_size = batch_size or EMAIL_OUTBOX_BATCH_SIZE
+    workers = workers or EMAIL_OUTBOX_WORKERS
+    total_sent = 0
+    pool = ThreadPool(workers)
+    try:
+        while True:
+            emails = claim_batch(batch_size)
+            if not emails:
+                break
+            messages = [(email.pk, build_message(email)) for email in emails]
+            shares = [share for share in (messages[i::workers] for i in range(workers)) if share]
+            results = [result for share_results in pool.map(_send_share, shares) for result in share_results]
+            total_sent += record_results(emails, results)
+            if len(emails) < batch_size:
+                break
+    finally:
+        pool.close()
+        pool.join()
+    if total_sent:
+        LOGGER.info("Sent %s queued emails", total_sent)
+    return total_sent
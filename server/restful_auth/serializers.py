@@ -5,7 +5,10 @@ from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import serializers
 from rest_framework.authtoken.serializers import AuthTokenSerializer
 
-from subscriptions.subscription_manager import SubscriptionManager
+from subscriptions.provisioning import queue_customer_provisioning
+from subscriptions.entitlements import get_subscription_tier
+from access_tokens import issue_access_token
+import hashing
 
 from models import *
 from validators import *
@@ -48,31 +51,45 @@ class UserModelSerializer(serializers.ModelSerializer):
         return instance
 
     def create(self,validated_data):
-        """Register a new user. Also create a Braintree account for them."""
+        """
+        Register a new user. Their Braintree account is created in the background once the user is committed (see
+        subscriptions/provisioning.py), and their password is hashed before the transaction starts, so the transaction
+        never waits on Braintree or the hashing pool. Raises HashingTimeout if the password can't be hashed in time.
+        """
         username = validated_data.get('username',None)
         email = validated_data.get('email',None)
         password = validated_data.get('password1',None)
         first_name = validated_data.get('first_name',None)
         last_name = validated_data.get('last_name',None)
 
+        user = User(username=username,
+                    email=User.objects.normalize_email(email),
+                    first_name=first_name,
+                    last_name=last_name,
+                    password=hashing.make_password(password))
         try:
             with transaction.atomic():
-                user = User.objects.create_user(username,
-                                                email=email,
-                                                password=password,
-                                                first_name=first_name,
-                                                last_name=last_name)
-                emailaddress = EmailAddress(user=user,email=email)
                 user.save()
+                emailaddress = EmailAddress(user=user,email=email)
                 emailaddress.save()
                 emailaddress.send_confirmation()
-                SubscriptionManager.create_new_customer(user)
+                queue_customer_provisioning(user)
         except Exception as e:
             logging.exception("Could not register new user.")
             raise serializers.ValidationError(e.message)
         return user
 
 
+def issue_token_pair(user, refresh_token):
+    """Issues a signed access token for the user to go with the given refresh token"""
+    access_token, expires = issue_access_token(user, get_subscription_tier(user))
+    return {
+        'access_token': access_token,
+        'access_token_expires': expires,
+        'refresh_token': refresh_token.key,
+    }
+
+
 class LoginSerializer(AuthTokenSerializer):
     """Serializer to handle RESFTFUL login. Checks the password provided and gives User their token"""
     password = serializers.CharField(required=True)
@@ -94,6 +111,7 @@ class LoginSerializer(AuthTokenSerializer):
         # Fetch token, or create one if the user doesnt have one for some reason
         token,created = Token.objects.get_or_create(user=user)
         attrs['token'] = token.key
+        attrs.update(issue_token_pair(user, RefreshToken.create(user)))
 
         # Remove user object and password attribute
         attrs.pop('user',None)
@@ -101,6 +119,22 @@ class LoginSerializer(AuthTokenSerializer):
         return attrs
 
 
+class TokenRefreshSerializer(serializers.Serializer):
+    """Exchanges a refresh token for a new access token. The refresh token is rotated, so it can only be used once"""
+    refresh_token = serializers.CharField(required=True)
+
+    def validate(self,attrs):
+        try:
+            refresh_token = RefreshToken.objects.select_related('user').get(key=attrs['refresh_token'])
+        except ObjectDoesNotExist:
+            raise serializers.ValidationError("Refresh token is invalid or has already been used.")
+        user = refresh_token.user
+        new_refresh_token = refresh_token.rotate()
+        if new_refresh_token is None or not user.is_active:
+            raise serializers.ValidationError("Refresh token is invalid or has already been used.")
+        return issue_token_pair(user, new_refresh_token)
+
+
 class RegistrationSerializer(UserModelSerializer):
     """Serializer for Users. Can be used for Registration"""
     password1 = serializers.CharField(write_only=True,validators=[
@@ -108,6 +142,7 @@ class RegistrationSerializer(UserModelSerializer):
         common_sequences,
         complexity,
         dictionary_words,
+        breached_passwords,
     ])
     password2 = serializers.CharField(write_only=True)
 
@@ -188,6 +223,7 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
         common_sequences,
         complexity,
         dictionary_words,
+        breached_passwords,
     ])
     password2 = serializers.CharField(write_only=True)
 
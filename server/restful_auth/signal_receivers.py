@@ -1,10 +1,26 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
+from authentication import evict_token, evict_user_tokens
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     """Creates an AuthToken for a User after they are created. Lifted straight from REST framework"""
     if created:
-        Token.objects.create(user=instance)
\ No newline at end of file
+        Token.objects.create(user=instance)
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def evict_cached_tokens(sender, instance=None, created=False, update_fields=None, **kwargs):
+    """
+    The user's cached token carries their is_staff/is_active flags, so drop it whenever they are saved. Logging in only
+    updates last_login, which isn't cached.
+    """
+    if not created and set(update_fields or ()) != set(['last_login']):
+        evict_user_tokens(instance.pk)
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance=None, **kwargs):
+    """Tokens are deleted when a password is reset (and with their user), they must stop authenticating at once"""
+    evict_token(instance.key)
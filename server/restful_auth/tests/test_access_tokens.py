@@ -0,0 +1,93 @@
+import json
+from django.test import TestCase
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework import status
+from mockito import *
+
+from subscriptions.subscription_manager import SubscriptionManager
+from subscriptions.entitlements import can_access_subscription_content
+from ..access_tokens import *
+from ..authentication import AccessTokenAuthentication
+from ..models import *
+
+
+class AccessTokenTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('test',email='inuse@fake.com',password='pass')
+        EmailAddress.objects.create(user=self.user,email='inuse@fake.com',verified=True)
+        when(SubscriptionManager).can_user_access_subscription_content(any()).thenReturn(True)
+        self.client = APIClient()
+
+    def tearDown(self):
+        unstub()
+        cache.clear()
+        User.objects.all().delete()
+        self.client = None
+
+    def login(self):
+        response = self.client.post('/login/',{'username':'test','password':'pass'},format='json')
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+        return json.loads(response.content)
+
+    def test_login_issues_tokens(self):
+        """Logging in gives the permanent token as before, plus an access and refresh token"""
+        data = self.login()
+        self.assertTrue('token' in data)
+        payload = read_access_token(data['access_token'])
+        self.assertEqual(payload['uid'],self.user.pk)
+        self.assertEqual(payload['tier'],'subscriber')
+        self.assertEqual(payload['exp'],data['access_token_expires'])
+        self.assertTrue(RefreshToken.objects.filter(user=self.user,key=data['refresh_token']).exists())
+
+    def test_tampered_token_rejected(self):
+        """Access tokens which have been altered or have expired don't authenticate"""
+        access_token, expires = issue_access_token(self.user,'staff')
+        self.assertRaises(AccessTokenError,read_access_token,access_token[:-1] + ('A' if access_token[-1] != 'A' else 'B'))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access_token + 'x')
+        response = self.client.get('/topics/',format='json')
+        self.assertEqual(response.status_code,status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access_token)
+        response = self.client.get('/topics/',format='json')
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+
+    def test_bearer_authentication_no_queries(self):
+        """Requests made with an access token authenticate and resolve the tier without any query"""
+        data = self.login()
+        request = APIRequestFactory().get('/topics/',HTTP_AUTHORIZATION='Bearer ' + data['access_token'])
+        unstub()
+        with self.assertNumQueries(0):
+            user, payload = AccessTokenAuthentication().authenticate(request)
+            self.assertEqual(user.username,'test')
+            self.assertTrue(can_access_subscription_content(user))
+
+    def test_refresh_rotates(self):
+        """A refresh token can be used exactly once"""
+        data = self.login()
+        response = self.client.post('/token_refresh/',{'refresh_token':data['refresh_token']},format='json')
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+        refreshed = json.loads(response.content)
+        self.assertNotEqual(refreshed['refresh_token'],data['refresh_token'])
+        self.assertEqual(read_access_token(refreshed['access_token'])['uid'],self.user.pk)
+
+        response = self.client.post('/token_refresh/',{'refresh_token':data['refresh_token']},format='json')
+        self.assertEqual(response.status_code,status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(RefreshToken.objects.filter(user=self.user).count(),1)
+
+    def test_abandoned_refresh_tokens_dropped(self):
+        """Logging in drops the user's expired refresh tokens and keeps at most REFRESH_TOKENS_PER_USER"""
+        expired = RefreshToken.create(self.user)
+        RefreshToken.objects.filter(pk=expired.pk).update(
+            time_created=timezone.now() - datetime.timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS + 1))
+        self.login()
+        self.assertFalse(RefreshToken.objects.filter(pk=expired.pk).exists())
+
+        for i in range(REFRESH_TOKENS_PER_USER + 5):
+            newest = RefreshToken.create(self.user)
+        tokens = RefreshToken.objects.filter(user=self.user)
+        self.assertEqual(tokens.count(),REFRESH_TOKENS_PER_USER)
+        self.assertTrue(tokens.filter(pk=newest.pk).exists())
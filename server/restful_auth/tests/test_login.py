@@ -8,6 +8,7 @@ from rest_framework.test import APIClient
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from ..models import *
+from ..outbox import send_queued_emails
 
 
 class RestfulAuthTokenLoginTestCase(TestCase):
@@ -85,4 +86,22 @@ class RestfulAuthTokenLoginTestCase(TestCase):
         data = json.loads(response.content)
         self.assertEqual(response.status_code,status.HTTP_401_UNAUTHORIZED)
         self.assertTrue('non_field_errors' in data)
-        self.assertEqual(len(mail.outbox),1)
\ No newline at end of file
+        send_queued_emails()
+        self.assertEqual(len(mail.outbox),1)
+
+    def test_authentication_single_query(self):
+        """Looking up the user by username or email takes one query, and an unknown login still costs one hash"""
+        EmailAddress.objects.create(user=self.user,email='inuse@fake.com',verified=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username='TEST',password='pass'),self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username='InUse@fake.com',password='pass'),self.user)
+        with self.assertNumQueries(1):
+            self.assertTrue(authenticate(username='nobody',password='pass') is None)
+
+    def test_authentication_prefers_email(self):
+        """If one user's username is another's email, the email match is the one authenticated"""
+        other = User.objects.create_user('inuse@fake.com',email='other@fake.com',password='other')
+        self.assertEqual(authenticate(username='inuse@fake.com',password='pass'),self.user)
+        self.assertTrue(authenticate(username='inuse@fake.com',password='other') is None)
+        self.assertEqual(authenticate(username='other@fake.com',password='other'),other)
@@ -0,0 +1,108 @@
+import json
+from django.test import TestCase
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from .. import hashing
+from ..throttling import TokenBucketRegistry, username_buckets, ip_buckets
+from ..models import *
+
+
+class LoginThrottlingTestCase(TestCase):
+
+    def setUp(self):
+        username_buckets.clear()
+        ip_buckets.clear()
+        hashing.metrics.reset()
+        self.user = User.objects.create_user('test',email='inuse@fake.com',password='pass')
+        EmailAddress.objects.create(user=self.user,email='inuse@fake.com',verified=True)
+        self.client = APIClient()
+
+    def tearDown(self):
+        username_buckets.clear()
+        ip_buckets.clear()
+        User.objects.all().delete()
+        self.client = None
+
+    def test_token_bucket(self):
+        """A bucket allows a burst up to its capacity, then refuses until it refills"""
+        buckets = TokenBucketRegistry(3, 0.001)
+        for _ in range(3):
+            self.assertTrue(buckets.consume('key'))
+        self.assertFalse(buckets.consume('key'))
+        self.assertTrue(buckets.consume('other'))
+        self.assertTrue(buckets.wait('key') > 0)
+
+    def test_login_throttled_by_username(self):
+        """Too many attempts for one username are rejected without checking the password"""
+        for _ in range(username_buckets.capacity):
+            response = self.client.post('/login/',{'username':'test','password':'wrong'},format='json')
+            self.assertEqual(response.status_code,status.HTTP_401_UNAUTHORIZED)
+        hashes = hashing.metrics.count
+        response = self.client.post('/login/',{'username':'TEST','password':'pass'},format='json')
+        self.assertEqual(response.status_code,status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(hashing.metrics.count,hashes)
+
+    def test_outdated_hash_upgraded(self):
+        """Passwords stored with an old hasher are rehashed on a successful login"""
+        self.user.password = make_password('pass',hasher='sha1')
+        self.user.save()
+        response = self.client.post('/login/',{'username':'test','password':'pass'},format='json')
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertFalse(user.password.startswith('sha1$'))
+        self.assertTrue(user.check_password('pass'))
+        self.assertEqual(hashing.metrics.upgrades,1)
+
+    def test_hashing_pool(self):
+        """Hashing in the process pool gives the same results as hashing inline"""
+        pool_size = hashing.PASSWORD_HASHING_POOL_SIZE
+        hashing.PASSWORD_HASHING_POOL_SIZE = 1
+        try:
+            encoded = hashing.make_password('secret')
+            user = User(password=encoded)
+            self.assertTrue(user.check_password('secret'))
+            self.assertTrue(hashing.check_user_password(self.user,'pass'))
+            self.assertFalse(hashing.check_user_password(self.user,'wrong'))
+        finally:
+            hashing.PASSWORD_HASHING_POOL_SIZE = pool_size
+            hashing.shutdown_pool()
+
+    def test_hashing_timeout(self):
+        """When the pool can't keep up, logins and registrations are refused with a 503 rather than an error"""
+        pool_size, timeout = hashing.PASSWORD_HASHING_POOL_SIZE, hashing.PASSWORD_HASHING_TIMEOUT
+        hashing.PASSWORD_HASHING_POOL_SIZE, hashing.PASSWORD_HASHING_TIMEOUT = 1, 0
+        try:
+            response = self.client.post('/login/',{'username':'test','password':'pass'},format='json')
+            self.assertEqual(response.status_code,status.HTTP_503_SERVICE_UNAVAILABLE)
+            response = self.client.post('/register/',{
+                'username':'test1',
+                'email':'test@fake.com',
+                'first_name':'michael',
+                'last_name':'kilian',
+                'password1':'GBG18H42,]bb',
+                'password2':'GBG18H42,]bb',
+            },format='json')
+            self.assertEqual(response.status_code,status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertFalse(User.objects.filter(username='test1').exists())
+        finally:
+            hashing.PASSWORD_HASHING_POOL_SIZE, hashing.PASSWORD_HASHING_TIMEOUT = pool_size, timeout
+            hashing.shutdown_pool()
+        self.assertEqual(hashing.metrics.timeouts,2)
+
+    def test_metrics_staff_only(self):
+        """Hashing metrics are only shown to staff"""
+        self.client.post('/login/',{'username':'test','password':'pass'},format='json')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/password_hashing_metrics/',format='json')
+        self.assertEqual(response.status_code,status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/password_hashing_metrics/',format='json')
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+        data = json.loads(response.content)
+        self.assertEqual(data['count'],1)
+        self.assertEqual(sum(data['latency_histogram'].values()),1)
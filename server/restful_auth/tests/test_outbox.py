@@ -0,0 +1,119 @@
+from datetime import timedelta
+from smtplib import SMTPException
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from ..models import *
+from ..utils import queue_email, render_emails
+from ..outbox import send_queued_emails, EMAIL_OUTBOX_MAX_ATTEMPTS
+
+
+class FailingBackend(BaseEmailBackend):
+    """Mail backend whose server rejects everything"""
+    def send_messages(self, email_messages):
+        raise SMTPException("Mailbox unavailable")
+
+
+class OutboxTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('test',email='inuse@fake.com',password='pass')
+        self.email_address = EmailAddress.objects.create(user=self.user,email='inuse@fake.com')
+
+    def tearDown(self):
+        User.objects.all().delete()
+        OutgoingEmail.objects.all().delete()
+
+    def queue_activation(self):
+        context = {'site_name': 'Dentest', 'protocol': 'http', 'domain': 'localhost', 'url': 'activate'}
+        return queue_email('inuse@fake.com','from@fake.com',context,'activation_email_subject.txt',
+                           'activation_email_body.txt')
+
+    def test_emails_queued_not_sent(self):
+        """Sending an email only queues it, the worker delivers it"""
+        self.queue_activation()
+        self.assertEqual(len(mail.outbox),0)
+        self.assertEqual(OutgoingEmail.objects.filter(to_email='inuse@fake.com').count(),1)
+
+        self.assertEqual(send_queued_emails(),1)
+        self.assertEqual(len(mail.outbox),1)
+        self.assertEqual(mail.outbox[0].to,['inuse@fake.com'])
+        self.assertEqual(mail.outbox[0].subject,'Account activation on Dentest')
+        self.assertFalse(OutgoingEmail.objects.filter(time_sent__isnull=True).exists())
+        self.assertEqual(send_queued_emails(),0)
+
+    def test_queued_in_callers_transaction(self):
+        """An email queued in a transaction which rolls back is never sent"""
+        try:
+            with transaction.atomic():
+                self.queue_activation()
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+    def test_batches_across_threads(self):
+        """Every email is sent exactly once whatever the batch size and thread count"""
+        for i in range(7):
+            OutgoingEmail.objects.create(to_email='user%s@fake.com' % i,from_email='from@fake.com',subject='Hi',
+                                         body='Hello')
+        self.assertEqual(send_queued_emails(batch_size=3,workers=2),7)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),['user%s@fake.com' % i for i in range(7)])
+
+    @override_settings(EMAIL_BACKEND='restful_auth.tests.test_outbox.FailingBackend')
+    def test_failed_email_retried_with_backoff(self):
+        """Failures are recorded and retried later, until the attempts run out"""
+        email = OutgoingEmail.objects.create(to_email='inuse@fake.com',from_email='from@fake.com',subject='Hi',
+                                             body='Hello')
+        self.assertEqual(send_queued_emails(),0)
+        email = OutgoingEmail.objects.get(pk=email.pk)
+        self.assertEqual(email.attempts,1)
+        self.assertTrue('Mailbox unavailable' in email.last_error)
+        self.assertTrue(email.next_attempt > timezone.now())
+
+        # Not due yet, so nothing is attempted
+        self.assertEqual(send_queued_emails(),0)
+        self.assertEqual(OutgoingEmail.objects.get(pk=email.pk).attempts,1)
+
+        OutgoingEmail.objects.filter(pk=email.pk).update(attempts=EMAIL_OUTBOX_MAX_ATTEMPTS,
+                                                         next_attempt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(send_queued_emails(),0)
+        self.assertEqual(OutgoingEmail.objects.get(pk=email.pk).attempts,EMAIL_OUTBOX_MAX_ATTEMPTS)
+
+
+class BatchEmailTestCase(TestCase):
+
+    def setUp(self):
+        for i in range(5):
+            user = User.objects.create_user('user%s' % i,email='user%s@fake.com' % i,password='pass')
+            EmailAddress.objects.create(user=user,email='user%s@fake.com' % i,verified=(i == 0))
+
+    def tearDown(self):
+        User.objects.all().delete()
+        OutgoingEmail.objects.all().delete()
+
+    def test_render_emails(self):
+        """Batch rendering gives the same emails as rendering one at a time"""
+        contexts = [{'site_name': 'Site %s' % i, 'protocol': 'http', 'domain': 'localhost', 'url': 'x'}
+                    for i in range(3)]
+        rendered = render_emails(contexts,'activation_email_subject.txt','activation_email_body.txt')
+        self.assertEqual([subject for subject, body, html_body in rendered],
+                         ['Account activation on Site %s' % i for i in range(3)])
+        self.assertTrue('http://localhost/x' in rendered[0][1])
+        self.assertEqual(rendered[0][2],'')
+
+    def test_resend_all(self):
+        """Unverified users get a fresh confirmation key and a new email, with a fixed number of queries"""
+        email_addresses = list(EmailAddress.objects.filter(verified=False).select_related('user'))
+        old = EmailConfirmation.resend_all(email_addresses[:1])[0]
+        with self.assertNumQueries(5):
+            EmailConfirmation.resend_all(email_addresses)
+        self.assertEqual(EmailConfirmation.objects.count(),4)
+        self.assertFalse(EmailConfirmation.objects.filter(key=old.key).exists())
+        self.assertEqual(OutgoingEmail.objects.filter(to_email='user1@fake.com').count(),2)
+        self.assertEqual(OutgoingEmail.objects.count(),5)
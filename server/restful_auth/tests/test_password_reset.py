@@ -6,6 +6,7 @@ from rest_framework.test import APIClient
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from ..models import *
+from ..outbox import send_queued_emails
 
 
 class RestfulAuthPasswordResetRequestTestCase(TestCase):
@@ -31,6 +32,7 @@ class RestfulAuthPasswordResetRequestTestCase(TestCase):
         """Check a password reset email is sent provided all data is entered correctly"""
         response = self.client.post('/password_reset/',self.correct_details,format='json')
         self.assertEqual(response.status_code,status.HTTP_201_CREATED)
+        send_queued_emails()
         self.assertEqual(len(mail.outbox),1)
 
     def test_reset_request_username_missing(self):
@@ -40,6 +42,7 @@ class RestfulAuthPasswordResetRequestTestCase(TestCase):
         data = json.loads(response.content)
         self.assertEqual(response.status_code,status.HTTP_401_UNAUTHORIZED)
         self.assertTrue('username' in data) # Check for error message
+        send_queued_emails()
         self.assertEqual(len(mail.outbox),0)
 
 
@@ -5,6 +5,7 @@ from django.contrib.auth.models import User,Group
 from rest_framework.test import APIClient
 from rest_framework import status
 from ..models import *
+from ..outbox import send_queued_emails
 
 
 class RestfulAuthProfileUpdateTestCase(TestCase):
@@ -59,6 +60,7 @@ class RestfulAuthProfileUpdateTestCase(TestCase):
         self.assertEqual(data['email'],'test@fake.com')
         self.assertEqual(len(User.objects.all()),1) # Should not create a new user
         self.assertEqual(EmailAddress.objects.get(user=self.user).email,'test@fake.com')
+        send_queued_emails()
         self.assertEqual(len(mail.outbox),1)
 
         # Check an invalid email is rejected
@@ -88,6 +90,7 @@ class RestfulAuthProfileUpdateTestCase(TestCase):
         self.client.force_authenticate(user=self.user)
         response = self.client.put('/update_profile/',self.original_details,format='json')
         self.assertEqual(response.status_code,status.HTTP_200_OK)
+        send_queued_emails()
         self.assertEqual(len(mail.outbox),0) # No email should be sent
 
     def test_update_all(self):
@@ -102,6 +105,7 @@ class RestfulAuthProfileUpdateTestCase(TestCase):
         response = self.client.put('/update_profile/',data,format='json')
         self.assertEqual(response.status_code,status.HTTP_200_OK)
         self.assertEqual(len(User.objects.all()),1) #No new user should be created
+        send_queued_emails()
         self.assertEqual(len(mail.outbox),1) #New email needs to be verified
         user_update = User.objects.get(username='test')
         self.assertEqual(pk_before_change,user_update.pk)
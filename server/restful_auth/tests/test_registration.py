@@ -7,7 +7,11 @@ from rest_framework.test import APIClient
 from rest_framework import status
 
 from ..models import *
-from subscriptions.models import BraintreeUser
+from ..outbox import send_queued_emails
+from subscriptions.models import BraintreeUser, CustomerProvisioningJob
+from subscriptions.gateway import FakeBraintreeGateway, set_gateway
+from subscriptions.provisioning import provision_customers
+from subscriptions.subscription_manager import breaker
 
 
 class RestfulAuthRegistrationTestCase(TestCase):
@@ -46,15 +50,25 @@ class RestfulAuthRegistrationTestCase(TestCase):
         user = User.objects.get(username__iexact='test1')
         self.assertEqual(user.email,'test@fake.com')
         self.assertEqual(user.get_full_name(),'michael kilian')
+        self.assertTrue(user.check_password('GBG18H42,]bb'))
 
         # Check email saved and confirmation email sent
         email_address = EmailAddress.objects.get(user=user)
         self.assertEqual(email_address.email,'test@fake.com')
         self.assertEqual(email_address.verified,False)
         confirmation = EmailConfirmation.objects.get(email_address=email_address)
+        send_queued_emails()
         self.assertEqual(len(mail.outbox),1)
 
-        # Check Braintree account was created
+        # Check Braintree account is queued, and created by the provisioning worker
+        self.assertFalse(BraintreeUser.objects.filter(user=user).exists())
+        self.assertEqual(CustomerProvisioningJob.PENDING, CustomerProvisioningJob.objects.get(user=user).status)
+        previous_gateway = set_gateway(FakeBraintreeGateway())
+        breaker.reset()
+        try:
+            self.assertEqual(1, provision_customers().provisioned)
+        finally:
+            set_gateway(previous_gateway)
         try:
             customer = BraintreeUser.objects.get(user=user)
         except Exception as e:
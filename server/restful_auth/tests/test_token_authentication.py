@@ -0,0 +1,81 @@
+import json
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from ..authentication import _local_cache, CachedTokenAuthentication
+from ..models import *
+
+
+# Counts queries, so cached in memory as with memcached in production rather than in the development database
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CachedTokenAuthenticationTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        _local_cache.clear()
+        self.user = User.objects.create_user('test',email='inuse@fake.com',password='pass',first_name='Joe',last_name='Bloggs')
+        EmailAddress.objects.create(user=self.user,email='inuse@fake.com',verified='True')
+        self.token = Token.objects.get(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        cache.clear()
+        _local_cache.clear()
+        User.objects.all().delete()
+        self.client = None
+
+    def test_cached_authentication(self):
+        """Once a token has been resolved, authenticating with it needs no query"""
+        authentication = CachedTokenAuthentication()
+        user, token = authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user, token = authentication.authenticate_credentials(self.token.key)
+            self.assertEqual(user.username, 'test')
+            self.assertFalse(user.is_staff)
+            self.assertEqual(token.key, self.token.key)
+
+        _local_cache.clear()
+        with self.assertNumQueries(0):
+            authentication.authenticate_credentials(self.token.key)
+
+    def test_deferred_fields_loaded(self):
+        """Fields which aren't cached are still available on the user"""
+        user, token = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.assertEqual(user.email, 'inuse@fake.com')
+        self.assertEqual(user.get_full_name(), 'Joe Bloggs')
+
+    def test_token_deleted(self):
+        """A deleted token stops authenticating straight away"""
+        response = self.client.put('/update_profile/',{'email':'inuse@fake.com','first_name':'Joe','last_name':'B'},
+                                   format='json')
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+        Token.objects.filter(user=self.user).delete()
+        response = self.client.put('/update_profile/',{'email':'inuse@fake.com','first_name':'Joe','last_name':'B'},
+                                   format='json')
+        self.assertEqual(response.status_code,status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_deactivated(self):
+        """Deactivating a user evicts their cached token"""
+        CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.put('/update_profile/',{'email':'inuse@fake.com','first_name':'Joe','last_name':'B'},
+                                   format='json')
+        self.assertEqual(response.status_code,status.HTTP_401_UNAUTHORIZED)
+
+    def test_update_keeps_other_fields(self):
+        """Updating the profile through a cached token doesn't lose fields which weren't cached"""
+        CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        response = self.client.put('/update_profile/',{'email':'inuse@fake.com','first_name':'Steve','last_name':'Bloggs'},
+                                   format='json')
+        self.assertEqual(response.status_code,status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['first_name'],'Steve')
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.get_full_name(),'Steve Bloggs')
+        self.assertTrue(user.check_password('pass'))
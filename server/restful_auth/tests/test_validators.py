@@ -0,0 +1,107 @@
+# coding=utf-8
+from __future__ import division, unicode_literals
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+from rest_framework.serializers import ValidationError
+
+from ..bloom import build_bloom_filter, password_digest
+from ..validators import *
+
+
+class SimilarityValidatorTestCase(TestCase):
+
+    def setUp(self):
+        self.random = random.Random(1234)
+
+    def random_word(self, alphabet='abcde', max_length=12):
+        return ''.join(self.random.choice(alphabet) for _ in range(self.random.randint(0, max_length)))
+
+    def test_bit_parallel_matches_dp(self):
+        """The bit-parallel distance agrees with the dynamic programming one, special cases included"""
+        validator = BaseSimilarityValidator()
+        pairs = [('a', 'xyz'), ('a', 'bab'), ('abc', ''), ('', 'abc'), ('Pass', 'PASSWORD'), ('kitten', 'sitting')]
+        pairs += [(self.random_word(), self.random_word()) for _ in range(2000)]
+        pairs += [(self.random_word(max_length=80), self.random_word(max_length=80)) for _ in range(100)]
+        for needle, haystack in pairs:
+            self.assertEqual(validator.fuzzy_substring(needle, haystack),
+                             validator.fuzzy_substring_dp(needle, haystack), (needle, haystack))
+
+    def test_candidate_filter_is_exact(self):
+        """Ruling haystacks out by character counts never changes the outcome of validation"""
+        words = [self.random_word('abcdefg', 10) for _ in range(300)] + ['', 'ÄÖü']
+        for threshold in (0.5, 0.7, 0.9):
+            validator = DictionaryValidator(words=words, threshold=threshold)
+            for _ in range(200):
+                password = self.random_word('abcdefghÄ', 12)
+                expected = False
+                for word in words:
+                    if not password and not word:
+                        continue
+                    longest = max(len(password), len(word))
+                    if (longest - validator.fuzzy_substring_dp(password, word)) / longest >= threshold:
+                        expected = True
+                        break
+                if not password:
+                    continue
+                rejected = False
+                try:
+                    validator(password)
+                except ValidationError:
+                    rejected = True
+                self.assertEqual(rejected, expected, (password, threshold))
+
+    def test_dictionary_validator(self):
+        """Passwords close to a dictionary word are rejected"""
+        validator = DictionaryValidator(words=['password', 'dragon', 'monkey'])
+        self.assertRaises(ValidationError, validator, 'PASSWORD')
+        validator = DictionaryValidator(words=['password', 'dragon', 'monkey'], threshold=0.8)
+        self.assertRaises(ValidationError, validator, 'Passw0rd')
+        self.assertRaises(ValidationError, validator, 'Monkeys')
+        validator('GBG18H42,]bb')
+
+
+class BreachedPasswordValidatorTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'breached.bloom')
+        self.breached = ['password%s' % i for i in range(5000)] + ['Pässwörd']
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_breached_passwords_rejected(self):
+        """Every password the filter was built from is rejected, and few others are"""
+        build_bloom_filter(self.path, (password_digest(password) for password in self.breached), len(self.breached),
+                           0.01)
+        validator = BreachedPasswordValidator(self.path)
+        for password in self.breached:
+            self.assertRaises(ValidationError, validator, password)
+        false_positives = 0
+        for i in range(5000):
+            try:
+                validator('GBG18H42,]bb%s' % i)
+            except ValidationError:
+                false_positives += 1
+        self.assertTrue(false_positives < 150)
+
+    def test_build_command_sha1_lists(self):
+        """Filters can be built from lists of SHA-1 hashes, as in the Pwned Passwords downloads"""
+        list_path = os.path.join(self.directory, 'pwned.txt')
+        with open(list_path, 'w') as pwned:
+            for password in self.breached:
+                pwned.write('%s:%s\n' % (hashlib.sha1(password.encode('utf-8')).hexdigest().upper(), 3))
+        call_command('build_breached_password_filter', list_path, output=self.path, sha1=True, stdout=StringIO())
+        validator = BreachedPasswordValidator(self.path)
+        self.assertRaises(ValidationError, validator, 'Pässwörd')
+        self.assertRaises(ValidationError, validator, 'password42')
+
+    def test_no_filter_configured(self):
+        """Without a filter every password passes"""
+        BreachedPasswordValidator(None)('password')
@@ -0,0 +1,86 @@
+"""
+Login throttling. Each username and each client IP gets a token bucket held in process memory: a bucket holds up to
+LOGIN_BURST attempts and refills at LOGIN_RATE attempts per second. Requests which find either bucket empty are
+rejected before any password is hashed. Buckets are per process, so the effective limit scales with the number of
+workers, which is fine for shedding login storms.
+"""
+import time
+from threading import Lock
+
+from django.utils.encoding import force_text
+from rest_framework.throttling import BaseThrottle
+
+from dentest.settings_utility import get_setting_with_default
+
+LOGIN_BURST = get_setting_with_default('LOGIN_BURST', 10)
+LOGIN_RATE = get_setting_with_default('LOGIN_RATE', 1 / 6.0)
+LOGIN_IP_BURST = get_setting_with_default('LOGIN_IP_BURST', 30)
+LOGIN_IP_RATE = get_setting_with_default('LOGIN_IP_RATE', 1.0)
+# Buckets which are full are dropped once there are more than this many
+LOGIN_MAX_BUCKETS = get_setting_with_default('LOGIN_MAX_BUCKETS', 100000)
+
+
+class TokenBucketRegistry(object):
+    """A set of token buckets sharing the same capacity and refill rate, keyed by any hashable value"""
+
+    def __init__(self, capacity, rate, max_buckets=LOGIN_MAX_BUCKETS):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_buckets = max_buckets
+        self._buckets = {}
+        self._lock = Lock()
+
+    def _level(self, key, now):
+        tokens, last = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - last) * self.rate)
+
+    def consume(self, key):
+        """Take a token from the key's bucket, returning False if it is empty"""
+        now = time.time()
+        with self._lock:
+            tokens = self._level(key, now)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return False
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_buckets:
+                self._prune(now)
+            return True
+
+    def wait(self, key):
+        """Seconds until the key's bucket has a token again"""
+        with self._lock:
+            tokens = self._level(key, time.time())
+        return max(0.0, (1 - tokens) / self.rate)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def _prune(self, now):
+        for key in list(self._buckets):
+            if self._level(key, now) >= self.capacity:
+                del self._buckets[key]
+
+
+username_buckets = TokenBucketRegistry(LOGIN_BURST, LOGIN_RATE)
+ip_buckets = TokenBucketRegistry(LOGIN_IP_BURST, LOGIN_IP_RATE)
+
+
+class LoginRateThrottle(BaseThrottle):
+    """Limits login attempts per username and per client IP"""
+
+    def allow_request(self, request, view):
+        self.waits = []
+        ident = self.get_ident(request)
+        if not ip_buckets.consume(ident):
+            self.waits.append(ip_buckets.wait(ident))
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if username:
+            username = force_text(username).lower()
+            if not username_buckets.consume(username):
+                self.waits.append(username_buckets.wait(username))
+        return not self.waits
+
+    def wait(self):
+        return max(self.waits) if self.waits else None
@@ -1,20 +1,60 @@
-from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from django.template import loader
+from django.template import Context, loader
 
 from dentest.settings_utility import get_setting
 
-def send_email(to_email, from_email, context, subject_template_name,
-               plain_body_template_name, html_body_template_name=None):
-    """Used to send an email to the user"""
-    subject = loader.render_to_string(subject_template_name, context)
-    subject = ''.join(subject.splitlines())
-    body = loader.render_to_string(plain_body_template_name, context)
-    email_message = EmailMultiAlternatives(subject, body, from_email, [to_email])
-    if html_body_template_name is not None:
-        html_email = loader.render_to_string(html_body_template_name, context)
-        email_message.attach_alternative(html_email, 'text/html')
-    email_message.send()
+# Email templates compiled once per process, by name
+_compiled_templates = {}
+
+
+def get_email_template(template_name):
+    """The compiled template with the given name. Templates are only looked up and parsed the first time"""
+    template = _compiled_templates.get(template_name)
+    if template is None:
+        template = _compiled_templates[template_name] = loader.get_template(template_name)
+    return template
+
+
+def render_emails(contexts, subject_template_name, plain_body_template_name, html_body_template_name=None):
+    """
+    Render a (subject, body, html_body) triple for each of the given contexts. The templates are fetched once for the
+    whole batch, so rendering many emails only costs the rendering itself.
+    """
+    subject_template = get_email_template(subject_template_name)
+    body_template = get_email_template(plain_body_template_name)
+    html_template = get_email_template(html_body_template_name) if html_body_template_name is not None else None
+    rendered = []
+    for context in contexts:
+        context = Context(context)
+        subject = ''.join(subject_template.render(context).splitlines())
+        body = body_template.render(context)
+        html_body = html_template.render(context) if html_template is not None else ''
+        rendered.append((subject, body, html_body))
+    return rendered
+
+
+def queue_emails(recipients, from_email, contexts, subject_template_name,
+                 plain_body_template_name, html_body_template_name=None):
+    """Render an email for each recipient and context pair and add them all to the outbox in one query"""
+    from models import OutgoingEmail
+    rendered = render_emails(contexts, subject_template_name, plain_body_template_name, html_body_template_name)
+    return OutgoingEmail.objects.bulk_create([
+        OutgoingEmail(to_email=to_email, from_email=from_email, subject=subject, body=body, html_body=html_body)
+        for to_email, (subject, body, html_body) in zip(recipients, rendered)
+    ])
+
+
+def queue_email(to_email, from_email, context, subject_template_name,
+                plain_body_template_name, html_body_template_name=None):
+    """
+    Render an email to the user and add it to the outbox. It is written in the caller's transaction and delivered
+    by the send_queued_email command, so no SMTP round trip happens inside the request.
+    """
+    from models import OutgoingEmail
+    (subject, body, html_body), = render_emails([context], subject_template_name, plain_body_template_name,
+                                                html_body_template_name)
+    return OutgoingEmail.objects.create(to_email=to_email, from_email=from_email, subject=subject, body=body,
+                                        html_body=html_body)
 
 
 def get_email_context(self, user):
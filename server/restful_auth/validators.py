@@ -4,12 +4,15 @@ from __future__ import division, unicode_literals
 import string
 import re
 
+import numpy
+
 from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 from django.utils.encoding import smart_unicode as smart_text
 from rest_framework.serializers import ValidationError
 
 from dentest.settings_utility import get_setting_with_default
+from bloom import BloomFilter
 
 """
 Taken from Django Passwords and adapted to raise REST Framework Validation Errors rather than form errors.
@@ -37,6 +40,7 @@ PASSWORD_DICTIONARY = get_setting_with_default("PASSWORD_DICTIONARY", None)
 PASSWORD_MATCH_THRESHOLD = get_setting_with_default("PASSWORD_MATCH_THRESHOLD", 0.9)
 PASSWORD_COMMON_SEQUENCES = get_setting_with_default("PASSWORD_COMMON_SEQUENCES", COMMON_SEQUENCES)
 PASSWORD_COMPLEXITY = get_setting_with_default("PASSWORD_COMPLEXITY", None)
+PASSWORD_BREACHED_FILTER = get_setting_with_default("PASSWORD_BREACHED_FILTER", None)
 
 
 class LengthValidator(object):
@@ -123,6 +127,78 @@ class ComplexityValidator(object):
 
 
 
+def fuzzy_substring_distance(needle, haystack):
+    """
+    Smallest edit distance between the needle and any substring of the haystack, using Myers' bit-parallel algorithm:
+    each column of the dynamic programming table is held as bit vectors of vertical deltas, so the haystack is scanned
+    in O(n) integer operations instead of O(m * n) cell updates. Both strings are expected to be lowercased already.
+    """
+    m = len(needle)
+    if m == 0:
+        return 0
+    match_masks = {}
+    for i, character in enumerate(needle):
+        match_masks[character] = match_masks.get(character, 0) | (1 << i)
+    all_rows = (1 << m) - 1
+    last_row = 1 << (m - 1)
+
+    positive, negative = all_rows, 0
+    score = best = m
+    for character in haystack:
+        match = match_masks.get(character, 0)
+        vertical = match | negative
+        horizontal = (((match & positive) + positive) ^ positive) | match
+        horizontal_positive = negative | (~(horizontal | positive) & all_rows)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last_row:
+            score += 1
+        elif horizontal_negative & last_row:
+            score -= 1
+            if score < best:
+                best = score
+        # Nothing is shifted in at the top: a match may start anywhere in the haystack at no cost
+        horizontal_positive = (horizontal_positive << 1) & all_rows
+        horizontal_negative = (horizontal_negative << 1) & all_rows
+        positive = horizontal_negative | (~(vertical | horizontal_positive) & all_rows)
+        negative = horizontal_positive & vertical
+    return best
+
+
+class CharacterCountIndex(object):
+    """
+    Character counts of every haystack, used to rule haystacks out before computing any edit distance. A needle
+    character with no copy left in the haystack must be substituted or deleted, so the total shortfall of each
+    character is a lower bound on the distance. Haystacks which couldn't reach the threshold even at that bound are
+    skipped.
+    """
+
+    def __init__(self, haystacks):
+        haystacks = [haystack.lower() for haystack in haystacks]
+        alphabet = sorted(set(character for haystack in haystacks for character in haystack))
+        self.column_of = dict((character, column) for column, character in enumerate(alphabet))
+        self.lengths = numpy.array([len(haystack) for haystack in haystacks], dtype=numpy.int64)
+        self.counts = numpy.zeros((len(haystacks), len(alphabet)), dtype=numpy.int32)
+        rows = numpy.repeat(numpy.arange(len(haystacks)), self.lengths)
+        columns = numpy.array([self.column_of[character] for haystack in haystacks for character in haystack],
+                              dtype=numpy.intp)
+        numpy.add.at(self.counts, (rows, columns), 1)
+
+    def candidates(self, needle, threshold):
+        """Indexes of the haystacks which may be at least threshold similar to the (lowercased) needle"""
+        needle_counts = numpy.zeros(len(self.column_of), dtype=numpy.int32)
+        unknown = 0
+        for character in needle:
+            column = self.column_of.get(character)
+            if column is None:
+                unknown += 1
+            else:
+                needle_counts[column] += 1
+        present = numpy.flatnonzero(needle_counts)
+        shortfall = numpy.maximum(needle_counts[present] - self.counts[:, present], 0).sum(axis=1) + unknown
+        longest = numpy.maximum(self.lengths, len(needle)).astype(float)
+        return numpy.flatnonzero((longest - shortfall) / longest >= threshold)
+
+
 class BaseSimilarityValidator(object):
     message = _("Too Similar to [%(haystacks)s]")
     code = "similarity"
@@ -133,11 +209,24 @@ class BaseSimilarityValidator(object):
             self.threshold = PASSWORD_MATCH_THRESHOLD
         else:
             self.threshold = threshold
+        self._index = None
 
     def fuzzy_substring(self, needle, haystack):
         needle, haystack = needle.lower(), haystack.lower()
         m, n = len(needle), len(haystack)
 
+        if m == 1:
+            if needle not in haystack:
+                return -1
+        if n == 0:
+            return m
+        return fuzzy_substring_distance(needle, haystack)
+
+    def fuzzy_substring_dp(self, needle, haystack):
+        """Reference dynamic programming version of fuzzy_substring, kept for testing and benchmarking"""
+        needle, haystack = needle.lower(), haystack.lower()
+        m, n = len(needle), len(haystack)
+
         if m == 1:
             if needle not in haystack:
                 return -1
@@ -156,8 +245,21 @@ class BaseSimilarityValidator(object):
             row1 = row2
         return min(row1)
 
+    def get_index(self):
+        """The character count index of the haystacks, built on first use"""
+        if self._index is None:
+            self._index = CharacterCountIndex(self.haystacks)
+        return self._index
+
+    def get_candidates(self, value):
+        """The haystacks worth computing a distance for"""
+        # One character needles have their own rules in fuzzy_substring, so every haystack is checked for them
+        if len(value) <= 1 or not self.haystacks:
+            return self.haystacks
+        return [self.haystacks[i] for i in self.get_index().candidates(value.lower(), self.threshold)]
+
     def __call__(self, value):
-        for haystack in self.haystacks:
+        for haystack in self.get_candidates(value):
             distance = self.fuzzy_substring(value, haystack)
             longest = max(len(value), len(haystack))
             similarity = (longest - distance) / longest
@@ -190,7 +292,33 @@ class CommonSequenceValidator(BaseSimilarityValidator):
     code = "common_sequence"
 
 
+class BreachedPasswordValidator(object):
+    """
+    Rejects passwords found in a Bloom filter of known breached passwords (see bloom.py). The filter is opened on first
+    use. A small fraction of passwords which were never breached are rejected too, at the false positive rate the
+    filter was built with.
+    """
+    message = _("This password has appeared in a data breach, please choose another")
+    code = "breached"
+
+    def __init__(self, filter_path=None):
+        self.filter_path = filter_path
+        self._filter = None
+
+    def get_filter(self):
+        if self._filter is None:
+            self._filter = BloomFilter(self.filter_path)
+        return self._filter
+
+    def __call__(self, value):
+        if not self.filter_path:
+            return
+        if value in self.get_filter():
+            raise ValidationError(self.message)
+
+
 validate_length = LengthValidator(PASSWORD_MIN_LENGTH, PASSWORD_MAX_LENGTH)
 complexity = ComplexityValidator(PASSWORD_COMPLEXITY)
 dictionary_words = DictionaryValidator(dictionary=PASSWORD_DICTIONARY)
-common_sequences = CommonSequenceValidator(PASSWORD_COMMON_SEQUENCES)
\ No newline at end of file
+common_sequences = CommonSequenceValidator(PASSWORD_COMMON_SEQUENCES)
+breached_passwords = BreachedPasswordValidator(PASSWORD_BREACHED_FILTER)
@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import permissions
 from serializers import *
+from hashing import metrics as hashing_metrics, HashingTimeout
+from throttling import LoginRateThrottle
 
 LOGGER = logging.getLogger(__name__)
 
@@ -12,15 +14,34 @@ class RegistrationView(APIView):
     def post(self,request,format='json'):
         user = RegistrationSerializer(data=request.data)
         if user.is_valid():
-            user.save()
+            try:
+                user.save()
+            except HashingTimeout:
+                return Response({'errors':['Registration is unavailable. Please try again shortly']},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
             LOGGER.info("New user %s registered!",user)
             return Response(user.validated_data,status=status.HTTP_201_CREATED)
         return Response(user.errors,status=status.HTTP_400_BAD_REQUEST)
 
 class LoginView(APIView):
     """View for handling login with Token authentication. Also checks account has been email-verified."""
+    throttle_classes = (LoginRateThrottle,)
     def post(self,request,format='json'):
         serializer = LoginSerializer(data=request.data)
+        try:
+            valid = serializer.is_valid()
+        except HashingTimeout:
+            # Too many logins at once to check this password in time
+            return Response({'errors':['Login is unavailable. Please try again shortly']},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if valid:
+            return Response(serializer.validated_data,status=status.HTTP_200_OK)
+        return Response(serializer.errors,status=status.HTTP_401_UNAUTHORIZED)
+
+class TokenRefreshView(APIView):
+    """View which exchanges a refresh token for a new access token and refresh token"""
+    def post(self,request,format='json'):
+        serializer = TokenRefreshSerializer(data=request.data)
         if serializer.is_valid():
             return Response(serializer.validated_data,status=status.HTTP_200_OK)
         return Response(serializer.errors,status=status.HTTP_401_UNAUTHORIZED)
@@ -68,9 +89,18 @@ class UserUpdateView(APIView):
         # Dont want to allow change of username
         if 'username' in request.data:
             raise ValidationError("Change of username is not allowed")
-        serializer = UserModelSerializer(request.user,data=request.data,partial=True)
+        # request.user only has the fields cached with the auth token loaded, so update a fully loaded copy
+        user = User.objects.get(pk=request.user.pk)
+        serializer = UserModelSerializer(user,data=request.data,partial=True)
         if serializer.is_valid():
             serializer.save()
             LOGGER.info("User %s updated their details.",self.request.user)
             return Response(serializer.validated_data,status.HTTP_200_OK)
-        return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
+
+
+class HashingMetricsView(APIView):
+    """Password hashing throughput and latency for this process, for staff only"""
+    permission_classes = (permissions.IsAdminUser,)
+    def get(self,request,format='json'):
+        return Response(hashing_metrics.as_dict(),status=status.HTTP_200_OK)
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from models import BraintreeUser
+from models import BraintreeUser, SubscriptionNotification
 
 # Register your models here.
-admin.site.register(BraintreeUser)
\ No newline at end of file
+admin.site.register(BraintreeUser)
+admin.site.register(SubscriptionNotification)
\ No newline at end of file
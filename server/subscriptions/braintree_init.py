@@ -1,9 +1,12 @@
 '''
 Start up Braintree with provided config. Should be called once when server is started. Could achieve this by importing
-this module in Django settings for example.
+this module in Django settings for example. Calls go through the pooled transport in transport.py.
 '''
 import braintree
 
+import settings
+from transport import PooledHttp
+
 # Currently set to sandbox credentials
 BRAINTREE_MERCHANT_ID_UK = 'p3wtkd4pvzgx7sw9'
 BRAINTREE_PUBLIC_KEY = 'yzkprcnmyd2p5tfv'
@@ -12,4 +15,6 @@ BRAINTREE_PRIVATE_KEY = '0848b85d1d77eee1a2155168536e1dc5'
 braintree.Configuration.configure(braintree.Environment.Sandbox,
                                   merchant_id=BRAINTREE_MERCHANT_ID_UK,
                                   public_key=BRAINTREE_PUBLIC_KEY,
-                                  private_key=BRAINTREE_PRIVATE_KEY)
\ No newline at end of file
+                                  private_key=BRAINTREE_PRIVATE_KEY,
+                                  timeout=settings.BRAINTREE_TIMEOUT,
+                                  http_strategy=PooledHttp)
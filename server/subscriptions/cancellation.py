@@ -0,0 +1,155 @@
+"""
+Cancellation of subscriptions which are pending cancel, as a checkpointed batch job. Subscriptions due for cancelling
+are first queued as PendingCancelJob rows, then worked through batch_size jobs at a time: the Braintree calls for a
+batch are made concurrently on a thread pool, and the outcome is written back in one transaction with QuerySet.update.
+Each committed batch is a checkpoint, so a run which crashes or times out is resumed from the jobs still pending.
+
+Retrying is safe. Braintree refuses to cancel a subscription twice, so when a cancel is refused the subscription is
+fetched, and one which is already cancelled (say by a run which crashed before recording it) counts as done. Jobs whose
+user has renewed, or whose subscription has changed, since they were queued are skipped rather than cancelled.
+"""
+import time
+import logging
+from multiprocessing.pool import ThreadPool
+
+import braintree
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+import settings
+from entitlement_cache import invalidate_entitlement
+from gateway import get_gateway
+from mirror import mark_cancelled
+from models import BraintreeUser, PendingCancelJob
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CancellationReport(object):
+    """Outcome of a run of cancel jobs"""
+
+    def __init__(self):
+        self.cancelled = 0
+        self.skipped = 0
+        self.failed = 0
+        self.elapsed = 0.0
+        self.failures = []
+
+    def __str__(self):
+        return ("Cancelled %s subscriptions in %.1fs: %s skipped, %s failed"
+                % (self.cancelled, self.elapsed, self.skipped, self.failed))
+
+
+def queue_cancellations(braintree_users):
+    """
+    Queue a cancel job for each of the BraintreeUsers which hasn't got a pending or done one already. Jobs which were
+    skipped (the user renewed, then cancelled again) or gave up are queued again. Returns the number queued
+    """
+    braintree_users = [braintree_user for braintree_user in braintree_users if braintree_user.subscription_id]
+    existing = dict(((braintree_user_id, subscription_id), (pk, status))
+                    for pk, braintree_user_id, subscription_id, status in PendingCancelJob.objects
+                    .filter(braintree_user__in=[braintree_user.pk for braintree_user in braintree_users])
+                    .values_list('pk', 'braintree_user_id', 'subscription_id', 'status'))
+    jobs = []
+    requeue = []
+    for braintree_user in braintree_users:
+        pk, status = existing.get((braintree_user.pk, braintree_user.subscription_id), (None, None))
+        if pk is None:
+            jobs.append(PendingCancelJob(braintree_user=braintree_user, subscription_id=braintree_user.subscription_id))
+        elif status in (PendingCancelJob.SKIPPED, PendingCancelJob.FAILED):
+            requeue.append(pk)
+    requeued = 0
+    if requeue:
+        requeued = PendingCancelJob.objects \
+            .filter(pk__in=requeue, status__in=(PendingCancelJob.SKIPPED, PendingCancelJob.FAILED)) \
+            .update(status=PendingCancelJob.PENDING, attempts=0, last_error='', time_completed=None)
+    try:
+        with transaction.atomic():
+            PendingCancelJob.objects.bulk_create(jobs)
+    except IntegrityError:
+        # Another run queued some of them first
+        for job in jobs:
+            PendingCancelJob.objects.get_or_create(braintree_user=job.braintree_user,
+                                                   subscription_id=job.subscription_id)
+    return len(jobs) + requeued
+
+
+def _cancel(args):
+    """Runs in a pool thread. Returns (job pk, error), error is None when the subscription is cancelled"""
+    gateway, pk, subscription_id = args
+    try:
+        result = gateway.cancel_subscription(subscription_id)
+        if result.is_success:
+            return pk, None
+        if gateway.find_subscription(subscription_id).status == braintree.Subscription.Status.Canceled:
+            return pk, None
+        return pk, 'Braintree refused to cancel: %s' % getattr(result, 'message', '')
+    except Exception as e:
+        return pk, '%s: %s' % (e.__class__.__name__, e)
+
+
+def _record(report, jobs, stale, results):
+    """Write the outcome of a batch back in one transaction. Returns the ids of the users whose subscription ended"""
+    jobs = dict((job.pk, job) for job in jobs)
+    done = [pk for pk, error in results if error is None]
+    now = timezone.now()
+    with transaction.atomic():
+        if done:
+            PendingCancelJob.objects.filter(pk__in=done).update(status=PendingCancelJob.DONE, time_completed=now)
+            BraintreeUser.objects.filter(pk__in=[jobs[pk].braintree_user_id for pk in done]) \
+                .update(active=False, subscription_id="", pending_cancel=False, expiry_date=None)
+            mark_cancelled([jobs[pk].subscription_id for pk in done])
+        if stale:
+            PendingCancelJob.objects.filter(pk__in=[job.pk for job in stale]) \
+                .update(status=PendingCancelJob.SKIPPED, time_completed=now)
+        for pk, error in results:
+            if error is None:
+                continue
+            job = jobs[pk]
+            attempts = job.attempts + 1
+            gave_up = attempts >= settings.CANCEL_MAX_ATTEMPTS
+            status = PendingCancelJob.FAILED if gave_up else PendingCancelJob.PENDING
+            PendingCancelJob.objects.filter(pk=pk).update(attempts=attempts, last_error=error, status=status)
+            if gave_up:
+                LOGGER.error("Could not cancel subscription %s on braintree after %s attempts. Needs to be done "
+                             "manually! %s", job.subscription_id, attempts, error)
+            report.failed += 1
+            report.failures.append((job.braintree_user_id, job.subscription_id, error))
+    report.cancelled += len(done)
+    report.skipped += len(stale)
+    return [jobs[pk].braintree_user.user_id for pk in done]
+
+
+def process_cancel_jobs(workers=None, batch_size=None, gateway=None):
+    """Work through every pending cancel job. Returns a CancellationReport"""
+    workers = workers or settings.CANCEL_WORKERS
+    batch_size = batch_size or settings.CANCEL_BATCH_SIZE
+    gateway = gateway or get_gateway()
+
+    report = CancellationReport()
+    start = time.time()
+    last_pk = 0
+    pool = ThreadPool(workers)
+    try:
+        while True:
+            jobs = list(PendingCancelJob.objects.filter(status=PendingCancelJob.PENDING, pk__gt=last_pk)
+                        .select_related('braintree_user').order_by('pk')[:batch_size])
+            if not jobs:
+                break
+            last_pk = jobs[-1].pk
+            stale = [job for job in jobs if not job.braintree_user.pending_cancel
+                     or job.braintree_user.subscription_id != job.subscription_id]
+            live = [job for job in jobs if job not in stale]
+            results = pool.map(_cancel, [(gateway, job.pk, job.subscription_id) for job in live])
+            for user_id in _record(report, jobs, stale, results):
+                # The rows were changed with update(), which sends no signals
+                invalidate_entitlement(user_id)
+            if len(jobs) < batch_size:
+                break
+    finally:
+        pool.close()
+        pool.join()
+
+    report.elapsed = time.time() - start
+    LOGGER.info("Pending cancel jobs: %s", report)
+    return report
@@ -0,0 +1,93 @@
+"""
+Circuit breaker for calls to Braintree. When Braintree degrades every call waits out its timeout, and enough of those
+tie up every web worker. The breaker trips open after BRAINTREE_BREAKER_FAILURES consecutive calls which failed or took
+longer than BRAINTREE_BREAKER_SLOW_CALL seconds, and while it is open calls are refused straight away. After
+BRAINTREE_BREAKER_RESET seconds it lets a single probe call through (half open): if that succeeds the breaker closes
+again, otherwise it stays open for another BRAINTREE_BREAKER_RESET.
+
+The breaker is per process, like the rest of the Braintree transport state.
+"""
+import time
+import logging
+from threading import Lock
+
+import settings
+
+LOGGER = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+    """Thread safe circuit breaker. Ask allow() before each call and record() its outcome afterwards"""
+
+    def __init__(self, failure_threshold=None, slow_call=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold or settings.BRAINTREE_BREAKER_FAILURES
+        self.slow_call = slow_call or settings.BRAINTREE_BREAKER_SLOW_CALL
+        self.reset_timeout = reset_timeout or settings.BRAINTREE_BREAKER_RESET
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probing = False
+            self.trips = 0
+            self.rejected = 0
+
+    @property
+    def is_open(self):
+        """Whether calls are being refused, i.e. open and not yet due a probe"""
+        with self._lock:
+            return self.state == OPEN and time.time() - self.opened_at < self.reset_timeout
+
+    def allow(self):
+        """Whether a call may be made now. Once open, lets one probe through every reset_timeout"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, elapsed, failed=False):
+        """Record the outcome of an allowed call. Calls slower than slow_call count as failures"""
+        failed = failed or elapsed > self.slow_call
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._trip()
+                else:
+                    LOGGER.warning("Braintree circuit breaker closed again")
+                    self.state = CLOSED
+                    self.consecutive_failures = 0
+            elif failed:
+                self.consecutive_failures += 1
+                if self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                    self._trip()
+            else:
+                self.consecutive_failures = 0
+
+    def _trip(self):
+        LOGGER.error("Braintree circuit breaker open after %s failed or slow calls", self.consecutive_failures)
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.trips += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
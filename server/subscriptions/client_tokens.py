@@ -0,0 +1,147 @@
+"""
+Pool of pre-generated Braintree client tokens for the checkout page. Generating a token is a round trip to Braintree,
+so GenerateClientTokenView takes one from this pool instead, and a background thread keeps the pool topped up to
+CLIENT_TOKEN_POOL_SIZE. Tokens are only handed out within CLIENT_TOKEN_MAX_AGE of being generated, comfortably inside
+the time Braintree accepts them for. If the pool runs dry a token is generated on the spot, as before. Tokens are
+generated through the circuit breaker, and the refill thread waits while the breaker is open.
+
+The pool is per process and the refill thread is started on first use, so it runs after any web server fork. A
+CLIENT_TOKEN_POOL_SIZE of 0 turns the pool off.
+"""
+import time
+import logging
+from collections import deque
+from threading import Lock, Thread, Event
+
+import settings
+from gateway import get_gateway
+from subscription_manager import SubscriptionManager, breaker
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ClientTokenPool(object):
+    """Thread safe pool of (token, time generated) pairs, refilled by a background thread"""
+
+    def __init__(self, size=None, max_age=None, low_water=None, generate=None):
+        self.size = settings.CLIENT_TOKEN_POOL_SIZE if size is None else size
+        self.max_age = max_age or settings.CLIENT_TOKEN_MAX_AGE
+        self.low_water = settings.CLIENT_TOKEN_LOW_WATER if low_water is None else low_water
+        self.generate = generate or (lambda: get_gateway().generate_client_token())
+        self._tokens = deque()
+        self._lock = Lock()
+        self._wanted = Event()
+        self._thread = None
+        self._stop = Event()
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.generated = 0
+            self.expired = 0
+            self.failures = 0
+
+    def _discard_expired(self, now):
+        while self._tokens and now - self._tokens[0][1] > self.max_age:
+            self._tokens.popleft()
+            self.expired += 1
+
+    def pop(self):
+        """A client token, from the pool if it has one. Raises whatever the gateway raises if one has to be generated"""
+        if self.size <= 0:
+            return self._generate()
+        self._start()
+        with self._lock:
+            self._discard_expired(time.time())
+            token = self._tokens.pop()[0] if self._tokens else None
+            if token is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if len(self._tokens) <= self.low_water:
+                self._wanted.set()
+        if token is None:
+            token = self._generate()
+        return token
+
+    def _generate(self):
+        return SubscriptionManager.call_braintree(self.generate)
+
+    def fill(self):
+        """Generate tokens until the pool is full. Returns the number generated"""
+        generated = 0
+        while True:
+            with self._lock:
+                self._discard_expired(time.time())
+                if len(self._tokens) >= self.size:
+                    return generated
+            try:
+                token = self._generate()
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                LOGGER.exception("Could not generate a Braintree client token for the pool")
+                return generated
+            with self._lock:
+                # Newest tokens are handed out first; the oldest age out from the left
+                self._tokens.append((token, time.time()))
+                self.generated += 1
+            generated += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wanted.wait(settings.CLIENT_TOKEN_REFILL_INTERVAL)
+            if self._stop.is_set():
+                return
+            if breaker.is_open:
+                # Braintree is down and every call would be refused. Leave _wanted set to fill once it closes
+                self._stop.wait(settings.CLIENT_TOKEN_REFILL_INTERVAL)
+                continue
+            self._wanted.clear()
+            failures = self.failures
+            self.fill()
+            if self.failures > failures:
+                # Braintree is struggling; don't retry in a tight loop
+                self._stop.wait(settings.CLIENT_TOKEN_REFILL_INTERVAL)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = Thread(target=self._run, name='client-token-pool')
+            self._thread.daemon = True
+            self._wanted.set()
+            self._thread.start()
+
+    def stop(self):
+        """Stop the refill thread, if it was started. It is started again on next use"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wanted.set()
+            thread.join()
+            self._stop.clear()
+
+    def as_dict(self):
+        with self._lock:
+            self._discard_expired(time.time())
+            requests = self.hits + self.misses
+            return {
+                'size': self.size,
+                'available': len(self._tokens),
+                'fill_level': float(len(self._tokens)) / self.size if self.size else 0.0,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / requests if requests else 0.0,
+                'generated': self.generated,
+                'expired': self.expired,
+                'failures': self.failures,
+            }
+
+
+client_tokens = ClientTokenPool()
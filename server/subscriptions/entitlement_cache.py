@@ -0,0 +1,39 @@
+"""
+Shared cache of subscription entitlements, keyed by user id. Each entry holds the (active, expiry_date) pair from the
+user's BraintreeUser and lives no longer than ENTITLEMENT_CACHE_TIMEOUT or the subscription's expiry, whichever comes
+first. Entries are dropped whenever a BraintreeUser is saved or deleted (see signal_receivers), so callers which change
+rows without save() must call invalidate_entitlement themselves.
+"""
+from django.core.cache import cache
+from django.utils import timezone
+
+import settings
+
+ENTITLEMENT_CACHE_KEY = 'subscriptions:entitlement:%s'
+
+
+def get_entitlement(user_id):
+    """Returns the cached (active, expiry_date) pair for the user, or None if it isn't cached"""
+    return cache.get(ENTITLEMENT_CACHE_KEY % user_id)
+
+
+def store_entitlement(user_id, braintree_user):
+    """Cache the entitlement held by the given BraintreeUser (None for users without one) and return it"""
+    if braintree_user is None:
+        entitlement = (False, None)
+    else:
+        entitlement = (braintree_user.active, braintree_user.expiry_date)
+
+    timeout = settings.ENTITLEMENT_CACHE_TIMEOUT
+    expiry_date = entitlement[1]
+    if expiry_date is not None:
+        seconds_to_expiry = int((expiry_date - timezone.now()).total_seconds())
+        timeout = min(timeout, seconds_to_expiry)
+    if timeout > 0:
+        cache.set(ENTITLEMENT_CACHE_KEY % user_id, entitlement, timeout)
+    return entitlement
+
+
+def invalidate_entitlement(user_id):
+    """Forget the cached entitlement for the user"""
+    cache.delete(ENTITLEMENT_CACHE_KEY % user_id)
@@ -0,0 +1,40 @@
+"""
+Resolves which tier of content a user is entitled to. The tier is looked up at most once per request and memoized on
+the user object, so views and permission classes can ask as often as they like without repeating the BraintreeUser
+query.
+"""
+from rest_framework import permissions
+
+from subscription_manager import SubscriptionManager
+
+TIER_FREE = 'free'
+TIER_SUBSCRIBER = 'subscriber'
+TIER_STAFF = 'staff'
+
+ENTITLEMENT_ATTR = '_subscription_tier'
+
+
+def get_subscription_tier(user):
+    """Returns the tier the user is entitled to, memoized on the user for the rest of the request"""
+    tier = getattr(user, ENTITLEMENT_ATTR, None)
+    if tier is None:
+        if user.is_staff:
+            tier = TIER_STAFF
+        elif SubscriptionManager.can_user_access_subscription_content(user):
+            tier = TIER_SUBSCRIBER
+        else:
+            tier = TIER_FREE
+        setattr(user, ENTITLEMENT_ATTR, tier)
+    return tier
+
+
+def can_access_subscription_content(user):
+    """True if the user may see restricted content"""
+    return get_subscription_tier(user) != TIER_FREE
+
+
+class HasSubscriptionAccess(permissions.BasePermission):
+    """Allows access only to staff and users with an active subscription"""
+
+    def has_permission(self, request, view):
+        return request.user and request.user.is_authenticated() and can_access_subscription_content(request.user)
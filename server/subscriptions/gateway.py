@@ -0,0 +1,181 @@
+"""
+Gateway between the subscriptions app and Braintree. BraintreeGateway forwards to the module level braintree API (so
+anything stubbing braintree.* in tests still applies), and FakeBraintreeGateway keeps subscriptions in memory so batch
+jobs such as reconciliation can be run and tested offline.
+
+The gateway in use is chosen by the BRAINTREE_GATEWAY setting (a dotted path), and can be swapped at runtime with
+set_gateway.
+"""
+import time
+from threading import Lock
+
+import braintree
+from braintree.exceptions.not_found_error import NotFoundError
+from braintree.subscription_search import SubscriptionSearch
+from braintree.util.constants import Constants
+from django.utils.module_loading import import_string
+
+import settings
+
+
+ALL_STATUSES = Constants.get_all_constant_values_from_class(braintree.Subscription.Status)
+
+
+class BraintreeGateway(object):
+    """The real Braintree API"""
+
+    def find_subscription(self, subscription_id):
+        return braintree.Subscription.find(subscription_id)
+
+    def search_subscriptions(self, statuses=ALL_STATUSES):
+        """
+        Every subscription with one of the given statuses. Braintree returns the matching ids in one call and the
+        subscriptions themselves a page at a time as the results are iterated.
+        """
+        return braintree.Subscription.search(SubscriptionSearch.status.in_list(list(statuses)))
+
+    def cancel_subscription(self, subscription_id):
+        return braintree.Subscription.cancel(subscription_id)
+
+    def find_plans(self):
+        return braintree.Plan.all()
+
+    def generate_client_token(self):
+        return braintree.ClientToken.generate()
+
+    def create_customer(self, params):
+        return braintree.Customer.create(params)
+
+
+class FakeSubscription(object):
+    """Just enough of a braintree.Subscription for the fake gateway"""
+
+    def __init__(self, subscription_id, status, billing_period_end_date=None, **kwargs):
+        self.id = subscription_id
+        self.status = status
+        self.billing_period_end_date = billing_period_end_date
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+class FakePlan(object):
+    """Just enough of a braintree.Plan for the fake gateway"""
+
+    def __init__(self, plan_id, price, billing_frequency, **kwargs):
+        self.id = plan_id
+        self.price = price
+        self.billing_frequency = billing_frequency
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+class FakeCustomer(object):
+    """Just enough of a braintree.Customer for the fake gateway"""
+
+    def __init__(self, customer_id, **kwargs):
+        self.id = customer_id
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+class FakeResult(object):
+    def __init__(self, is_success, subscription=None, customer=None):
+        self.is_success = is_success
+        self.subscription = subscription
+        self.customer = customer
+
+
+class FakeBraintreeGateway(object):
+    """
+    In memory stand in for Braintree. Subscriptions are added with add_subscription. Every call can be slowed down by
+    a fixed latency, and calls for subscription ids (or customer emails) in failing_ids raise as if Braintree were
+    unreachable.
+    """
+
+    def __init__(self, latency=0, failing_ids=(), page_size=50):
+        self.latency = latency
+        self.page_size = page_size
+        self.failing_ids = set(failing_ids)
+        self.subscriptions = {}
+        self.plans = []
+        self.customers = {}
+        self.tokens_generated = 0
+        self.calls = 0
+        self._lock = Lock()
+
+    def add_subscription(self, subscription_id, status, billing_period_end_date=None, **kwargs):
+        subscription = FakeSubscription(subscription_id, status, billing_period_end_date, **kwargs)
+        self.subscriptions[subscription_id] = subscription
+        return subscription
+
+    def add_plan(self, plan_id, price, billing_frequency, **kwargs):
+        plan = FakePlan(plan_id, price, billing_frequency, **kwargs)
+        self.plans.append(plan)
+        return plan
+
+    def _call(self, subscription_id):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if subscription_id in self.failing_ids:
+            raise IOError("Could not reach fake Braintree for subscription %s" % subscription_id)
+
+    def find_subscription(self, subscription_id):
+        self._call(subscription_id)
+        try:
+            return self.subscriptions[subscription_id]
+        except KeyError:
+            raise NotFoundError("Subscription %s not found" % subscription_id)
+
+    def search_subscriptions(self, statuses=ALL_STATUSES):
+        """Pages through the matching subscriptions as Braintree does, one call for the ids and one per page"""
+        self._call(None)
+        matches = [subscription for subscription in self.subscriptions.values() if subscription.status in statuses]
+        for i in range(0, len(matches), self.page_size):
+            self._call(None)
+            for subscription in matches[i:i + self.page_size]:
+                yield subscription
+
+    def cancel_subscription(self, subscription_id):
+        self._call(subscription_id)
+        subscription = self.subscriptions.get(subscription_id)
+        if subscription is None or subscription.status == braintree.Subscription.Status.Canceled:
+            return FakeResult(False)
+        subscription.status = braintree.Subscription.Status.Canceled
+        return FakeResult(True, subscription)
+
+    def find_plans(self):
+        self._call(None)
+        return list(self.plans)
+
+    def generate_client_token(self):
+        self._call(None)
+        with self._lock:
+            self.tokens_generated += 1
+            return 'fake-client-token-%s' % self.tokens_generated
+
+    def create_customer(self, params):
+        self._call(params.get('email'))
+        with self._lock:
+            customer = FakeCustomer('fake-customer-%s' % (len(self.customers) + 1), **params)
+            self.customers[customer.id] = customer
+        return FakeResult(True, customer=customer)
+
+
+_gateway = None
+
+
+def get_gateway():
+    """The gateway in use, created from the BRAINTREE_GATEWAY setting on first use"""
+    global _gateway
+    if _gateway is None:
+        _gateway = import_string(settings.BRAINTREE_GATEWAY)()
+    return _gateway
+
+
+def set_gateway(gateway):
+    """Use the given gateway from now on (None goes back to the configured one). Returns the previous gateway"""
+    global _gateway
+    previous, _gateway = _gateway, gateway
+    return previous
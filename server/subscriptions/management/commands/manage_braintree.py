@@ -1,6 +1,8 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from optparse import make_option
+from subscriptions.gateway import ALL_STATUSES
 from subscriptions.managers import SubscriptionStatusManager as manager
+from subscriptions.webhooks import sweep
 
 
 
@@ -16,9 +18,68 @@ class Command(BaseCommand):
                     default=1,
                     help='Set how many days a subscription must be from expiring before it is cancelled (default 1)'
         ),
+        make_option("-w",
+                    "--workers",
+                    action="store",
+                    type="int",
+                    dest="workers",
+                    default=None,
+                    help='Number of concurrent calls to Braintree while synchronizing'
+        ),
+        make_option("-t",
+                    "--timeout",
+                    action="store",
+                    type="float",
+                    dest="timeout",
+                    default=None,
+                    help='Give up on Braintree if no call completes within this many seconds'
+        ),
+        make_option("-b",
+                    "--batch-size",
+                    action="store",
+                    type="int",
+                    dest="batch_size",
+                    default=None,
+                    help='Number of changed subscriptions saved per transaction'
+        ),
+        make_option("--search",
+                    action="store_true",
+                    dest="search",
+                    default=False,
+                    help='Synchronize by paging through Braintree\'s subscription search rather than one call per user'
+        ),
+        make_option("--status",
+                    action="append",
+                    type="choice",
+                    choices=ALL_STATUSES,
+                    dest="statuses",
+                    default=None,
+                    help='With --search, only fetch subscriptions with this status. May be given more than once '
+                         '(choices: %s)' % ', '.join(ALL_STATUSES)
+        ),
+        make_option("--sweep",
+                    action="store_true",
+                    dest="sweep",
+                    default=False,
+                    help='Only check subscriptions which may have drifted despite webhooks, for frequent runs'
+        ),
     )
 
 
     def handle(self, *args, **options):
-        manager.match_braintree_state()
-        manager.cancel_all_pending_cancel(days_left=options['days_til_cancel'])
\ No newline at end of file
+        if options['statuses'] and not options['search']:
+            raise CommandError("--status can only be used with --search")
+        if options['sweep']:
+            report = sweep(workers=options['workers'], timeout=options['timeout'], batch_size=options['batch_size'])
+        else:
+            report = manager.match_braintree_state(workers=options['workers'], timeout=options['timeout'],
+                                                   batch_size=options['batch_size'], search=options['search'],
+                                                   statuses=options['statuses'])
+        self.stdout.write(str(report))
+        for pk, subscription_id, error in report.failures:
+            self.stderr.write("BraintreeUser %s (subscription %s): %s" % (pk, subscription_id, error))
+        report = manager.cancel_all_pending_cancel(days_left=options['days_til_cancel'], workers=options['workers'],
+                                                   batch_size=options['batch_size'])
+        self.stdout.write(str(report))
+        for user_pk, subscription_id, error in report.failures:
+            self.stderr.write("Cancel of subscription %s failed: %s" % (subscription_id, error))
@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from subscriptions import settings
+from subscriptions.webhooks import process_notifications
+
+
+
+class Command(BaseCommand):
+    help = 'Apply the subscription webhooks waiting in the inbox'
+
+    option_list = BaseCommand.option_list + (
+        make_option("-b",
+                    "--batch-size",
+                    action="store",
+                    type="int",
+                    dest="batch_size",
+                    default=settings.WEBHOOK_BATCH_SIZE,
+                    help='Number of notifications to apply per batch (default %s)' % settings.WEBHOOK_BATCH_SIZE
+        ),
+        make_option("-w",
+                    "--watch",
+                    action="store_true",
+                    dest="watch",
+                    default=False,
+                    help='Keep running as a worker, checking the inbox every --interval seconds'
+        ),
+        make_option("-i",
+                    "--interval",
+                    action="store",
+                    type="int",
+                    dest="interval",
+                    default=5,
+                    help='Seconds between checks when running with --watch (default 5)'
+        ),
+    )
+
+
+    def handle(self, *args, **options):
+        while True:
+            report = process_notifications(batch_size=options['batch_size'])
+            self.stdout.write(str(report))
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
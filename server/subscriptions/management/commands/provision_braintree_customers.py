@@ -0,0 +1,65 @@
+import time
+import logging
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from optparse import make_option
+from subscriptions import settings
+from subscriptions.provisioning import provision_customers
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Create the Braintree customers queued for newly registered users'
+
+    option_list = BaseCommand.option_list + (
+        make_option("-b",
+                    "--batch-size",
+                    action="store",
+                    type="int",
+                    dest="batch_size",
+                    default=settings.CUSTOMER_PROVISIONING_BATCH_SIZE,
+                    help='Number of jobs to claim per batch (default %s)' % settings.CUSTOMER_PROVISIONING_BATCH_SIZE
+        ),
+        make_option("-t",
+                    "--threads",
+                    action="store",
+                    type="int",
+                    dest="workers",
+                    default=settings.CUSTOMER_PROVISIONING_WORKERS,
+                    help='Number of concurrent calls to Braintree (default %s)'
+                         % settings.CUSTOMER_PROVISIONING_WORKERS
+        ),
+        make_option("-w",
+                    "--watch",
+                    action="store_true",
+                    dest="watch",
+                    default=False,
+                    help='Keep running as a worker, checking for new jobs every --interval seconds'
+        ),
+        make_option("-i",
+                    "--interval",
+                    action="store",
+                    type="int",
+                    dest="interval",
+                    default=5,
+                    help='Seconds between checks when running with --watch (default 5)'
+        ),
+    )
+
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                report = provision_customers(batch_size=options['batch_size'], workers=options['workers'])
+                self.stdout.write(str(report))
+            except Exception as e:
+                if not options['watch']:
+                    raise
+                # Keep the worker going; claimed jobs are picked up again once their claim times out
+                LOGGER.exception("Customer provisioning run failed")
+                self.stderr.write("Customer provisioning run failed: %s" % e)
+                close_old_connections()
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
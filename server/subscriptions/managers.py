@@ -1,5 +1,7 @@
 import logging
 from subscription_manager import *
+from reconciliation import reconcile_subscriptions, reconcile_by_search
+from cancellation import queue_cancellations, process_cancel_jobs
 
 LOGGER = logging.getLogger(__name__)
 
@@ -7,47 +9,30 @@ class SubscriptionStatusManager():
     """Manager for accessing subscription statuses"""
 
     @classmethod
-    def match_braintree_state(cls):
+    def match_braintree_state(cls, workers=None, timeout=None, batch_size=None, search=False, statuses=None):
         """
-        Update all braintree customer info to make them synchronous with braintree
+        Update all braintree customer info to make them synchronous with braintree. Subscriptions are fetched
+        concurrently, or with search=True through Braintree's subscription search, see reconciliation.py. A search
+        can be restricted to subscriptions with the given statuses.
+        Returns a ReconciliationReport
         """
-        # Find all created subscriptions
-        subscribed_users = BraintreeUser.objects.exclude(subscription_id="").exclude(subscription_id=None)
-        for user in subscribed_users:
-            try:
-                subscription = SubscriptionManager.fetch_subscription_from_braintree(user)
-                if SubscriptionManager.is_braintree_subscription_active(subscription):
-                    user.active = True
-                    user.expiry_date = subscription.billing_period_end_date
-                elif SubscriptionManager.is_braintree_subscription_in_terminating_state(subscription):
-                    user.subscription_id = ""
-                    user.active = False
-                    user.expiry_date = None
-                    user.pending_cancel = False
-                else:
-                    user.active = False
-                    user.expiry_date = subscription.billing_period_end_date
-                user.save()
-            except BraintreeError as e:
-                LOGGER.exception("Could not match braintree state for user %s",user)
+        if search:
+            return reconcile_by_search(statuses=statuses, batch_size=batch_size)
+        return reconcile_subscriptions(workers=workers, timeout=timeout, batch_size=batch_size)
 
     @classmethod
-    def cancel_all_pending_cancel(cls, days_left=1):
+    def cancel_all_pending_cancel(cls, days_left=1, workers=None, batch_size=None):
         """
         Cancel all susbcriptions that are about to be renewed where a Pending Cancel state has been reached.
         Does this by selecting all subscriptions that would expire within days_left number of days AFTER the next billing date
-        :return:
+        These are queued as jobs and cancelled in checkpointed batches, see cancellation.py. Jobs left over from an
+        earlier run which didn't finish are picked up too.
+        :return: CancellationReport
         """
         threshold = timezone.make_aware(SubscriptionManager.construct_next_billing_datetime() +
                                         timezone.timedelta(days=days_left),pytz.utc)
 
         LOGGER.info("Threshold date for cancellation: %s",str(threshold))
         users_pending_cancel = BraintreeUser.objects.filter(pending_cancel=True).filter(expiry_date__lte=threshold)
-        for user in users_pending_cancel:
-            try:
-                SubscriptionManager.cancel_on_braintree(user)
-            except BraintreeError as e:
-                LOGGER.exception("Could not cancel subscription for %s on braintree. Needs to be done manually!",user)
-
-
-
+        queue_cancellations(users_pending_cancel)
+        return process_cancel_jobs(workers=workers, batch_size=batch_size)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0008_braintreeuser_pending_cancel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionNotification',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=64)),
+                ('subscription_id', models.CharField(max_length=36, db_index=True)),
+                ('timestamp', models.DateTimeField()),
+                ('payload', models.TextField()),
+                ('time_received', models.DateTimeField(default=django.utils.timezone.now)),
+                ('time_processed', models.DateTimeField(default=None, null=True, db_index=True, blank=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(default=b'', blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='subscriptionnotification',
+            unique_together=set([('kind', 'subscription_id', 'timestamp')]),
+        ),
+    ]
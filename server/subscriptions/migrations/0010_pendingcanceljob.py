@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0009_subscriptionnotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingCancelJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('subscription_id', models.CharField(max_length=36)),
+                ('status', models.CharField(default=b'pending', max_length=8, db_index=True, choices=[(b'pending', b'Pending'), (b'done', b'Done'), (b'skipped', b'Skipped'), (b'failed', b'Failed')])),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(default=b'', blank=True)),
+                ('time_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('time_completed', models.DateTimeField(default=None, null=True, blank=True)),
+                ('braintree_user', models.ForeignKey(related_name='cancel_jobs', to='subscriptions.BraintreeUser')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pendingcanceljob',
+            unique_together=set([('braintree_user', 'subscription_id')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0010_pendingcanceljob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionMirror',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('subscription_id', models.CharField(unique=True, max_length=36)),
+                ('status', models.CharField(max_length=32)),
+                ('billing_period_start_date', models.DateField(default=None, null=True, blank=True)),
+                ('billing_period_end_date', models.DateField(default=None, null=True, blank=True)),
+                ('created_at', models.DateTimeField(default=None, null=True, blank=True)),
+                ('price', models.DecimalField(default=None, null=True, max_digits=10, decimal_places=2, blank=True)),
+                ('time_refreshed', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
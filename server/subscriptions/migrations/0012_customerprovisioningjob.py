@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('subscriptions', '0011_subscriptionmirror'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerProvisioningJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('status', models.CharField(default=b'pending', max_length=8, db_index=True, choices=[(b'pending', b'Pending'), (b'done', b'Done'), (b'failed', b'Failed')])),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, db_index=True)),
+                ('last_error', models.TextField(default=b'', blank=True)),
+                ('time_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('time_completed', models.DateTimeField(default=None, null=True, blank=True)),
+                ('user', models.ForeignKey(related_name='customer_provisioning_jobs', to=settings.AUTH_USER_MODEL, unique=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
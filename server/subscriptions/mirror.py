@@ -0,0 +1,89 @@
+"""
+The local subscription mirror. Every time a subscription is fetched from Braintree (by reconciliation, by the webhook
+worker or by a live read in SubscriptionStatusView) its details are copied into SubscriptionMirror, so the status view
+can normally be served without calling Braintree. Mirrors older than SUBSCRIPTION_MIRROR_MAX_AGE aren't served, unless
+Braintree is unavailable.
+"""
+import datetime
+from decimal import Decimal, InvalidOperation
+
+import braintree
+from django.db import transaction
+from django.utils import timezone
+
+import settings
+from models import SubscriptionMirror
+
+
+def _date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value if isinstance(value, datetime.date) else None
+
+
+def _datetime(value):
+    if not isinstance(value, datetime.datetime):
+        return None
+    # Braintree gives times in UTC, without a time zone
+    return timezone.make_aware(value, timezone.utc) if timezone.is_naive(value) else value
+
+
+def _price(value):
+    try:
+        return Decimal(str(value)) if value is not None else None
+    except InvalidOperation:
+        return None
+
+
+def build_mirror(subscription, now=None):
+    """An unsaved SubscriptionMirror holding the details of a Braintree subscription"""
+    return SubscriptionMirror(subscription_id=subscription.id,
+                              status=subscription.status,
+                              billing_period_start_date=_date(getattr(subscription, 'billing_period_start_date', None)),
+                              billing_period_end_date=_date(getattr(subscription, 'billing_period_end_date', None)),
+                              created_at=_datetime(getattr(subscription, 'created_at', None)),
+                              price=_price(getattr(subscription, 'price', None)),
+                              time_refreshed=now or timezone.now())
+
+
+def replace_mirrors(subscriptions):
+    """Mirror a batch of subscriptions fetched from Braintree. Must be called inside a transaction"""
+    now = timezone.now()
+    mirrors = dict((subscription.id, build_mirror(subscription, now)) for subscription in subscriptions)
+    if mirrors:
+        SubscriptionMirror.objects.filter(subscription_id__in=list(mirrors)).delete()
+        SubscriptionMirror.objects.bulk_create(mirrors.values())
+
+
+def store_subscriptions(subscriptions):
+    """Mirror a batch of subscriptions fetched from Braintree, replacing what was held for them before"""
+    with transaction.atomic():
+        replace_mirrors(subscriptions)
+
+
+def store_subscription(subscription):
+    store_subscriptions([subscription])
+
+
+def mark_cancelled(subscription_ids):
+    """Record that subscriptions were cancelled on Braintree"""
+    SubscriptionMirror.objects.filter(subscription_id__in=list(subscription_ids)) \
+        .update(status=braintree.Subscription.Status.Canceled, time_refreshed=timezone.now())
+
+
+def get_fresh_mirror(subscription_id, max_age=None):
+    """The mirrored details of a subscription, or None if there are none recent enough"""
+    max_age = settings.SUBSCRIPTION_MIRROR_MAX_AGE if max_age is None else max_age
+    oldest = timezone.now() - datetime.timedelta(seconds=max_age)
+    try:
+        return SubscriptionMirror.objects.get(subscription_id=subscription_id, time_refreshed__gte=oldest)
+    except SubscriptionMirror.DoesNotExist:
+        return None
+
+
+def get_mirror(subscription_id):
+    """The mirrored details of a subscription however old, or None if there are none"""
+    try:
+        return SubscriptionMirror.objects.get(subscription_id=subscription_id)
+    except SubscriptionMirror.DoesNotExist:
+        return None
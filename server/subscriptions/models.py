@@ -34,4 +34,98 @@ class BraintreeUser(models.Model):
             + ", PendingCancel: " + str(self.pending_cancel) + ", ExpiryDate: " + str(self.expiry_date) + "}"
 
 
+class SubscriptionNotification(models.Model):
+    """
+    A subscription webhook received from Braintree, waiting to be applied. Notifications are verified and stored by
+    SubscriptionWebhookView, then applied in batches by process_notifications (see webhooks.py). Braintree retries
+    deliveries, so a notification seen twice is only stored once.
+    """
+    kind = models.CharField(max_length=64)
+    subscription_id = models.CharField(max_length=BRAINTREE_ID_LENGTH,db_index=True)
+    timestamp = models.DateTimeField()
+    payload = models.TextField()
+    time_received = models.DateTimeField(default=timezone.now)
+    time_processed = models.DateTimeField(null=True,default=None,blank=True,db_index=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True,default='')
+
+    class Meta:
+        unique_together = ('kind', 'subscription_id', 'timestamp')
+
+    def __str__(self):
+        return "SubscriptionNotification: {Kind: " + self.kind + ", SubscriptionID: " + self.subscription_id \
+            + ", Timestamp: " + str(self.timestamp) + ", Processed: " + str(self.time_processed) + "}"
+
+
+class PendingCancelJob(models.Model):
+    """
+    A subscription waiting to be cancelled on Braintree. Jobs are queued by cancel_all_pending_cancel and worked through
+    in batches by process_cancel_jobs (see cancellation.py); a run which stops partway is resumed from the jobs still
+    pending. A subscription has one job, which is queued again if it was skipped or gave up.
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (DONE, 'Done'), (SKIPPED, 'Skipped'), (FAILED, 'Failed'))
+
+    braintree_user = models.ForeignKey(BraintreeUser,related_name='cancel_jobs')
+    subscription_id = models.CharField(max_length=BRAINTREE_ID_LENGTH)
+    status = models.CharField(max_length=8,choices=STATUS_CHOICES,default=PENDING,db_index=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True,default='')
+    time_created = models.DateTimeField(default=timezone.now)
+    time_completed = models.DateTimeField(null=True,default=None,blank=True)
+
+    class Meta:
+        unique_together = ('braintree_user', 'subscription_id')
+
+    def __str__(self):
+        return "PendingCancelJob: {BraintreeUser: " + str(self.braintree_user_id) + ", SubscriptionID: " \
+            + self.subscription_id + ", Status: " + self.status + ", Attempts: " + str(self.attempts) + "}"
+
+
+class CustomerProvisioningJob(models.Model):
+    """
+    A newly registered user waiting for their Braintree Customer. Registration queues the job in its own transaction,
+    and provision_customers creates the customers in batches (see provisioning.py), retrying failures with backoff.
+    fetch_braintree_user creates the customer on the spot for a user whose job hasn't completed yet.
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+    user = models.ForeignKey(User,related_name='customer_provisioning_jobs',unique=True)
+    status = models.CharField(max_length=8,choices=STATUS_CHOICES,default=PENDING,db_index=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now,db_index=True)
+    last_error = models.TextField(blank=True,default='')
+    time_created = models.DateTimeField(default=timezone.now)
+    time_completed = models.DateTimeField(null=True,default=None,blank=True)
+
+    def __str__(self):
+        return "CustomerProvisioningJob: {User: " + str(self.user_id) + ", Status: " + self.status \
+            + ", Attempts: " + str(self.attempts) + "}"
+
+
+class SubscriptionMirror(models.Model):
+    """
+    Local copy of the details of a Braintree subscription, so they can be shown without calling Braintree. Kept up to
+    date by reconciliation, webhooks and live reads (see mirror.py). time_refreshed is when the details were last known
+    to match Braintree.
+    """
+    subscription_id = models.CharField(max_length=BRAINTREE_ID_LENGTH,unique=True)
+    status = models.CharField(max_length=32)
+    billing_period_start_date = models.DateField(null=True,default=None,blank=True)
+    billing_period_end_date = models.DateField(null=True,default=None,blank=True)
+    created_at = models.DateTimeField(null=True,default=None,blank=True)
+    price = models.DecimalField(max_digits=10,decimal_places=2,null=True,default=None,blank=True)
+    time_refreshed = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return "SubscriptionMirror: {SubscriptionID: " + self.subscription_id + ", Status: " + self.status \
+            + ", Refreshed: " + str(self.time_refreshed) + "}"
+
 
+from signal_receivers import * # Makes sure signal receivers are registered on startup
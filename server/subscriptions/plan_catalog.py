@@ -0,0 +1,112 @@
+"""
+Catalog of the subscription plans held by Braintree. Plans almost never change, so they are held in process memory
+and in the shared cache, and refreshed in a background thread once they are older than PLAN_CATALOG_REFRESH. Requests
+are always answered from what is held, however old, so they never wait on Braintree and keep working while it is
+down. Only a process which has no plans at all, and finds none in the shared cache either, waits for the first load,
+and then for at most PLAN_CATALOG_COLD_WAIT seconds.
+"""
+import time
+import logging
+from threading import Lock, Thread, Event
+
+from django.core.cache import cache
+
+import settings
+
+LOGGER = logging.getLogger(__name__)
+
+PLAN_CATALOG_CACHE_KEY = 'subscriptions:plan_catalog'
+
+
+class PlanCatalog(object):
+    """
+    Plans loaded by loader, a function returning a list of dicts with at least an 'id'. Entries are (plans, loaded_at)
+    pairs, loaded_at being a time.time() value.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self._entry = None
+        self._lock = Lock()
+        self._loading = None
+        self._last_failure = 0
+
+    def _from_shared_cache(self):
+        entry = cache.get(PLAN_CATALOG_CACHE_KEY)
+        if entry is not None:
+            with self._lock:
+                if self._entry is None or entry[1] > self._entry[1]:
+                    self._entry = entry
+        return entry
+
+    def refresh(self):
+        """Load the plans from Braintree now. Returns True if they were loaded"""
+        try:
+            plans = self.loader()
+        except Exception:
+            LOGGER.exception("Could not load the subscription plans from Braintree. Serving the plans held already.")
+            plans = None
+        if not plans:
+            self._last_failure = time.time()
+            return False
+        entry = (plans, time.time())
+        with self._lock:
+            self._entry = entry
+        cache.set(PLAN_CATALOG_CACHE_KEY, entry, settings.PLAN_CATALOG_TIMEOUT)
+        return True
+
+    def _refresh_in_background(self):
+        """Start a refresh unless one is running or one failed too recently. Returns an Event set when it finishes"""
+        with self._lock:
+            if self._loading is not None:
+                return self._loading
+            if time.time() - self._last_failure < settings.PLAN_CATALOG_RETRY:
+                return None
+            self._loading = done = Event()
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._loading = None
+                done.set()
+
+        thread = Thread(target=run, name='plan-catalog-refresh')
+        thread.daemon = True
+        thread.start()
+        return done
+
+    def plans(self):
+        """The plans held, starting a refresh if they are getting old. None if there are none yet"""
+        entry = self._entry or self._from_shared_cache()
+        if entry is None:
+            loading = self._refresh_in_background()
+            if loading is not None:
+                loading.wait(settings.PLAN_CATALOG_COLD_WAIT)
+            entry = self._entry
+            return entry[0] if entry else None
+        if time.time() - entry[1] > settings.PLAN_CATALOG_REFRESH:
+            # Another process may have refreshed the shared copy already
+            shared = self._from_shared_cache()
+            if shared is None or time.time() - shared[1] > settings.PLAN_CATALOG_REFRESH:
+                self._refresh_in_background()
+            entry = self._entry
+        return entry[0]
+
+    def get(self, plan_id=None):
+        """The plan with the given id, or the first plan if there is none with that id"""
+        plans = self.plans()
+        if not plans:
+            return None
+        for plan in plans:
+            if plan['id'] == plan_id:
+                return plan
+        return plans[0]
+
+    def clear(self):
+        """Forget the plans held, here and in the shared cache"""
+        with self._lock:
+            self._entry = None
+            self._last_failure = 0
+        cache.delete(PLAN_CATALOG_CACHE_KEY)
@@ -0,0 +1,162 @@
+"""
+Background creation of Braintree customers for new users. Registration used to create the customer inside its
+transaction, holding the transaction (and its row locks and connection) open for the whole round trip to Braintree.
+It now only queues a CustomerProvisioningJob in that transaction, and provision_customers creates the customers
+afterwards.
+
+Jobs are claimed a batch at a time (by pushing their next attempt past the claim timeout, so concurrent workers don't
+create the same customer twice), the Braintree calls for a batch are made on a thread pool, and the outcome is written
+back in one transaction. Failed jobs are retried with exponential backoff until CUSTOMER_PROVISIONING_MAX_ATTEMPTS is
+reached. A user who needs their customer before the job has run gets it from fetch_braintree_user.
+"""
+import time
+import logging
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+import settings
+from models import BraintreeUser, CustomerProvisioningJob
+from subscription_manager import SubscriptionManager
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ProvisioningReport(object):
+    """Outcome of a run of provisioning jobs"""
+
+    def __init__(self):
+        self.provisioned = 0
+        self.already_provisioned = 0
+        self.failed = 0
+        self.elapsed = 0.0
+        self.failures = []
+
+    def __str__(self):
+        return ("Created %s Braintree customers in %.1fs: %s already had one, %s failed"
+                % (self.provisioned, self.elapsed, self.already_provisioned, self.failed))
+
+
+def queue_customer_provisioning(user):
+    """Queue the creation of the user's Braintree customer. Call it in the transaction which creates the user"""
+    job, created = CustomerProvisioningJob.objects.get_or_create(user=user)
+    return job
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after the given number of failed attempts"""
+    return min(settings.CUSTOMER_PROVISIONING_RETRY_DELAY * 2 ** (attempts - 1),
+               settings.CUSTOMER_PROVISIONING_MAX_RETRY_DELAY)
+
+
+def claim_batch(batch_size):
+    """Reserve up to batch_size due jobs for this worker and return them"""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(CustomerProvisioningJob.objects.select_for_update().select_related('user')
+                    .filter(status=CustomerProvisioningJob.PENDING, next_attempt__lte=now)
+                    .order_by('next_attempt')[:batch_size])
+        if jobs:
+            CustomerProvisioningJob.objects.filter(pk__in=[job.pk for job in jobs]) \
+                .update(next_attempt=now + timedelta(seconds=settings.CUSTOMER_PROVISIONING_CLAIM_TIMEOUT))
+    return jobs
+
+
+def _provision(job):
+    """Runs in a pool thread. Returns (job pk, customer id, error), error is None when the customer was created"""
+    try:
+        customer_id = SubscriptionManager.create_braintree_customer(job.user)
+        if customer_id is None:
+            return job.pk, None, 'Braintree refused to create the customer'
+        return job.pk, customer_id, None
+    except Exception as e:
+        return job.pk, None, '%s: %s' % (e.__class__.__name__, e)
+
+
+def _save_braintree_user(user_id, customer_id):
+    """Save a user's new customer in a savepoint. Returns False if the user was given a customer meanwhile"""
+    try:
+        with transaction.atomic():
+            BraintreeUser.objects.create(user_id=user_id, customer_id=customer_id, active=False, pending_cancel=False)
+        return True
+    except IntegrityError:
+        return False
+
+
+def _record(report, jobs, already, results):
+    """
+    Write the outcome of a batch back in one transaction. Each BraintreeUser is saved in a savepoint of its own, so one
+    given a customer by fetch_braintree_user while the batch was running doesn't roll back the rest
+    """
+    jobs = dict((job.pk, job) for job in jobs)
+    now = timezone.now()
+    with transaction.atomic():
+        done = list(already)
+        # Users may have been given a customer by fetch_braintree_user while their job was running
+        existing = set(BraintreeUser.objects.filter(user__in=[jobs[pk].user_id for pk, customer_id, error in results])
+                       .values_list('user_id', flat=True))
+        provisioned = 0
+        for pk, customer_id, error in results:
+            if error is not None:
+                continue
+            done.append(pk)
+            if jobs[pk].user_id not in existing and _save_braintree_user(jobs[pk].user_id, customer_id):
+                provisioned += 1
+                continue
+            LOGGER.warning("User %s already has a Braintree customer. Customer %s is not used",
+                           jobs[pk].user_id, customer_id)
+            report.already_provisioned += 1
+        if done:
+            CustomerProvisioningJob.objects.filter(pk__in=done) \
+                .update(status=CustomerProvisioningJob.DONE, time_completed=now)
+        for pk, customer_id, error in results:
+            if error is None:
+                continue
+            attempts = jobs[pk].attempts + 1
+            gave_up = attempts >= settings.CUSTOMER_PROVISIONING_MAX_ATTEMPTS
+            status = CustomerProvisioningJob.FAILED if gave_up else CustomerProvisioningJob.PENDING
+            CustomerProvisioningJob.objects.filter(pk=pk).update(
+                attempts=attempts, last_error=error, status=status,
+                next_attempt=now + timedelta(seconds=retry_delay(attempts)))
+            if gave_up:
+                LOGGER.error("Could not create a Braintree customer for user %s after %s attempts: %s",
+                             jobs[pk].user_id, attempts, error)
+            else:
+                LOGGER.warning("Could not create a Braintree customer for user %s (attempt %s): %s",
+                               jobs[pk].user_id, attempts, error)
+            report.failed += 1
+            report.failures.append((jobs[pk].user_id, error))
+    report.provisioned += provisioned
+    report.already_provisioned += len(already)
+
+
+def provision_customers(batch_size=None, workers=None):
+    """Work through every provisioning job which is due. Returns a ProvisioningReport"""
+    batch_size = batch_size or settings.CUSTOMER_PROVISIONING_BATCH_SIZE
+    workers = workers or settings.CUSTOMER_PROVISIONING_WORKERS
+
+    report = ProvisioningReport()
+    start = time.time()
+    pool = ThreadPool(workers)
+    try:
+        while True:
+            jobs = claim_batch(batch_size)
+            if not jobs:
+                break
+            provisioned = set(BraintreeUser.objects.filter(user__in=[job.user_id for job in jobs])
+                              .values_list('user_id', flat=True))
+            already = [job.pk for job in jobs if job.user_id in provisioned]
+            results = pool.map(_provision, [job for job in jobs if job.user_id not in provisioned])
+            _record(report, jobs, already, results)
+            if len(jobs) < batch_size:
+                break
+    finally:
+        pool.close()
+        pool.join()
+
+    report.elapsed = time.time() - start
+    if report.provisioned or report.failed:
+        LOGGER.info("Customer provisioning: %s", report)
+    return report
@@ -0,0 +1,220 @@
+"""
+Reconciliation of BraintreeUser rows with the subscriptions held by Braintree. Fetching each subscription is a network
+round trip, so the calls are fanned out over a bounded thread pool. Threads only talk to the gateway and never touch
+the database: every row is loaded up front and changed rows are written back by the calling thread, batch_size rows
+per transaction. Rows are saved with save(update_fields=...) so the usual signals (and entitlement cache invalidation)
+still fire. Every subscription fetched is also copied to the local mirror (see mirror.py).
+
+Each call is bounded by the Braintree client timeout (BRAINTREE_TIMEOUT). As a guard against calls which hang anyway,
+if no call completes for longer than the timeout the remaining users are reported as timed out and the pool is
+abandoned.
+
+reconcile_by_search avoids the per user calls altogether: it pages through Braintree's subscription search and joins
+the results against the BraintreeUser rows in memory, so the number of calls depends on the number of pages of results
+rather than the number of users.
+"""
+import time
+import logging
+from multiprocessing.pool import ThreadPool
+from Queue import Queue, Empty
+
+from braintree.exceptions.http.timeout_error import TimeoutError
+from django.db import transaction
+from requests.exceptions import Timeout
+
+import settings
+from gateway import get_gateway, ALL_STATUSES
+from mirror import replace_mirrors
+from models import BraintreeUser
+from subscription_manager import SubscriptionManager
+
+LOGGER = logging.getLogger(__name__)
+
+TIMEOUT_ERRORS = (Timeout, TimeoutError)
+
+
+class ReconciliationReport(object):
+    """Outcome of a reconciliation run"""
+
+    def __init__(self):
+        self.checked = 0
+        self.changed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.elapsed = 0.0
+        self.failures = []
+
+    @property
+    def throughput(self):
+        """Subscriptions checked per second"""
+        return self.checked / self.elapsed if self.elapsed else 0.0
+
+    def add_failure(self, braintree_user, error, timed_out=False):
+        if timed_out:
+            self.timed_out += 1
+        else:
+            self.failed += 1
+        self.failures.append((braintree_user.pk, braintree_user.subscription_id, error))
+
+    def __str__(self):
+        return ("Checked %s subscriptions in %.1fs (%.1f/s): %s changed, %s failed, %s timed out"
+                % (self.checked, self.elapsed, self.throughput, self.changed, self.failed, self.timed_out))
+
+
+def _fetch(gateway, pk, subscription_id):
+    """Runs in a pool thread. Returns (pk, subscription, error, timed_out)"""
+    try:
+        return pk, gateway.find_subscription(subscription_id), None, False
+    except TIMEOUT_ERRORS as e:
+        return pk, None, 'Timed out: %s' % e, True
+    except Exception as e:
+        return pk, None, '%s: %s' % (e.__class__.__name__, e), False
+
+
+class _BatchWriter(object):
+    """
+    Collects changed BraintreeUsers and the subscriptions they were matched against, writing both batch_size at a
+    time in one transaction. Every subscription fetched is mirrored, changed or not. A batch which can't be written is
+    rolled back and its users reported as failures, and the run carries on with the next batch.
+    """
+
+    def __init__(self, report, batch_size):
+        self.report = report
+        self.batch_size = batch_size
+        self.users = []
+        self.to_save = []
+        self.to_mirror = []
+
+    def add(self, braintree_user, changed, subscription):
+        self.users.append(braintree_user)
+        if changed:
+            self.to_save.append((braintree_user, changed))
+        self.to_mirror.append(subscription)
+        if len(self.to_mirror) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.to_mirror:
+            return
+        try:
+            with transaction.atomic():
+                for braintree_user, fields in self.to_save:
+                    braintree_user.save(update_fields=fields)
+                replace_mirrors(self.to_mirror)
+        except Exception as e:
+            LOGGER.exception("Could not save a batch of %s reconciled subscriptions", len(self.users))
+            error = 'Could not save: %s: %s' % (e.__class__.__name__, e)
+            self.report.changed -= len(self.to_save)
+            for braintree_user in self.users:
+                self.report.add_failure(braintree_user, error)
+        self.users = []
+        self.to_save = []
+        self.to_mirror = []
+
+
+def _subscribed_users():
+    return BraintreeUser.objects.exclude(subscription_id="").exclude(subscription_id=None).select_related('user')
+
+
+def _apply(report, braintree_user, subscription, writer):
+    """Apply a fetched subscription to its user, handing the result to the writer"""
+    report.checked += 1
+    try:
+        changed = SubscriptionManager.apply_braintree_state(braintree_user, subscription)
+    except Exception as e:
+        LOGGER.exception("Could not match braintree state for user %s", braintree_user)
+        report.add_failure(braintree_user, '%s: %s' % (e.__class__.__name__, e))
+        return
+    if changed:
+        report.changed += 1
+    writer.add(braintree_user, changed, subscription)
+
+
+def reconcile_subscriptions(workers=None, timeout=None, batch_size=None, gateway=None, braintree_users=None):
+    """
+    Bring every subscribed BraintreeUser (or just those in the braintree_users queryset) in line with Braintree.
+    Returns a ReconciliationReport.
+    """
+    workers = workers or settings.RECONCILE_WORKERS
+    timeout = timeout or settings.BRAINTREE_TIMEOUT
+    batch_size = batch_size or settings.RECONCILE_BATCH_SIZE
+    gateway = gateway or get_gateway()
+
+    report = ReconciliationReport()
+    start = time.time()
+    if braintree_users is None:
+        braintree_users = _subscribed_users()
+    braintree_users = dict((braintree_user.pk, braintree_user) for braintree_user in
+                           braintree_users.select_related('user'))
+    results = Queue()
+    pool = ThreadPool(workers)
+    try:
+        for braintree_user in braintree_users.values():
+            pool.apply_async(_fetch, (gateway, braintree_user.pk, braintree_user.subscription_id),
+                             callback=results.put)
+        pool.close()
+
+        outstanding = set(braintree_users)
+        writer = _BatchWriter(report, batch_size)
+        while outstanding:
+            try:
+                pk, subscription, error, timed_out = results.get(timeout=timeout)
+            except Empty:
+                LOGGER.error("No response from Braintree in %ss, giving up on %s subscriptions", timeout,
+                             len(outstanding))
+                for pk in outstanding:
+                    report.add_failure(braintree_users[pk], 'No response in %ss' % timeout, timed_out=True)
+                break
+            outstanding.discard(pk)
+            braintree_user = braintree_users[pk]
+            if error is not None:
+                LOGGER.error("Could not fetch Braintree state for %s: %s", braintree_user, error)
+                report.checked += 1
+                report.add_failure(braintree_user, error, timed_out)
+                continue
+            _apply(report, braintree_user, subscription, writer)
+        writer.flush()
+    finally:
+        # Hung calls can't be interrupted, so don't wait on them
+        pool.terminate()
+
+    report.elapsed = time.time() - start
+    LOGGER.info("Braintree reconciliation: %s", report)
+    return report
+
+
+def reconcile_by_search(statuses=None, batch_size=None, gateway=None):
+    """
+    Bring subscribed BraintreeUsers in line with Braintree using the subscription search. Only subscriptions with one of
+    the given statuses are fetched (all of them by default). When searching every status, users whose subscription
+    isn't in the results are reported as failures and left unchanged. Returns a ReconciliationReport.
+    """
+    batch_size = batch_size or settings.RECONCILE_BATCH_SIZE
+    gateway = gateway or get_gateway()
+
+    report = ReconciliationReport()
+    start = time.time()
+    braintree_users = dict((braintree_user.subscription_id, braintree_user) for braintree_user in _subscribed_users())
+    seen = set()
+    writer = _BatchWriter(report, batch_size)
+    try:
+        for subscription in gateway.search_subscriptions(statuses or ALL_STATUSES):
+            braintree_user = braintree_users.get(subscription.id)
+            if braintree_user is None or subscription.id in seen:
+                continue
+            seen.add(subscription.id)
+            _apply(report, braintree_user, subscription, writer)
+    except Exception as e:
+        # Keep what was fetched before the search broke off
+        LOGGER.exception("Braintree subscription search failed after %s subscriptions", len(seen))
+        report.failed += 1
+        report.failures.append((None, None, '%s: %s' % (e.__class__.__name__, e)))
+    else:
+        if not statuses:
+            for subscription_id in set(braintree_users) - seen:
+                report.add_failure(braintree_users[subscription_id], 'Not found in Braintree search')
+    writer.flush()
+
+    report.elapsed = time.time() - start
+    LOGGER.info("Braintree reconciliation by search: %s", report)
+    return report
@@ -1,2 +1,66 @@
 SUBSCRIPTION_PLAN_ID = 'dzdw'
-BRAINTREE_TIME_ZONE = "US/Central"
\ No newline at end of file
+BRAINTREE_TIME_ZONE = "US/Central"
+# Longest time a user's entitlement is cached for (seconds). Entries also expire when the subscription does.
+ENTITLEMENT_CACHE_TIMEOUT = 60 * 60
+# Dotted path of the class used to talk to Braintree, see gateway.py
+BRAINTREE_GATEWAY = 'subscriptions.gateway.BraintreeGateway'
+# Longest a single call to Braintree may take before it is abandoned (seconds)
+BRAINTREE_TIMEOUT = 30
+# Braintree HTTP transport, see transport.py. Connections kept alive per process, and timeouts (seconds) of the
+# operations which shouldn't wait BRAINTREE_TIMEOUT. Reads are retried up to BRAINTREE_RETRIES times,
+# BRAINTREE_RETRY_BACKOFF seconds apart (doubling), while the retry budget lasts: it gains BRAINTREE_RETRY_BUDGET_RATIO
+# of a retry per request and holds at most BRAINTREE_RETRY_BUDGET_MIN
+BRAINTREE_POOL_SIZE = 20
+BRAINTREE_OPERATION_TIMEOUTS = {
+    'GET subscriptions/:id': 10,
+    'GET plans': 10,
+    'POST client_token': 10,
+    'PUT subscriptions/:id/cancel': 20,
+    'POST subscriptions/advanced_search_ids': 20,
+    'POST subscriptions/advanced_search': 60,
+}
+BRAINTREE_RETRIES = 2
+BRAINTREE_RETRY_BACKOFF = 0.1
+BRAINTREE_RETRY_BUDGET_RATIO = 0.1
+BRAINTREE_RETRY_BUDGET_MIN = 10
+# Calls from SubscriptionManager are refused for BRAINTREE_BREAKER_RESET seconds after BRAINTREE_BREAKER_FAILURES
+# consecutive calls failed or took longer than BRAINTREE_BREAKER_SLOW_CALL seconds, see circuit_breaker.py
+BRAINTREE_BREAKER_FAILURES = 5
+BRAINTREE_BREAKER_SLOW_CALL = 10
+BRAINTREE_BREAKER_RESET = 30
+# Reconciliation with Braintree: number of concurrent calls and changed rows saved per transaction
+RECONCILE_WORKERS = 16
+RECONCILE_BATCH_SIZE = 500
+# Subscription webhooks applied per batch, and attempts at applying one before giving up
+WEBHOOK_BATCH_SIZE = 100
+WEBHOOK_MAX_ATTEMPTS = 5
+# Cancelling pending cancel subscriptions: concurrent calls, jobs per batch (checkpoint), and attempts before giving up
+CANCEL_WORKERS = 8
+CANCEL_BATCH_SIZE = 100
+CANCEL_MAX_ATTEMPTS = 5
+# Oldest mirrored subscription details served without asking Braintree (seconds). A little over the nightly
+# reconciliation, so webhooks and reconciliation normally keep every mirror fresh
+SUBSCRIPTION_MIRROR_MAX_AGE = 60 * 60 * 25
+# Subscription plans are refreshed in the background once older than PLAN_CATALOG_REFRESH, and kept in the shared cache
+# for PLAN_CATALOG_TIMEOUT. After a failed load Braintree isn't asked again for PLAN_CATALOG_RETRY. A process with no
+# plans at all waits at most PLAN_CATALOG_COLD_WAIT for the first load (all in seconds)
+PLAN_CATALOG_REFRESH = 60 * 60
+PLAN_CATALOG_TIMEOUT = 60 * 60 * 24 * 7
+PLAN_CATALOG_RETRY = 60
+PLAN_CATALOG_COLD_WAIT = 2
+# Pre-generated client tokens kept per process for checkout. The pool is topped up when it falls to
+# CLIENT_TOKEN_LOW_WATER, and checked every CLIENT_TOKEN_REFILL_INTERVAL seconds. Tokens older than
+# CLIENT_TOKEN_MAX_AGE seconds are thrown away (Braintree accepts them for 24 hours). A size of 0 turns the pool off
+CLIENT_TOKEN_POOL_SIZE = 20
+CLIENT_TOKEN_LOW_WATER = 5
+CLIENT_TOKEN_MAX_AGE = 60 * 60
+CLIENT_TOKEN_REFILL_INTERVAL = 60
+# Creating Braintree customers for new users in the background (see provisioning.py): jobs per batch, concurrent calls,
+# attempts before giving up, retry backoff (doubling from CUSTOMER_PROVISIONING_RETRY_DELAY up to
+# CUSTOMER_PROVISIONING_MAX_RETRY_DELAY) and how long a claimed batch is reserved for one worker (all in seconds)
+CUSTOMER_PROVISIONING_BATCH_SIZE = 50
+CUSTOMER_PROVISIONING_WORKERS = 4
+CUSTOMER_PROVISIONING_MAX_ATTEMPTS = 8
+CUSTOMER_PROVISIONING_RETRY_DELAY = 30
+CUSTOMER_PROVISIONING_MAX_RETRY_DELAY = 60 * 60 * 6
+CUSTOMER_PROVISIONING_CLAIM_TIMEOUT = 60 * 5
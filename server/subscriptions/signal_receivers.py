@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+
+from entitlement_cache import invalidate_entitlement
+from models import BraintreeUser
+
+
+@receiver(post_save, sender=BraintreeUser)
+@receiver(post_delete, sender=BraintreeUser)
+def braintree_user_changed(sender, instance=None, **kwargs):
+    """Subscribe, renew, cancel and reconciliation all save the BraintreeUser, so drop the cached entitlement"""
+    invalidate_entitlement(instance.user_id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance=None, **kwargs):
+    """Users without a BraintreeUser have a negative entry cached, which mustn't outlive the user"""
+    invalidate_entitlement(instance.pk)
@@ -2,30 +2,63 @@ import braintree
 import settings
 import logging
 import pytz, datetime
+import time
 
 from dentest import settings as server_settings
 
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-from subscriptions.models import BraintreeUser
-from braintree.customer import Customer
+from subscriptions.models import BraintreeUser, CustomerProvisioningJob
+from subscriptions import entitlement_cache
+from subscriptions.gateway import get_gateway
+from subscriptions.plan_catalog import PlanCatalog
+from subscriptions.circuit_breaker import CircuitBreaker
+from braintree.exceptions.not_found_error import NotFoundError
 
 LOGGER = logging.getLogger(__name__)
 
 class BraintreeError(Exception):
     pass
 
+class BraintreeUnavailableError(BraintreeError):
+    """Raised without calling Braintree while the circuit breaker is open"""
+    pass
+
 class SubscriptionManager(object):
 
+    @classmethod
+    def call_braintree(cls,function,*args,**kwargs):
+        """
+        Make a call to Braintree through the circuit breaker (see circuit_breaker.py). Raises BraintreeUnavailableError
+        instead of calling while the breaker is open. Braintree saying a record was not found isn't a failure.
+        """
+        if not breaker.allow():
+            raise BraintreeUnavailableError("Braintree is unavailable. Not calling it until the circuit breaker closes")
+        started = time.time()
+        failed = True
+        try:
+            result = function(*args,**kwargs)
+            failed = False
+            return result
+        except NotFoundError:
+            failed = False
+            raise
+        finally:
+            breaker.record(time.time() - started, failed)
+
     @classmethod
     def fetch_braintree_user(cls,user):
         """
-        Look up the BraintreeUser instance connected to the provided user. Raises a BraintreeError if a BraintreeUser
-        cannot be found for this user.
+        Look up the BraintreeUser instance connected to the provided user. A newly registered user whose Braintree
+        customer hasn't been created in the background yet has it created now. Raises a BraintreeError if a
+        BraintreeUser cannot be found or created for this user.
         """
         try:
             braintree_user = BraintreeUser.objects.get(user=user)
         except ObjectDoesNotExist as e:
+            if CustomerProvisioningJob.objects.filter(user=user).exclude(status=CustomerProvisioningJob.DONE).exists():
+                return cls.provision_customer(user)
             LOGGER.exception("No braintree account associated with user %s. Must create one!",user)
             raise BraintreeError("No instance of BraintreeUser found associated with user " + str(user))
         except MultipleObjectsReturned as e:
@@ -33,6 +66,47 @@ class SubscriptionManager(object):
             raise BraintreeError("Multiple BraintreeUser instances attached to this user " + str(user))
         return braintree_user
 
+    @classmethod
+    def provision_customer(cls,user):
+        """
+        Create the Braintree customer for a user whose provisioning job hasn't completed, and complete the job. Raises a
+        BraintreeError if it can't be created.
+        """
+        try:
+            braintree_user = cls.create_new_customer(user)
+        except BraintreeError:
+            # Created in the background meanwhile, or Braintree is unavailable
+            braintree_user = BraintreeUser.objects.filter(user=user).first()
+            if braintree_user is None:
+                raise
+        except IntegrityError:
+            # The provisioning worker saved its customer first. Ours is left unused on Braintree
+            LOGGER.warning("User %s was given a Braintree customer in the background meanwhile", user)
+            braintree_user = BraintreeUser.objects.get(user=user)
+        except Exception as e:
+            LOGGER.exception("Could not create a braintree account for user %s", user)
+            raise BraintreeError("Could not create a BraintreeUser for user " + str(user))
+        if braintree_user is None:
+            raise BraintreeError("Braintree refused to create a customer for user " + str(user))
+        CustomerProvisioningJob.objects.filter(user=user).exclude(status=CustomerProvisioningJob.DONE) \
+            .update(status=CustomerProvisioningJob.DONE, time_completed=timezone.now())
+        return braintree_user
+
+    @classmethod
+    def create_braintree_customer(cls,user):
+        """
+        Create a Braintree Customer for the user, without touching the database (so it is safe to call from worker
+        threads). Returns the new customer id, or None if Braintree refused.
+        """
+        result = cls.call_braintree(get_gateway().create_customer,{
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'email': user.email,
+        })
+        if not result.is_success:
+            return None
+        return result.customer.id
+
     @classmethod
     def create_new_customer(cls,user):
         """
@@ -44,22 +118,19 @@ class SubscriptionManager(object):
             LOGGER.error("Tried to create a duplicate braintree account for user %s", user)
             raise BraintreeError("This user already has a BraintreeUser instance associated with them. User: " + str(user))
 
-        result = Customer.create({
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'email': user.email,
-        })
-        if not result.is_success:
+        id = cls.create_braintree_customer(user)
+        if id is None:
             return None
 
-        id = result.customer.id
         customerRef = BraintreeUser(
             user=user,
             customer_id=id,
             active = False,
             pending_cancel = False
         )
-        customerRef.save()
+        # In a savepoint, so a duplicate leaves any surrounding transaction usable
+        with transaction.atomic():
+            customerRef.save()
         return customerRef
 
     @classmethod
@@ -73,7 +144,7 @@ class SubscriptionManager(object):
 
         # try to subscribe with Braintree
         payment_method_token = braintree_customer.payment_method_token
-        result = braintree.Subscription.create({
+        result = cls.call_braintree(braintree.Subscription.create,{
             'payment_method_token': payment_method_token,
             'plan_id': settings.SUBSCRIPTION_PLAN_ID,
             'first_billing_date' : cls.construct_next_billing_datetime()
@@ -133,7 +204,7 @@ class SubscriptionManager(object):
         if not isinstance(braintree_customer,BraintreeUser):
             raise TypeError("braintree_customer must be instance of BraintreeUser")
         # try to cancel
-        response = braintree.Subscription.cancel(braintree_customer.subscription_id)
+        response = cls.call_braintree(get_gateway().cancel_subscription,braintree_customer.subscription_id)
         if not response.is_success:
             raise BraintreeError("Could not cancel subscription " + str(braintree_customer.subscription_id) +
                                  " for user " + str(braintree_customer.user.username) + ". May have to cancel manually")
@@ -149,7 +220,7 @@ class SubscriptionManager(object):
         if not isinstance(braintree_customer,BraintreeUser):
             raise TypeError("braintree_customer must be instance of BraintreeUser")
         # try to create the payment method on Braintree
-        response = braintree.PaymentMethod.create({
+        response = cls.call_braintree(braintree.PaymentMethod.create,{
             'customer_id': braintree_customer.customer_id,
             'payment_method_nonce': payment_method_nonce,
             'options':{
@@ -166,7 +237,7 @@ class SubscriptionManager(object):
 
         # Now try to change the payment method on the users subscription (if they have one)
         if braintree_customer.subscription_id != "":
-            response = braintree.Subscription.update(braintree_customer.subscription_id,{
+            response = cls.call_braintree(braintree.Subscription.update,braintree_customer.subscription_id,{
                 'payment_method_token' : braintree_customer.payment_method_token
             })
 
@@ -186,13 +257,46 @@ class SubscriptionManager(object):
 
         # try to fetch from braintree
         try:
-            result = braintree.Subscription.find(braintree_customer.subscription_id)
+            result = cls.call_braintree(get_gateway().find_subscription,braintree_customer.subscription_id)
             return result
+        except BraintreeUnavailableError:
+            raise
         except Exception as e:
             LOGGER.error("Could not fetch Braintree state for user: %s",str(braintree_customer.user))
             raise BraintreeError("Could not fetch state for user " + str(braintree_customer.user) + " with braintree details " +
                                  str(braintree_customer) + "!")
 
+    @classmethod
+    def apply_braintree_state(cls,braintree_customer,subscription):
+        """
+        Copy the state of a subscription fetched from Braintree onto the BraintreeUser, without saving it. Returns the
+        names of the fields which changed.
+        """
+        if cls.is_braintree_subscription_active(subscription):
+            state = {'active': True, 'expiry_date': cls.normalise_expiry_date(subscription.billing_period_end_date)}
+        elif cls.is_braintree_subscription_in_terminating_state(subscription):
+            state = {'subscription_id': "", 'active': False, 'expiry_date': None, 'pending_cancel': False}
+        else:
+            state = {'active': False, 'expiry_date': cls.normalise_expiry_date(subscription.billing_period_end_date)}
+        changed = [field for field, value in state.items() if getattr(braintree_customer, field) != value]
+        for field in changed:
+            setattr(braintree_customer, field, state[field])
+        return changed
+
+    @classmethod
+    def normalise_expiry_date(cls,expiry_date):
+        """
+        Braintree gives billing dates as dates in its own time zone; store them as aware datetimes, converted the same
+        way subscribe() converts them, so they compare with the database
+        """
+        if expiry_date is None:
+            return None
+        if not isinstance(expiry_date, datetime.datetime):
+            expiry_date = datetime.datetime.combine(expiry_date, datetime.time())
+        if timezone.is_naive(expiry_date):
+            expiry_date = cls.convert_braintree_time_to_server_time(expiry_date)
+        return expiry_date
+
     @classmethod
     def get_account_info_for_user(cls,user):
         try:
@@ -203,26 +307,36 @@ class SubscriptionManager(object):
 
     @classmethod
     def can_user_access_subscription_content(cls,user):
+        """Served from the shared entitlement cache, so in the steady state this needs no queries"""
         if user.is_staff:
             return True
-        account = SubscriptionManager.get_account_info_for_user(user)
-        if account is None:
-            return False
-        else:
-            return account.active
+        entitlement = entitlement_cache.get_entitlement(user.pk)
+        if entitlement is None:
+            account = SubscriptionManager.get_account_info_for_user(user)
+            entitlement = entitlement_cache.store_entitlement(user.pk, account)
+        active, expiry_date = entitlement
+        return active
 
 
     @classmethod
     def get_subscription_plan(cls):
-        try:
-            plan = braintree.Plan.all()[0]
-            return {
-                'billing_frequency': plan.billing_frequency,
-                'price': plan.price,
-            }
-        except Exception as e:
-            LOGGER.exception("Could not fetch the subscription plan from Braintree.")
+        """The subscription plan, from the plan catalog so this never waits on Braintree (see plan_catalog.py)"""
+        plan = plan_catalog.get(settings.SUBSCRIPTION_PLAN_ID)
+        if plan is None:
             return None
+        return {
+            'billing_frequency': plan['billing_frequency'],
+            'price': plan['price'],
+        }
+
+    @classmethod
+    def fetch_subscription_plans(cls):
+        """Every plan on Braintree, used to load the plan catalog"""
+        return [{
+            'id': plan.id,
+            'billing_frequency': plan.billing_frequency,
+            'price': plan.price,
+        } for plan in cls.call_braintree(get_gateway().find_plans)]
 
     @classmethod
     def convert_braintree_time_to_server_time(cls,braintree_timestamp):
@@ -260,4 +374,8 @@ class SubscriptionManager(object):
         elif status == braintree.Subscription.Status.Canceled:
             return "Cancelled"
         else:
-            return "Expired"
\ No newline at end of file
+            return "Expired"
+
+
+breaker = CircuitBreaker()
+plan_catalog = PlanCatalog(SubscriptionManager.fetch_subscription_plans)
@@ -0,0 +1,162 @@
+import time
+from threading import Thread, Lock
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+import braintree
+import requests
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from subscriptions import settings, transport
+
+SUBSCRIPTION_XML = '<subscription><id>%s</id><status>Active</status></subscription>'
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """Local stand in for Braintree. Answers with the (status, delay) pairs in replies, then with 200s"""
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.replies = []
+        self.requests = []
+        self.connections = set()
+        self.lock = Lock()
+        self.handlers = []
+
+    def process_request(self, request, client_address):
+        thread = Thread(target=self.process_request_thread, args=(request, client_address))
+        thread.daemon = True
+        self.handlers.append(thread)
+        thread.start()
+
+    def handle_error(self, request, client_address):
+        # Clients which timed out have hung up before the reply is written
+        pass
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        for thread in self.handlers:
+            thread.join(5)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self):
+        length = int(self.headers.getheader('Content-Length') or 0)
+        self.rfile.read(length)
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path))
+            self.server.connections.add(self.client_address)
+            code, delay = self.server.replies.pop(0) if self.server.replies else (200, 0)
+        time.sleep(delay)
+        body = SUBSCRIPTION_XML % self.path.rstrip('/').split('/')[-1] if code == 200 else ''
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = reply
+
+
+class BraintreeTransportTestCase(TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        self.thread = Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        environment = braintree.Environment('stub', '127.0.0.1', str(self.server.server_address[1]), None, False, None)
+        config = braintree.Configuration(environment, merchant_id='merchant', public_key='public',
+                                         private_key='private', timeout=5, http_strategy=transport.PooledHttp)
+        self.gateway = braintree.BraintreeGateway(config)
+        self.previous_settings = (settings.BRAINTREE_OPERATION_TIMEOUTS, settings.BRAINTREE_RETRY_BACKOFF)
+        settings.BRAINTREE_RETRY_BACKOFF = 0
+        transport.close_session()
+        transport.metrics.reset()
+        transport.retry_budget.reset()
+
+    def tearDown(self):
+        settings.BRAINTREE_OPERATION_TIMEOUTS, settings.BRAINTREE_RETRY_BACKOFF = self.previous_settings
+        transport.close_session()
+        transport.metrics.reset()
+        transport.retry_budget.reset()
+        self.server.close()
+
+    def test_operation_name(self):
+        self.assertEqual('GET subscriptions/:id', transport.operation_name('GET', '/merchants/m/subscriptions/ab12'))
+        self.assertEqual('PUT subscriptions/:id/cancel',
+                         transport.operation_name('PUT', 'https://x:443/merchants/m/subscriptions/ab12/cancel'))
+        self.assertEqual('POST subscriptions/advanced_search_ids',
+                         transport.operation_name('POST', '/merchants/m/subscriptions/advanced_search_ids'))
+        self.assertEqual('POST customers', transport.operation_name('POST', '/merchants/m/customers'))
+
+    def test_connections_reused(self):
+        """Consecutive calls share one kept alive connection"""
+        for subscription_id in ('first', 'second', 'third'):
+            self.assertEqual(subscription_id, self.gateway.subscription.find(subscription_id).id)
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual(1, len(self.server.connections))
+
+    def test_latency_recorded(self):
+        self.gateway.subscription.find('first')
+        self.gateway.subscription.cancel('first')
+        operations = transport.metrics.as_dict()['operations']
+        self.assertEqual(1, operations['GET subscriptions/:id']['count'])
+        self.assertEqual(1, operations['PUT subscriptions/:id/cancel']['count'])
+        self.assertEqual(1, sum(operations['GET subscriptions/:id']['latency_histogram'].values()))
+
+    def test_operation_timeout(self):
+        settings.BRAINTREE_OPERATION_TIMEOUTS = {'PUT subscriptions/:id/cancel': 0.2}
+        self.server.replies = [(200, 1)]
+        started = time.time()
+        self.assertRaises(requests.exceptions.Timeout, self.gateway.subscription.cancel, 'first')
+        self.assertLess(time.time() - started, 1)
+        # Cancelling isn't a read, so isn't retried
+        self.assertEqual(1, len(self.server.requests))
+        self.assertEqual(1, transport.metrics.as_dict()['operations']['PUT subscriptions/:id/cancel']['errors'])
+
+    def test_reads_retried(self):
+        self.server.replies = [(503, 0), (502, 0)]
+        self.assertEqual('first', self.gateway.subscription.find('first').id)
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual(2, transport.metrics.as_dict()['operations']['GET subscriptions/:id']['retries'])
+
+    def test_timed_out_reads_retried(self):
+        settings.BRAINTREE_OPERATION_TIMEOUTS = {'GET subscriptions/:id': 0.2}
+        self.server.replies = [(200, 1)]
+        self.assertEqual('first', self.gateway.subscription.find('first').id)
+
+    def test_retries_limited(self):
+        self.server.replies = [(503, 0)] * 5
+        self.assertRaises(braintree.exceptions.DownForMaintenanceError, self.gateway.subscription.find, 'first')
+        self.assertEqual(1 + settings.BRAINTREE_RETRIES, len(self.server.requests))
+
+    def test_retry_budget(self):
+        """Once the budget is spent, failed reads aren't retried until enough requests have been made"""
+        transport.retry_budget.balance = 1
+        self.server.replies = [(503, 0)] * 5
+        self.assertRaises(braintree.exceptions.DownForMaintenanceError, self.gateway.subscription.find, 'first')
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual(1, transport.metrics.as_dict()['retries_denied'])
+
+    def test_metrics_view(self):
+        self.gateway.subscription.find('first')
+        client = APIClient()
+        user = User.objects.create(username='staff', email='staff@madeup.com')
+        client.force_authenticate(user=user)
+        self.assertEqual(client.get('/braintree_transport_metrics/').status_code, status.HTTP_403_FORBIDDEN)
+        user.is_staff = True
+        user.save()
+        response = client.get('/braintree_transport_metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(1, response.data['operations']['GET subscriptions/:id']['count'])
@@ -96,20 +96,21 @@ class SubscriptionManagementTestCase(TestCase):
         self.braintree_customer_cancelled = BraintreeUser.objects.get(user=self.user_cancelled)
         self.braintree_customer_expired = BraintreeUser.objects.get(user=self.user_expired)
 
+        # Billing dates are in Braintree's time zone
         # Check active subscription  - pending cancel state should not have been changed
         self.assertTrue(self.braintree_customer_active.active)
         self.assertTrue(self.braintree_customer_active.pending_cancel)
-        self.assertEqual(timezone.make_aware(datetime.datetime(2016,7,24,0,2,0),pytz.utc), self.braintree_customer_active.expiry_date)
+        self.assertEqual(pytz.timezone(settings.BRAINTREE_TIME_ZONE).localize(datetime.datetime(2016,7,24,0,2,0)), self.braintree_customer_active.expiry_date)
 
         # Check pending subscription - again no change to pending cancel
         self.assertTrue(self.braintree_customer_pending.active)
         self.assertFalse(self.braintree_customer_pending.pending_cancel)
-        self.assertEqual(timezone.make_aware(datetime.datetime(2016,11,02,0,2,0),pytz.utc), self.braintree_customer_pending.expiry_date)
+        self.assertEqual(pytz.timezone(settings.BRAINTREE_TIME_ZONE).localize(datetime.datetime(2016,11,02,0,2,0)), self.braintree_customer_pending.expiry_date)
 
         # Check past due subscription
         self.assertFalse(self.braintree_customer_past_due.active)
         self.assertFalse(self.braintree_customer_past_due.pending_cancel)
-        self.assertEqual(timezone.make_aware(datetime.datetime(2016,10,03,0,2,0),pytz.utc), self.braintree_customer_past_due.expiry_date)
+        self.assertEqual(pytz.timezone(settings.BRAINTREE_TIME_ZONE).localize(datetime.datetime(2016,10,03,0,2,0)), self.braintree_customer_past_due.expiry_date)
 
         # Check cancelled subscription
         self.assertFalse(self.braintree_customer_cancelled.active)
@@ -0,0 +1,136 @@
+import datetime
+from decimal import Decimal
+
+import braintree
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from subscriptions.models import BraintreeUser, SubscriptionMirror
+from subscriptions.gateway import FakeBraintreeGateway, set_gateway
+from subscriptions.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from subscriptions.subscription_manager import SubscriptionManager, BraintreeUnavailableError, breaker, plan_catalog
+
+
+class CircuitBreakerTestCase(TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=3, slow_call=1, reset_timeout=30)
+
+    def trip(self):
+        for i in range(3):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(0.1, failed=True)
+
+    def test_trips_after_consecutive_failures(self):
+        self.breaker.record(0.1, failed=True)
+        self.breaker.record(0.1, failed=True)
+        self.breaker.record(0.1)
+        self.assertEqual(CLOSED, self.breaker.state)
+        self.trip()
+        self.assertEqual(OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(1, self.breaker.as_dict()['rejected'])
+
+    def test_slow_calls_count_as_failures(self):
+        for i in range(3):
+            self.breaker.record(2)
+        self.assertTrue(self.breaker.is_open)
+
+    def test_half_open_probe(self):
+        """Once the reset timeout has passed a single probe is let through, and closes the breaker if it succeeds"""
+        self.trip()
+        self.breaker.opened_at -= 31
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(HALF_OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(0.1)
+        self.assertEqual(CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        self.trip()
+        self.breaker.opened_at -= 31
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(0.1, failed=True)
+        self.assertTrue(self.breaker.is_open)
+        self.assertEqual(2, self.breaker.as_dict()['trips'])
+
+
+class BraintreeUnavailableTestCase(TestCase):
+    """Behaviour of SubscriptionManager and the read views while the breaker is open"""
+
+    def setUp(self):
+        cache.clear()
+        plan_catalog.clear()
+        breaker.reset()
+        self.gateway = FakeBraintreeGateway()
+        self.gateway.add_plan('dzdw', Decimal('30.00'), 12)
+        self.previous_gateway = set_gateway(self.gateway)
+        self.user = User.objects.create(username='subscribed', email='subscribed@madeup.com')
+        self.braintree_user = BraintreeUser.objects.create(user=self.user, customer_id='c1', subscription_id='sub1')
+        self.gateway.add_subscription(
+            'sub1', braintree.Subscription.Status.Active, datetime.date(2030, 1, 1),
+            billing_period_start_date=datetime.date(2029, 12, 1), created_at=datetime.datetime(2029, 1, 1, 12, 0),
+            price=Decimal('30.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        set_gateway(self.previous_gateway)
+        breaker.reset()
+        plan_catalog.clear()
+        cache.clear()
+
+    def trip(self):
+        for i in range(breaker.failure_threshold):
+            breaker.record(0, failed=True)
+
+    def test_failures_trip_breaker(self):
+        """Calls failing to reach Braintree trip the breaker, after which Braintree isn't called at all"""
+        self.gateway.failing_ids.add('sub1')
+        for i in range(breaker.failure_threshold):
+            self.assertRaises(IOError, SubscriptionManager.call_braintree, self.gateway.find_subscription, 'sub1')
+        calls = self.gateway.calls
+        self.assertRaises(BraintreeUnavailableError, SubscriptionManager.fetch_subscription_from_braintree,
+                          self.braintree_user)
+        self.assertEqual(calls, self.gateway.calls)
+
+    def test_not_found_is_not_a_failure(self):
+        for i in range(breaker.failure_threshold):
+            self.assertRaises(braintree.exceptions.NotFoundError, SubscriptionManager.call_braintree,
+                              self.gateway.find_subscription, 'missing')
+        self.assertFalse(breaker.is_open)
+
+    def test_status_served_from_stale_mirror(self):
+        self.client.get('/subscription_status/')
+        SubscriptionMirror.objects.update(time_refreshed=timezone.now() - datetime.timedelta(days=30))
+        self.trip()
+        calls = self.gateway.calls
+
+        response = self.client.get('/subscription_status/?refresh=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual('Active', response.data['status'])
+        self.assertEqual(Decimal('30.00'), response.data['price'])
+        self.assertEqual(calls, self.gateway.calls)
+
+    def test_status_without_mirror(self):
+        self.trip()
+        response = self.client.get('/subscription_status/')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_plan_served_from_catalog(self):
+        SubscriptionManager.get_subscription_plan()
+        self.trip()
+        response = self.client.get('/plan_info/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal('30.00'), response.data['price'])
+
+    def test_plan_unavailable(self):
+        self.trip()
+        response = self.client.get('/plan_info/')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(0, self.gateway.calls)
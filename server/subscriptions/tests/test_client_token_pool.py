@@ -0,0 +1,116 @@
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from subscriptions import views
+from subscriptions.gateway import FakeBraintreeGateway, set_gateway
+from subscriptions.client_tokens import ClientTokenPool
+from subscriptions.subscription_manager import BraintreeUnavailableError, breaker
+
+
+class ClientTokenPoolTestCase(TestCase):
+
+    def setUp(self):
+        breaker.reset()
+        self.gateway = FakeBraintreeGateway()
+        self.pool = ClientTokenPool(size=5, max_age=60, low_water=1, generate=self.gateway.generate_client_token)
+        self.previous_pool = views.client_tokens
+        views.client_tokens = self.pool
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.pool.stop()
+        views.client_tokens = self.previous_pool
+        breaker.reset()
+
+    def wait_until_full(self):
+        deadline = time.time() + 5
+        while self.pool.as_dict()['available'] < self.pool.size and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_fill(self):
+        self.assertEqual(5, self.pool.fill())
+        self.assertEqual(0, self.pool.fill())
+        self.assertEqual(1.0, self.pool.as_dict()['fill_level'])
+
+    def test_tokens_from_pool(self):
+        """Once the pool is full, tokens are handed out without calling Braintree"""
+        self.pool.fill()
+        tokens = set(self.pool.pop() for i in range(4))
+        self.assertEqual(4, len(tokens))
+        metrics = self.pool.as_dict()
+        self.assertEqual(4, metrics['hits'])
+        self.assertEqual(0, metrics['misses'])
+
+    def test_refilled_in_background(self):
+        """Falling to the low water mark wakes the refill thread"""
+        self.pool.pop()
+        self.wait_until_full()
+        for i in range(4):
+            self.pool.pop()
+        self.wait_until_full()
+        self.assertEqual(5, self.pool.as_dict()['available'])
+        self.assertEqual(10, self.gateway.tokens_generated)
+
+    def test_empty_pool_generates_token(self):
+        """A token is still handed out when the pool is empty, just more slowly"""
+        self.gateway.latency = 0.05
+        self.assertTrue(self.pool.pop().startswith('fake-client-token'))
+        self.assertEqual(1, self.pool.as_dict()['misses'])
+
+    def test_expired_tokens_discarded(self):
+        self.pool.fill()
+        self.pool._tokens = type(self.pool._tokens)((token, created - 120) for token, created in self.pool._tokens)
+        self.assertEqual(0, self.pool.as_dict()['available'])
+        self.assertEqual(5, self.pool.as_dict()['expired'])
+
+    def test_generation_failures_counted(self):
+        def unavailable():
+            raise IOError("Braintree is down")
+        self.pool.generate = unavailable
+        self.assertEqual(0, self.pool.fill())
+        self.assertEqual(1, self.pool.as_dict()['failures'])
+
+    def trip(self):
+        for i in range(breaker.failure_threshold):
+            breaker.record(0, failed=True)
+
+    def test_not_generated_while_breaker_open(self):
+        """Neither an empty pool nor the refill thread calls Braintree while the breaker is open"""
+        self.trip()
+        self.assertRaises(BraintreeUnavailableError, self.pool.pop)
+        time.sleep(0.1)
+        self.assertEqual(0, self.gateway.tokens_generated)
+        self.assertEqual(0, self.pool.as_dict()['failures'])
+        response = self.client.get('/generate_token/')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_default_generate_uses_breaker(self):
+        previous_gateway = set_gateway(self.gateway)
+        try:
+            pool = ClientTokenPool(size=0)
+            self.assertTrue(pool.pop().startswith('fake-client-token'))
+            self.trip()
+            self.assertRaises(BraintreeUnavailableError, pool.pop)
+        finally:
+            set_gateway(previous_gateway)
+        self.assertEqual(1, self.gateway.tokens_generated)
+
+    def test_token_view(self):
+        self.pool.fill()
+        response = self.client.get('/generate_token/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['token'].startswith('fake-client-token'))
+
+    def test_metrics_view(self):
+        user = User.objects.create(username='staff', email='staff@madeup.com')
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get('/client_token_pool_metrics/').status_code, status.HTTP_403_FORBIDDEN)
+        user.is_staff = True
+        user.save()
+        response = self.client.get('/client_token_pool_metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(5, response.data['size'])
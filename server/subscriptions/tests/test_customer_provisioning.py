@@ -0,0 +1,147 @@
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+
+from subscriptions import provisioning, settings
+from subscriptions.management.commands import provision_braintree_customers
+from subscriptions.models import BraintreeUser, CustomerProvisioningJob
+from subscriptions.gateway import FakeBraintreeGateway, set_gateway
+from subscriptions.provisioning import queue_customer_provisioning, provision_customers, ProvisioningReport
+from subscriptions.subscription_manager import SubscriptionManager, BraintreeError, breaker
+
+
+class CustomerProvisioningTestCase(TestCase):
+
+    def setUp(self):
+        breaker.reset()
+        self.gateway = FakeBraintreeGateway()
+        self.previous_gateway = set_gateway(self.gateway)
+        self.users = [User.objects.create(username='user%s' % i, email='user%s@madeup.com' % i, first_name='Test',
+                                          last_name='User') for i in range(5)]
+        for user in self.users:
+            queue_customer_provisioning(user)
+
+    def tearDown(self):
+        set_gateway(self.previous_gateway)
+        breaker.reset()
+
+    def test_customers_created(self):
+        report = provision_customers(batch_size=2, workers=2)
+        self.assertEqual(5, report.provisioned)
+        self.assertEqual(5, len(self.gateway.customers))
+        self.assertEqual(set(self.gateway.customers),
+                         set(BraintreeUser.objects.values_list('customer_id', flat=True)))
+        self.assertEqual(5, CustomerProvisioningJob.objects.filter(status=CustomerProvisioningJob.DONE).count())
+        self.assertEqual(0, provision_customers().provisioned)
+
+    def test_failures_retried_later(self):
+        self.gateway.failing_ids.add('user0@madeup.com')
+        report = provision_customers()
+        self.assertEqual(4, report.provisioned)
+        self.assertEqual(1, report.failed)
+        job = CustomerProvisioningJob.objects.get(user=self.users[0])
+        self.assertEqual(CustomerProvisioningJob.PENDING, job.status)
+        self.assertEqual(1, job.attempts)
+        self.assertTrue(job.next_attempt > timezone.now())
+        # Not due again yet
+        self.assertEqual(0, provision_customers().failed)
+
+        self.gateway.failing_ids.clear()
+        CustomerProvisioningJob.objects.filter(pk=job.pk).update(next_attempt=timezone.now())
+        self.assertEqual(1, provision_customers().provisioned)
+        self.assertTrue(BraintreeUser.objects.filter(user=self.users[0]).exists())
+
+    def test_gives_up(self):
+        self.gateway.failing_ids.add('user0@madeup.com')
+        CustomerProvisioningJob.objects.filter(user=self.users[0]) \
+            .update(attempts=settings.CUSTOMER_PROVISIONING_MAX_ATTEMPTS - 1)
+        provision_customers()
+        self.assertEqual(CustomerProvisioningJob.FAILED, CustomerProvisioningJob.objects.get(user=self.users[0]).status)
+
+    def test_already_provisioned(self):
+        """A user given a customer by fetch_braintree_user isn't given another one"""
+        SubscriptionManager.fetch_braintree_user(self.users[0])
+        calls = self.gateway.calls
+        report = provision_customers()
+        self.assertEqual(4, report.provisioned)
+        self.assertEqual(calls + 4, self.gateway.calls)
+        self.assertEqual(1, BraintreeUser.objects.filter(user=self.users[0]).count())
+
+    def test_provisioned_concurrently(self):
+        """A user given a customer between the check and the insert doesn't roll back the rest of the batch"""
+        save_braintree_user = provisioning._save_braintree_user
+
+        def concurrent_save(user_id, customer_id):
+            if user_id == self.users[0].pk:
+                BraintreeUser.objects.create(user=self.users[0], customer_id='concurrent')
+            return save_braintree_user(user_id, customer_id)
+        provisioning._save_braintree_user = concurrent_save
+        try:
+            report = provision_customers()
+        finally:
+            provisioning._save_braintree_user = save_braintree_user
+        self.assertEqual(4, report.provisioned)
+        self.assertEqual(1, report.already_provisioned)
+        self.assertEqual('concurrent', BraintreeUser.objects.get(user=self.users[0]).customer_id)
+        self.assertEqual(5, BraintreeUser.objects.count())
+        self.assertEqual(5, CustomerProvisioningJob.objects.filter(status=CustomerProvisioningJob.DONE).count())
+
+    def test_provisioned_on_first_use(self):
+        braintree_user = SubscriptionManager.fetch_braintree_user(self.users[0])
+        self.assertIn(braintree_user.customer_id, self.gateway.customers)
+        job = CustomerProvisioningJob.objects.get(user=self.users[0])
+        self.assertEqual(CustomerProvisioningJob.DONE, job.status)
+        self.assertEqual(braintree_user, SubscriptionManager.fetch_braintree_user(self.users[0]))
+        self.assertEqual(1, len(self.gateway.customers))
+
+    def test_provisioned_in_background_during_first_use(self):
+        """The worker saving its customer first isn't an error, its customer is used"""
+        create_braintree_customer = SubscriptionManager.create_braintree_customer
+
+        def worker_saves_first(user):
+            BraintreeUser.objects.create(user=user, customer_id='worker')
+            return create_braintree_customer(user)
+        SubscriptionManager.create_braintree_customer = staticmethod(worker_saves_first)
+        try:
+            braintree_user = SubscriptionManager.fetch_braintree_user(self.users[0])
+        finally:
+            SubscriptionManager.create_braintree_customer = classmethod(create_braintree_customer.__func__)
+        self.assertEqual('worker', braintree_user.customer_id)
+        self.assertEqual(CustomerProvisioningJob.DONE, CustomerProvisioningJob.objects.get(user=self.users[0]).status)
+
+    def test_not_provisioned_on_first_use_while_braintree_down(self):
+        self.gateway.failing_ids.add('user0@madeup.com')
+        self.assertRaises(BraintreeError, SubscriptionManager.fetch_braintree_user, self.users[0])
+        self.assertEqual(CustomerProvisioningJob.PENDING,
+                         CustomerProvisioningJob.objects.get(user=self.users[0]).status)
+
+    def test_user_without_job(self):
+        """Users who were never registered for a customer still aren't given one"""
+        user = User.objects.create(username='unregistered', email='unregistered@madeup.com')
+        self.assertRaises(BraintreeError, SubscriptionManager.fetch_braintree_user, user)
+        self.assertEqual(0, self.gateway.calls)
+
+    def test_watch_survives_errors(self):
+        """A failed run is logged and the worker carries on"""
+        outcomes = [DatabaseError("Connection lost"), ProvisioningReport(), KeyboardInterrupt()]
+
+        def provision(**kwargs):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            return outcome
+        previous = (provision_braintree_customers.provision_customers,
+                    provision_braintree_customers.close_old_connections)
+        provision_braintree_customers.provision_customers = provision
+        provision_braintree_customers.close_old_connections = lambda: None
+        try:
+            self.assertRaises(KeyboardInterrupt, call_command, 'provision_braintree_customers', watch=True, interval=0,
+                              stdout=StringIO(), stderr=StringIO())
+        finally:
+            provision_braintree_customers.provision_customers, provision_braintree_customers.close_old_connections \
+                = previous
+        self.assertEqual([], outcomes)
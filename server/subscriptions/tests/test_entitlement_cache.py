@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from subscriptions.models import BraintreeUser
+from subscriptions.subscription_manager import SubscriptionManager
+from subscriptions.entitlement_cache import get_entitlement
+
+
+# Counts queries, so cached in memory as with memcached in production rather than in the development database
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class EntitlementCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.free_user = User.objects.create(username='free', email='free@madeup.com')
+        self.subscribed_user = User.objects.create(username='subscribed', email='subscribed@madeup.com')
+        self.braintree_user = BraintreeUser.objects.create(user=self.subscribed_user, customer_id='1234',
+                                                           subscription_id='abcd', active=True,
+                                                           expiry_date=timezone.now() + timedelta(days=30))
+
+    def tearDown(self):
+        cache.clear()
+        User.objects.all().delete()
+
+    def test_entitlement_cached(self):
+        """Only the first lookup for a user hits the database"""
+        self.assertTrue(SubscriptionManager.can_user_access_subscription_content(self.subscribed_user))
+        self.assertFalse(SubscriptionManager.can_user_access_subscription_content(self.free_user))
+        with self.assertNumQueries(0):
+            self.assertTrue(SubscriptionManager.can_user_access_subscription_content(self.subscribed_user))
+            self.assertFalse(SubscriptionManager.can_user_access_subscription_content(self.free_user))
+
+    def test_entitlement_invalidated_on_save(self):
+        """Changing the subscription status is seen straight away"""
+        self.assertTrue(SubscriptionManager.can_user_access_subscription_content(self.subscribed_user))
+        self.braintree_user.active = False
+        self.braintree_user.save()
+        self.assertIsNone(get_entitlement(self.subscribed_user.pk))
+        self.assertFalse(SubscriptionManager.can_user_access_subscription_content(self.subscribed_user))
+
+        self.assertFalse(SubscriptionManager.can_user_access_subscription_content(self.free_user))
+        BraintreeUser.objects.create(user=self.free_user, customer_id='5678', active=True)
+        self.assertTrue(SubscriptionManager.can_user_access_subscription_content(self.free_user))
+
+    def test_expired_entitlement_not_cached(self):
+        """A subscription already past its expiry date isn't cached"""
+        self.braintree_user.expiry_date = timezone.now() - timedelta(days=1)
+        self.braintree_user.save()
+        SubscriptionManager.can_user_access_subscription_content(self.subscribed_user)
+        self.assertIsNone(get_entitlement(self.subscribed_user.pk))
@@ -0,0 +1,44 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from mockito import *
+
+from subscriptions.subscription_manager import SubscriptionManager
+from subscriptions.entitlements import *
+
+
+class EntitlementResolverTestCase(TestCase):
+
+    def setUp(self):
+        self.free_user = User.objects.create(username='free', email='free@madeup.com')
+        self.subscribed_user = User.objects.create(username='subscribed', email='subscribed@madeup.com')
+        self.staff_user = User.objects.create(username='staff', email='staff@madeup.com', is_staff=True)
+        when(SubscriptionManager).can_user_access_subscription_content(self.free_user).thenReturn(False)
+        when(SubscriptionManager).can_user_access_subscription_content(self.subscribed_user).thenReturn(True)
+
+    def tearDown(self):
+        unstub()
+        User.objects.all().delete()
+
+    def test_tiers(self):
+        """Each kind of user resolves to the right tier"""
+        self.assertEqual(get_subscription_tier(self.free_user), TIER_FREE)
+        self.assertEqual(get_subscription_tier(self.subscribed_user), TIER_SUBSCRIBER)
+        self.assertEqual(get_subscription_tier(self.staff_user), TIER_STAFF)
+        self.assertFalse(can_access_subscription_content(self.free_user))
+        self.assertTrue(can_access_subscription_content(self.subscribed_user))
+        self.assertTrue(can_access_subscription_content(self.staff_user))
+
+    def test_tier_memoized_on_user(self):
+        """The subscription lookup only happens once for a given user object"""
+        for _ in range(3):
+            self.assertTrue(can_access_subscription_content(self.subscribed_user))
+        verify(SubscriptionManager, times=1).can_user_access_subscription_content(self.subscribed_user)
+
+    def test_permission_class(self):
+        """Only entitled users are granted the permission"""
+        permission = HasSubscriptionAccess()
+        request = mock()
+        request.user = self.free_user
+        self.assertFalse(permission.has_permission(request, None))
+        request.user = self.subscribed_user
+        self.assertTrue(permission.has_permission(request, None))
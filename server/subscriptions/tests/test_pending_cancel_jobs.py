@@ -0,0 +1,132 @@
+import datetime
+
+import braintree
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from subscriptions import settings
+from subscriptions.models import BraintreeUser, PendingCancelJob
+from subscriptions.gateway import FakeBraintreeGateway
+from subscriptions.cancellation import queue_cancellations, process_cancel_jobs
+from subscriptions.entitlement_cache import get_entitlement
+from subscriptions.subscription_manager import SubscriptionManager
+
+
+class PendingCancelJobTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.gateway = FakeBraintreeGateway()
+        self.braintree_users = []
+        for i in range(10):
+            user = User.objects.create(username='user%s' % i, email='user%s@madeup.com' % i)
+            self.braintree_users.append(BraintreeUser.objects.create(
+                user=user, customer_id='c%s' % i, subscription_id='s%s' % i, active=True, pending_cancel=True,
+                expiry_date=timezone.now() + datetime.timedelta(days=1)))
+            self.gateway.add_subscription('s%s' % i, braintree.Subscription.Status.Active)
+
+    def tearDown(self):
+        cache.clear()
+        User.objects.all().delete()
+
+    def test_cancel_jobs(self):
+        """Every queued subscription is cancelled and its user updated"""
+        self.assertEqual(10, queue_cancellations(BraintreeUser.objects.all()))
+        report = process_cancel_jobs(workers=4, batch_size=3, gateway=self.gateway)
+
+        self.assertEqual(10, report.cancelled)
+        self.assertEqual(0, report.failed)
+        self.assertTrue(all(subscription.status == braintree.Subscription.Status.Canceled
+                            for subscription in self.gateway.subscriptions.values()))
+        self.assertFalse(BraintreeUser.objects.exclude(subscription_id="").exists())
+        self.assertFalse(BraintreeUser.objects.filter(active=True).exists())
+        self.assertEqual(10, PendingCancelJob.objects.filter(status=PendingCancelJob.DONE).count())
+
+    def test_queued_once(self):
+        queue_cancellations(BraintreeUser.objects.all())
+        self.assertEqual(0, queue_cancellations(BraintreeUser.objects.all()))
+        self.assertEqual(10, PendingCancelJob.objects.count())
+
+    def test_resume_after_crash(self):
+        """
+        A run which cancelled some subscriptions on Braintree but died before recording them is resumed, and the
+        subscriptions already cancelled count as done
+        """
+        queue_cancellations(BraintreeUser.objects.all())
+        for i in range(5):
+            self.gateway.subscriptions['s%s' % i].status = braintree.Subscription.Status.Canceled
+        report = process_cancel_jobs(workers=4, gateway=self.gateway)
+        self.assertEqual(10, report.cancelled)
+        self.assertEqual(0, report.failed)
+        self.assertFalse(PendingCancelJob.objects.filter(status=PendingCancelJob.PENDING).exists())
+
+    def test_failures_retried(self):
+        self.gateway.failing_ids.add('s2')
+        queue_cancellations(BraintreeUser.objects.all())
+        report = process_cancel_jobs(workers=4, gateway=self.gateway)
+        self.assertEqual(9, report.cancelled)
+        self.assertEqual(1, report.failed)
+        job = PendingCancelJob.objects.get(subscription_id='s2')
+        self.assertEqual(PendingCancelJob.PENDING, job.status)
+        self.assertEqual(1, job.attempts)
+        self.assertTrue(BraintreeUser.objects.get(pk=self.braintree_users[2].pk).pending_cancel)
+
+        self.gateway.failing_ids.clear()
+        report = process_cancel_jobs(workers=4, gateway=self.gateway)
+        self.assertEqual(1, report.cancelled)
+        self.assertEqual("", BraintreeUser.objects.get(pk=self.braintree_users[2].pk).subscription_id)
+
+    def test_gives_up(self):
+        self.gateway.failing_ids.add('s2')
+        queue_cancellations(BraintreeUser.objects.all())
+        for i in range(settings.CANCEL_MAX_ATTEMPTS):
+            process_cancel_jobs(workers=4, gateway=self.gateway)
+        self.assertEqual(PendingCancelJob.FAILED, PendingCancelJob.objects.get(subscription_id='s2').status)
+        self.assertEqual(0, process_cancel_jobs(workers=4, gateway=self.gateway).failed)
+
+    def test_renewed_users_skipped(self):
+        """Users who renewed after their job was queued keep their subscription"""
+        queue_cancellations(BraintreeUser.objects.all())
+        SubscriptionManager.renew(self.braintree_users[0])
+        report = process_cancel_jobs(workers=4, gateway=self.gateway)
+        self.assertEqual(9, report.cancelled)
+        self.assertEqual(1, report.skipped)
+        self.assertEqual(braintree.Subscription.Status.Active, self.gateway.subscriptions['s0'].status)
+        self.assertEqual('s0', BraintreeUser.objects.get(pk=self.braintree_users[0].pk).subscription_id)
+
+    def test_cancelled_again_after_renewing(self):
+        """A user who renews, so their job is skipped, and then cancels again has their subscription cancelled"""
+        queue_cancellations(BraintreeUser.objects.all())
+        SubscriptionManager.renew(self.braintree_users[0])
+        process_cancel_jobs(workers=4, gateway=self.gateway)
+        BraintreeUser.objects.filter(pk=self.braintree_users[0].pk).update(pending_cancel=True)
+
+        self.assertEqual(1, queue_cancellations(BraintreeUser.objects.all()))
+        job = PendingCancelJob.objects.get(subscription_id='s0')
+        self.assertEqual(PendingCancelJob.PENDING, job.status)
+        self.assertIsNone(job.time_completed)
+        report = process_cancel_jobs(workers=4, gateway=self.gateway)
+        self.assertEqual(1, report.cancelled)
+        self.assertEqual(braintree.Subscription.Status.Canceled, self.gateway.subscriptions['s0'].status)
+        self.assertEqual("", BraintreeUser.objects.get(pk=self.braintree_users[0].pk).subscription_id)
+
+    def test_failed_jobs_queued_again(self):
+        self.gateway.failing_ids.add('s2')
+        queue_cancellations(BraintreeUser.objects.all())
+        for i in range(settings.CANCEL_MAX_ATTEMPTS):
+            process_cancel_jobs(workers=4, gateway=self.gateway)
+        self.gateway.failing_ids.clear()
+        self.assertEqual(1, queue_cancellations(BraintreeUser.objects.filter(pending_cancel=True)))
+        self.assertEqual(0, PendingCancelJob.objects.get(subscription_id='s2').attempts)
+        self.assertEqual(1, process_cancel_jobs(workers=4, gateway=self.gateway).cancelled)
+
+    def test_entitlements_invalidated(self):
+        """Cancelled users lose access straight away, though the rows are changed without signals"""
+        user = self.braintree_users[0].user
+        self.assertTrue(SubscriptionManager.can_user_access_subscription_content(user))
+        queue_cancellations(BraintreeUser.objects.all())
+        process_cancel_jobs(workers=4, gateway=self.gateway)
+        self.assertIsNone(get_entitlement(user.pk))
+        self.assertFalse(SubscriptionManager.can_user_access_subscription_content(user))
@@ -0,0 +1,113 @@
+import time
+from threading import Event
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from subscriptions import settings
+from subscriptions.gateway import FakeBraintreeGateway, set_gateway
+from subscriptions.subscription_manager import SubscriptionManager, breaker, plan_catalog
+
+
+# Loaded in background threads, which can't see the test transaction, so cached in memory
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PlanCatalogTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        plan_catalog.clear()
+        breaker.reset()
+        self.gateway = FakeBraintreeGateway()
+        self.gateway.add_plan('other', Decimal('5.00'), 1)
+        self.gateway.add_plan(settings.SUBSCRIPTION_PLAN_ID, Decimal('30.00'), 12)
+        self.previous_gateway = set_gateway(self.gateway)
+
+    def tearDown(self):
+        set_gateway(self.previous_gateway)
+        plan_catalog.clear()
+        cache.clear()
+
+    def wait_for_refresh(self):
+        deadline = time.time() + 5
+        while plan_catalog._loading is not None and time.time() < deadline:
+            time.sleep(0.01)
+
+    def age_plans(self, seconds):
+        plans, loaded_at = plan_catalog._entry
+        plan_catalog._entry = (plans, loaded_at - seconds)
+        cache.set('subscriptions:plan_catalog', plan_catalog._entry)
+
+    def test_plan_loaded_once(self):
+        """The first lookup loads the plans, later ones are served from memory"""
+        self.assertEqual({'price': Decimal('30.00'), 'billing_frequency': 12},
+                         SubscriptionManager.get_subscription_plan())
+        SubscriptionManager.get_subscription_plan()
+        self.assertEqual(1, self.gateway.calls)
+
+    def test_plan_info_view(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='test123', email='fake@madeup.com'))
+        response = client.get('/plan_info/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal('30.00'), response.data['price'])
+        self.assertEqual(12, response.data['billing_frequency'])
+
+    def test_shared_between_processes(self):
+        """A process with nothing in memory picks the plans up from the shared cache"""
+        SubscriptionManager.get_subscription_plan()
+        plan_catalog._entry = None
+        self.assertEqual(Decimal('30.00'), SubscriptionManager.get_subscription_plan()['price'])
+        self.assertEqual(1, self.gateway.calls)
+
+    def test_refreshed_in_background(self):
+        """Old plans are still served while they are refreshed"""
+        SubscriptionManager.get_subscription_plan()
+        self.gateway.plans[1].price = Decimal('35.00')
+        self.age_plans(settings.PLAN_CATALOG_REFRESH + 1)
+        # Hold the refresh back until the old plans have been served
+        release = Event()
+        find_plans = self.gateway.find_plans
+
+        def held_find_plans():
+            release.wait(5)
+            return find_plans()
+        self.gateway.find_plans = held_find_plans
+
+        self.assertEqual(Decimal('30.00'), SubscriptionManager.get_subscription_plan()['price'])
+        release.set()
+        self.wait_for_refresh()
+        self.assertEqual(2, self.gateway.calls)
+        self.assertEqual(Decimal('35.00'), SubscriptionManager.get_subscription_plan()['price'])
+
+    def test_stale_plans_served_when_braintree_down(self):
+        SubscriptionManager.get_subscription_plan()
+        self.age_plans(settings.PLAN_CATALOG_REFRESH + 1)
+
+        calls = []
+
+        def unavailable():
+            calls.append(None)
+            raise IOError("Braintree is down")
+        self.gateway.find_plans = unavailable
+
+        self.assertEqual(Decimal('30.00'), SubscriptionManager.get_subscription_plan()['price'])
+        self.wait_for_refresh()
+        self.assertEqual(1, len(calls))
+        # Braintree isn't asked again within PLAN_CATALOG_RETRY
+        self.assertEqual(Decimal('30.00'), SubscriptionManager.get_subscription_plan()['price'])
+        self.wait_for_refresh()
+        self.assertEqual(1, len(calls))
+        # but is once it has passed
+        plan_catalog._last_failure -= settings.PLAN_CATALOG_RETRY
+        self.assertEqual(Decimal('30.00'), SubscriptionManager.get_subscription_plan()['price'])
+        self.wait_for_refresh()
+        self.assertEqual(2, len(calls))
+
+    def test_no_plans(self):
+        self.gateway.plans = []
+        self.assertIsNone(SubscriptionManager.get_subscription_plan())
@@ -0,0 +1,174 @@
+import datetime
+
+import braintree
+import pytz
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from subscriptions import reconciliation, settings
+from subscriptions.models import BraintreeUser
+from subscriptions.gateway import FakeBraintreeGateway, set_gateway
+from subscriptions.managers import SubscriptionStatusManager
+from subscriptions.reconciliation import reconcile_subscriptions, reconcile_by_search
+from subscriptions.entitlement_cache import get_entitlement
+from subscriptions.subscription_manager import SubscriptionManager
+
+
+class SubscribedUsersTestCase(TestCase):
+    """Twenty users with active subscriptions on a fake Braintree, not yet reconciled"""
+
+    def setUp(self):
+        cache.clear()
+        self.gateway = FakeBraintreeGateway()
+        self.expiry = datetime.date(2030, 1, 1)
+        # Braintree billing dates are in its own time zone
+        self.expiry_datetime = pytz.timezone(settings.BRAINTREE_TIME_ZONE).localize(datetime.datetime(2030, 1, 1))
+        self.braintree_users = []
+        for i in range(20):
+            user = User.objects.create(username='user%s' % i, email='user%s@madeup.com' % i)
+            self.braintree_users.append(BraintreeUser.objects.create(user=user, customer_id='c%s' % i,
+                                                                     subscription_id='s%s' % i))
+            self.gateway.add_subscription('s%s' % i, braintree.Subscription.Status.Active, self.expiry)
+
+    def tearDown(self):
+        cache.clear()
+        User.objects.all().delete()
+
+
+class ReconciliationTestCase(SubscribedUsersTestCase):
+
+    def test_reconcile(self):
+        """Every subscription is fetched and changed rows are saved"""
+        self.gateway.subscriptions['s0'].status = braintree.Subscription.Status.Canceled
+        self.gateway.subscriptions['s1'].status = braintree.Subscription.Status.PastDue
+        report = reconcile_subscriptions(workers=4, gateway=self.gateway)
+
+        self.assertEqual(20, report.checked)
+        self.assertEqual(20, report.changed)
+        self.assertEqual(0, report.failed)
+        self.assertEqual(20, self.gateway.calls)
+
+        cancelled = BraintreeUser.objects.get(pk=self.braintree_users[0].pk)
+        self.assertEqual("", cancelled.subscription_id)
+        self.assertFalse(cancelled.active)
+        past_due = BraintreeUser.objects.get(pk=self.braintree_users[1].pk)
+        self.assertFalse(past_due.active)
+        self.assertEqual(self.expiry_datetime, past_due.expiry_date)
+        active = BraintreeUser.objects.get(pk=self.braintree_users[2].pk)
+        self.assertTrue(active.active)
+        self.assertEqual(self.expiry_datetime, active.expiry_date)
+
+    def test_unchanged_rows_not_saved(self):
+        """A second run finds nothing to change"""
+        reconcile_subscriptions(workers=4, gateway=self.gateway)
+        report = reconcile_subscriptions(workers=4, gateway=self.gateway)
+        self.assertEqual(20, report.checked)
+        self.assertEqual(0, report.changed)
+
+    # Entitlements are invalidated in memcached in production, not with queries
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_batched_writes(self):
+        """Changed rows are written one batch per transaction"""
+        with self.assertNumQueries(1 + 4 * 9):
+            # Select, then per batch of 5: savepoint, 5 updates, mirror delete and insert, release
+            reconcile_subscriptions(workers=4, batch_size=5, gateway=self.gateway)
+
+    def test_failures_reported(self):
+        """Errors from Braintree are reported and don't stop the others being reconciled"""
+        self.gateway.failing_ids.add('s3')
+        del self.gateway.subscriptions['s4']
+        report = reconcile_subscriptions(workers=4, gateway=self.gateway)
+
+        self.assertEqual(20, report.checked)
+        self.assertEqual(18, report.changed)
+        self.assertEqual(2, report.failed)
+        self.assertEqual(set(['s3', 's4']), set(subscription_id for pk, subscription_id, error in report.failures))
+        self.assertFalse(BraintreeUser.objects.get(pk=self.braintree_users[3].pk).active)
+        self.assertTrue(BraintreeUser.objects.get(pk=self.braintree_users[5].pk).active)
+
+    def test_failed_batch_reported(self):
+        """A batch which can't be saved is reported as failed, and later batches are still saved"""
+        replace_mirrors = reconciliation.replace_mirrors
+
+        def failing_replace_mirrors(subscriptions):
+            if 's7' in [subscription.id for subscription in subscriptions]:
+                raise DatabaseError("Simulated database error")
+            replace_mirrors(subscriptions)
+        reconciliation.replace_mirrors = failing_replace_mirrors
+        try:
+            report = reconcile_subscriptions(workers=4, batch_size=5, gateway=self.gateway)
+        finally:
+            reconciliation.replace_mirrors = replace_mirrors
+
+        self.assertEqual(20, report.checked)
+        self.assertEqual(15, report.changed)
+        self.assertEqual(5, report.failed)
+        failed = set(pk for pk, subscription_id, error in report.failures)
+        self.assertEqual(15, BraintreeUser.objects.filter(active=True).count())
+        self.assertFalse(BraintreeUser.objects.filter(pk__in=failed, active=True).exists())
+
+    def test_stalled_calls_time_out(self):
+        """If Braintree stops responding the remaining subscriptions are reported as timed out"""
+        self.gateway.latency = 1
+        report = reconcile_subscriptions(workers=2, timeout=0.2, gateway=self.gateway)
+        self.assertEqual(0, report.checked)
+        self.assertEqual(20, report.timed_out)
+
+    def test_entitlements_invalidated(self):
+        """Saving reconciled rows clears cached entitlements"""
+        user = self.braintree_users[0].user
+        self.assertFalse(SubscriptionManager.can_user_access_subscription_content(user))
+        reconcile_subscriptions(workers=4, gateway=self.gateway)
+        self.assertIsNone(get_entitlement(user.pk))
+        self.assertTrue(SubscriptionManager.can_user_access_subscription_content(user))
+
+
+class SearchReconciliationTestCase(SubscribedUsersTestCase):
+
+    def test_reconcile_by_search(self):
+        """Calls scale with pages of search results rather than users"""
+        self.gateway.page_size = 8
+        self.gateway.subscriptions['s0'].status = braintree.Subscription.Status.Expired
+        self.gateway.add_subscription('other', braintree.Subscription.Status.Active, self.expiry)
+        report = reconcile_by_search(gateway=self.gateway)
+
+        self.assertEqual(20, report.checked)
+        self.assertEqual(20, report.changed)
+        self.assertEqual(0, report.failed)
+        # One call for the ids, then three pages of 21 subscriptions
+        self.assertEqual(4, self.gateway.calls)
+        self.assertEqual("", BraintreeUser.objects.get(pk=self.braintree_users[0].pk).subscription_id)
+        self.assertEqual(self.expiry_datetime, BraintreeUser.objects.get(pk=self.braintree_users[1].pk).expiry_date)
+
+    def test_search_by_status(self):
+        """Only subscriptions with the requested statuses are fetched"""
+        self.gateway.subscriptions['s0'].status = braintree.Subscription.Status.Canceled
+        report = reconcile_by_search(statuses=[braintree.Subscription.Status.Canceled], gateway=self.gateway)
+        self.assertEqual(1, report.checked)
+        self.assertEqual(0, report.failed)
+        self.assertEqual("", BraintreeUser.objects.get(pk=self.braintree_users[0].pk).subscription_id)
+        self.assertIsNone(BraintreeUser.objects.get(pk=self.braintree_users[1].pk).expiry_date)
+
+    def test_match_braintree_state_by_status(self):
+        """The statuses given to match_braintree_state restrict its search"""
+        self.gateway.subscriptions['s0'].status = braintree.Subscription.Status.Canceled
+        previous_gateway = set_gateway(self.gateway)
+        try:
+            report = SubscriptionStatusManager.match_braintree_state(
+                search=True, statuses=[braintree.Subscription.Status.Canceled])
+        finally:
+            set_gateway(previous_gateway)
+        self.assertEqual(1, report.checked)
+        self.assertEqual("", BraintreeUser.objects.get(pk=self.braintree_users[0].pk).subscription_id)
+
+    def test_missing_from_search(self):
+        """Users whose subscription Braintree doesn't return are reported and left alone"""
+        del self.gateway.subscriptions['s5']
+        report = reconcile_by_search(gateway=self.gateway)
+        self.assertEqual(19, report.checked)
+        self.assertEqual(1, report.failed)
+        self.assertEqual('s5', report.failures[0][1])
+        self.assertFalse(BraintreeUser.objects.get(pk=self.braintree_users[5].pk).active)
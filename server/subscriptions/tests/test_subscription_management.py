@@ -14,6 +14,8 @@ class SubscriptionManagementTestCase(TestCase):
     def setUp(self):
         self.user = User.objects.create_user('test',first_name='Test',last_name='User',email='fake@madeup.com')
         self.braintree_customer = BraintreeUser.objects.create(user=self.user,customer_id="12345",payment_method_token=None)
+        # Braintree calls failing in other tests mustn't leave the circuit breaker open
+        breaker.reset()
 
         # Mock time info to return fixed day every time
         when(timezone).now().thenReturn(timezone.make_aware(datetime.datetime(2016,7,24,0,0,0),pytz.utc))
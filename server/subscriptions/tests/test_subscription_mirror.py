@@ -0,0 +1,92 @@
+import datetime
+from decimal import Decimal
+
+import braintree
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from subscriptions.models import BraintreeUser, SubscriptionMirror
+from subscriptions.gateway import FakeBraintreeGateway, set_gateway
+from subscriptions.mirror import get_fresh_mirror
+from subscriptions.reconciliation import reconcile_subscriptions
+from subscriptions.cancellation import queue_cancellations, process_cancel_jobs
+from subscriptions.subscription_manager import breaker
+
+
+class SubscriptionMirrorTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        breaker.reset()
+        self.gateway = FakeBraintreeGateway()
+        self.previous_gateway = set_gateway(self.gateway)
+        self.user = User.objects.create(username='subscribed', email='subscribed@madeup.com')
+        self.braintree_user = BraintreeUser.objects.create(user=self.user, customer_id='c1', subscription_id='sub1')
+        self.subscription = self.gateway.add_subscription(
+            'sub1', braintree.Subscription.Status.Active, datetime.date(2030, 1, 1),
+            billing_period_start_date=datetime.date(2029, 12, 1), created_at=datetime.datetime(2029, 1, 1, 12, 0),
+            price=Decimal('30.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        set_gateway(self.previous_gateway)
+        cache.clear()
+        User.objects.all().delete()
+
+    def test_status_served_from_mirror(self):
+        """Only the first status request calls Braintree"""
+        response = self.client.get('/subscription_status/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(1, self.gateway.calls)
+
+        response = self.client.get('/subscription_status/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(1, self.gateway.calls)
+        self.assertEqual('Active', response.data['status'])
+        self.assertEqual(datetime.date(2029, 12, 1), response.data['first_billing_date'])
+        self.assertEqual(datetime.date(2030, 1, 1), response.data['renewal_or_cancel_date'])
+        self.assertEqual(Decimal('30.00'), response.data['price'])
+
+    def test_refresh(self):
+        """?refresh=1 reads from Braintree and updates the mirror"""
+        self.client.get('/subscription_status/')
+        self.subscription.status = braintree.Subscription.Status.PastDue
+        self.assertEqual('Active', self.client.get('/subscription_status/').data['status'])
+
+        response = self.client.get('/subscription_status/?refresh=1')
+        self.assertEqual('Problem collecting payment', response.data['status'])
+        self.assertEqual(2, self.gateway.calls)
+        self.assertEqual(braintree.Subscription.Status.PastDue, SubscriptionMirror.objects.get().status)
+
+    def test_stale_mirror_not_served(self):
+        self.client.get('/subscription_status/')
+        SubscriptionMirror.objects.update(time_refreshed=timezone.now() - datetime.timedelta(days=30))
+        self.assertIsNone(get_fresh_mirror('sub1'))
+        self.client.get('/subscription_status/')
+        self.assertEqual(2, self.gateway.calls)
+        self.assertIsNotNone(get_fresh_mirror('sub1'))
+
+    def test_pending_cancel_from_mirror(self):
+        self.client.get('/subscription_status/')
+        BraintreeUser.objects.filter(pk=self.braintree_user.pk).update(pending_cancel=True)
+        self.assertEqual('Pending Cancellation', self.client.get('/subscription_status/').data['status'])
+
+    def test_reconciliation_refreshes_mirror(self):
+        reconcile_subscriptions(workers=2, gateway=self.gateway)
+        mirror = SubscriptionMirror.objects.get(subscription_id='sub1')
+        self.assertEqual(braintree.Subscription.Status.Active, mirror.status)
+        self.assertEqual(timezone.make_aware(datetime.datetime(2029, 1, 1, 12, 0), timezone.utc), mirror.created_at)
+        self.client.get('/subscription_status/')
+        self.assertEqual(1, self.gateway.calls)
+
+    def test_cancellation_updates_mirror(self):
+        reconcile_subscriptions(workers=2, gateway=self.gateway)
+        BraintreeUser.objects.filter(pk=self.braintree_user.pk).update(pending_cancel=True)
+        queue_cancellations(BraintreeUser.objects.all())
+        process_cancel_jobs(workers=2, gateway=self.gateway)
+        self.assertEqual(braintree.Subscription.Status.Canceled, SubscriptionMirror.objects.get().status)
@@ -0,0 +1,119 @@
+import datetime
+
+import braintree
+from braintree.webhook_testing import WebhookTesting
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from subscriptions.models import BraintreeUser, SubscriptionNotification
+from subscriptions.gateway import FakeBraintreeGateway, set_gateway
+from subscriptions.webhooks import process_notifications, sweep
+
+Kind = braintree.WebhookNotification.Kind
+
+
+class WebhookTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.gateway = FakeBraintreeGateway()
+        self.previous_gateway = set_gateway(self.gateway)
+        self.expiry = datetime.date(2030, 1, 1)
+        self.user = User.objects.create(username='subscribed', email='subscribed@madeup.com')
+        self.braintree_user = BraintreeUser.objects.create(user=self.user, customer_id='c1', subscription_id='sub1',
+                                                           active=True, expiry_date=timezone.now())
+        self.subscription = self.gateway.add_subscription('sub1', braintree.Subscription.Status.Active, self.expiry)
+
+    def tearDown(self):
+        set_gateway(self.previous_gateway)
+        cache.clear()
+        User.objects.all().delete()
+
+    def post_webhook(self, notification):
+        return self.client.post('/braintree_webhook/', notification)
+
+    def test_webhook_stored(self):
+        """Verified subscription webhooks are stored in the inbox, without being applied straight away"""
+        response = self.post_webhook(WebhookTesting.sample_notification(Kind.SubscriptionCanceled, 'sub1'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        notification = SubscriptionNotification.objects.get()
+        self.assertEqual(Kind.SubscriptionCanceled, notification.kind)
+        self.assertEqual('sub1', notification.subscription_id)
+        self.assertIsNone(notification.time_processed)
+        self.assertEqual(0, self.gateway.calls)
+
+    def test_invalid_signature_rejected(self):
+        notification = WebhookTesting.sample_notification(Kind.SubscriptionCanceled, 'sub1')
+        notification['bt_signature'] = notification['bt_signature'][:-4] + 'abcd'
+        response = self.post_webhook(notification)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(SubscriptionNotification.objects.exists())
+
+    def test_other_kinds_ignored(self):
+        response = self.post_webhook(WebhookTesting.sample_notification(Kind.Check, None))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(SubscriptionNotification.objects.exists())
+
+    def test_redelivery_stored_once(self):
+        """Braintree retrying a delivery doesn't add a second notification"""
+        notification = WebhookTesting.sample_notification(Kind.SubscriptionWentPastDue, 'sub1')
+        self.post_webhook(notification)
+        response = self.post_webhook(notification)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(1, SubscriptionNotification.objects.count())
+
+    def test_notifications_applied(self):
+        """The worker applies the subscription's current state, fetching each subscription once"""
+        self.subscription.status = braintree.Subscription.Status.Canceled
+        self.post_webhook(WebhookTesting.sample_notification(Kind.SubscriptionWentPastDue, 'sub1'))
+        self.post_webhook(WebhookTesting.sample_notification(Kind.SubscriptionCanceled, 'sub1'))
+
+        report = process_notifications()
+        self.assertEqual(1, report.changed)
+        self.assertEqual(1, self.gateway.calls)
+        braintree_user = BraintreeUser.objects.get(pk=self.braintree_user.pk)
+        self.assertFalse(braintree_user.active)
+        self.assertEqual("", braintree_user.subscription_id)
+        self.assertFalse(SubscriptionNotification.objects.filter(time_processed__isnull=True).exists())
+
+    def test_replay_idempotent(self):
+        """Applying the same notifications again changes nothing"""
+        self.post_webhook(WebhookTesting.sample_notification(Kind.SubscriptionChargedSuccessfully, 'sub1'))
+        self.assertEqual(1, process_notifications().changed)
+        SubscriptionNotification.objects.update(time_processed=None)
+        report = process_notifications()
+        self.assertEqual(1, report.checked)
+        self.assertEqual(0, report.changed)
+        braintree_user = BraintreeUser.objects.get(pk=self.braintree_user.pk)
+        self.assertTrue(braintree_user.active)
+        self.assertEqual(self.expiry, braintree_user.expiry_date.date())
+
+    def test_failed_notifications_retried(self):
+        self.gateway.failing_ids.add('sub1')
+        self.post_webhook(WebhookTesting.sample_notification(Kind.SubscriptionExpired, 'sub1'))
+        report = process_notifications()
+        self.assertEqual(1, report.failed)
+        notification = SubscriptionNotification.objects.get()
+        self.assertIsNone(notification.time_processed)
+        self.assertEqual(1, notification.attempts)
+
+        self.gateway.failing_ids.clear()
+        process_notifications()
+        self.assertIsNotNone(SubscriptionNotification.objects.get().time_processed)
+
+    def test_sweep(self):
+        """The sweep only checks users who may have drifted"""
+        up_to_date = User.objects.create(username='up_to_date', email='up_to_date@madeup.com')
+        BraintreeUser.objects.create(user=up_to_date, customer_id='c2', subscription_id='sub2', active=True,
+                                     expiry_date=timezone.now() + datetime.timedelta(days=10))
+        self.gateway.add_subscription('sub2', braintree.Subscription.Status.Active, self.expiry)
+
+        report = sweep(workers=2)
+        self.assertEqual(1, report.checked)
+        self.assertEqual(1, self.gateway.calls)
+        self.assertEqual(self.expiry, BraintreeUser.objects.get(pk=self.braintree_user.pk).expiry_date.date())
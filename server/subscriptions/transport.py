@@ -0,0 +1,233 @@
+"""
+HTTP transport for the braintree SDK, installed by braintree_init. Out of the box the SDK calls requests.get/post/...
+directly, so every call opens a fresh TLS connection and every operation shares the one timeout. This transport
+instead:
+
+ - sends everything through one requests session per process, keeping up to BRAINTREE_POOL_SIZE connections alive;
+ - times each operation out after its own entry in BRAINTREE_OPERATION_TIMEOUTS (BRAINTREE_TIMEOUT otherwise);
+ - retries reads which fail with a connection error, a timeout or a 502/503/504, at most BRAINTREE_RETRIES times,
+   and only while the retry budget allows. Every request adds BRAINTREE_RETRY_BUDGET_RATIO to the budget and every
+   retry takes 1 from it, so when Braintree is struggling retries stay a small fraction of the traffic;
+ - records the latency of every operation, exposed to staff by BraintreeTransportMetricsView.
+
+Operations are named after the method and path with ids taken out, e.g. 'GET subscriptions/:id' or
+'PUT subscriptions/:id/cancel'.
+"""
+import time
+import logging
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+from braintree.util.http import Http
+
+import settings
+
+LOGGER = logging.getLogger(__name__)
+
+# Path segments which are part of the operation rather than ids
+OPERATION_WORDS = frozenset(('cancel', 'advanced_search', 'advanced_search_ids', 'any', 'retry_charge', 'search',
+                             'find', 'submit_for_settlement', 'void', 'refund'))
+# Reads, which can safely be sent again
+RETRYABLE_OPERATIONS = frozenset(('POST subscriptions/advanced_search', 'POST subscriptions/advanced_search_ids',
+                                  'POST customers/advanced_search', 'POST customers/advanced_search_ids',
+                                  'POST transactions/advanced_search', 'POST transactions/advanced_search_ids'))
+RETRYABLE_STATUSES = frozenset((502, 503, 504))
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def operation_name(http_verb, path):
+    """The name of the operation a request performs, e.g. 'GET subscriptions/:id'"""
+    parts = [part for part in path.split('?')[0].split('/') if part]
+    if 'merchants' in parts:
+        # Skip the scheme, host and merchant id
+        parts = parts[parts.index('merchants') + 2:]
+    if not parts:
+        return http_verb
+    segments = [parts[0]] + [part if part in OPERATION_WORDS else ':id' for part in parts[1:]]
+    return '%s %s' % (http_verb, '/'.join(segments))
+
+
+def operation_timeout(operation, default=None):
+    return settings.BRAINTREE_OPERATION_TIMEOUTS.get(operation, default or settings.BRAINTREE_TIMEOUT)
+
+
+def is_retryable(operation):
+    return operation.startswith('GET ') or operation in RETRYABLE_OPERATIONS
+
+
+class RetryBudget(object):
+    """
+    Thread safe budget of retries. Every request deposits ratio, every retry withdraws 1. The budget starts at, and
+    never holds more than, minimum, which allows a few retries while traffic is light.
+    """
+
+    def __init__(self, ratio=None, minimum=None):
+        self.ratio = settings.BRAINTREE_RETRY_BUDGET_RATIO if ratio is None else ratio
+        self.minimum = settings.BRAINTREE_RETRY_BUDGET_MIN if minimum is None else minimum
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.balance = float(self.minimum)
+
+    def deposit(self):
+        with self._lock:
+            self.balance = min(self.minimum, self.balance + self.ratio)
+
+    def withdraw(self):
+        """Take a retry from the budget, returning False if there is none left"""
+        with self._lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+class OperationMetrics(object):
+    """Counters and a latency histogram for one operation. Not thread safe, TransportMetrics holds the lock"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, elapsed, failed):
+        self.count += 1
+        self.errors += 1 if failed else 0
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.buckets[i] += 1
+
+    def as_dict(self):
+        labels = ['<=%s' % bound for bound in LATENCY_BUCKETS] + ['>%s' % LATENCY_BUCKETS[-1]]
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'retries': self.retries,
+            'mean_seconds': self.total_time / self.count if self.count else 0.0,
+            'max_seconds': self.max_time,
+            'latency_histogram': dict(zip(labels, self.buckets)),
+        }
+
+
+class TransportMetrics(object):
+    """Thread safe metrics of every Braintree request sent by this process, by operation"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.operations = {}
+            self.retries_denied = 0
+
+    def _operation(self, operation):
+        if operation not in self.operations:
+            self.operations[operation] = OperationMetrics()
+        return self.operations[operation]
+
+    def record(self, operation, elapsed, failed=False):
+        """Record one attempt at an operation. Retries are recorded as attempts of their own"""
+        with self._lock:
+            self._operation(operation).record(elapsed, failed)
+
+    def record_retry(self, operation):
+        with self._lock:
+            self._operation(operation).retries += 1
+
+    def record_retry_denied(self):
+        with self._lock:
+            self.retries_denied += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'pool_size': settings.BRAINTREE_POOL_SIZE,
+                'retries_denied': self.retries_denied,
+                'retry_budget': retry_budget.balance,
+                'operations': dict((name, operation.as_dict()) for name, operation in self.operations.items()),
+            }
+
+
+metrics = TransportMetrics()
+retry_budget = RetryBudget()
+
+_session = None
+_session_lock = Lock()
+
+
+def get_session():
+    """The session shared by every Braintree call, created on first use so it is created after any web server fork"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.BRAINTREE_POOL_SIZE, max_retries=0)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def close_session():
+    """Close every pooled connection. A new session is created on next use"""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+class PooledHttp(Http):
+    """
+    The SDK's Http with connection pooling, per operation timeouts, retries and metrics. Pass the class as
+    http_strategy to braintree.Configuration. The SDK creates one for every call, so all state lives in this module.
+    """
+
+    def http_do(self, http_verb, path, headers, request_body):
+        url = path if path.startswith(self.config.base_url()) else self.config.base_url() + path
+        operation = operation_name(http_verb, url)
+        timeout = operation_timeout(operation, self.config.timeout)
+        retries = settings.BRAINTREE_RETRIES if is_retryable(operation) else 0
+        retry_budget.deposit()
+        attempt = 0
+        while True:
+            started = time.time()
+            try:
+                response = get_session().request(http_verb, url, headers=headers, data=request_body,
+                                                 verify=self.environment.ssl_certificate, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                metrics.record(operation, time.time() - started, failed=True)
+                if not self._retry(operation, attempt, retries):
+                    raise
+                LOGGER.warning("Retrying Braintree %s after %s", operation, e)
+            else:
+                failed = response.status_code in RETRYABLE_STATUSES
+                metrics.record(operation, time.time() - started, failed=failed)
+                if not failed or not self._retry(operation, attempt, retries):
+                    return [response.status_code, response.text]
+                LOGGER.warning("Retrying Braintree %s after HTTP %s", operation, response.status_code)
+            attempt += 1
+
+    def _retry(self, operation, attempt, retries):
+        """Whether another attempt may be made, waiting a little first if so"""
+        if attempt >= retries:
+            return False
+        if not retry_budget.withdraw():
+            metrics.record_retry_denied()
+            return False
+        metrics.record_retry(operation)
+        time.sleep(settings.BRAINTREE_RETRY_BACKOFF * 2 ** attempt)
+        return True
@@ -1,19 +1,28 @@
 import braintree
+from django.http import HttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
-from subscription_manager import SubscriptionManager, BraintreeError
+from subscription_manager import SubscriptionManager, BraintreeError, BraintreeUnavailableError, breaker
+from webhooks import receive_notification, WebhookError
+from mirror import get_fresh_mirror, get_mirror, store_subscription
+from client_tokens import client_tokens
+import transport
 import traceback
 import logging
 
 LOGGER = logging.getLogger(__name__)
 
 class GenerateClientTokenView(APIView):
+    """Hands out a client token for checkout, normally straight from the pre-generated pool"""
 
     def get(self,request,format='json'):
         try:
-            token = braintree.ClientToken.generate()
+            token = client_tokens.pop()
             return Response({'token':token},status=status.HTTP_200_OK)
+        except BraintreeUnavailableError:
+            return Response({'errors':['Braintree client token is unavailable. Please try again later']},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except:
             return Response({'errors':['Braintree client token could not be generated']},
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -92,7 +101,9 @@ class SubscriptionCancelView(APIView):
 
 class SubscriptionStatusView(APIView):
     """
-    View for retireving information about the user's subscription
+    View for retireving information about the user's subscription. Served from the local subscription mirror while it
+    is fresh; ?refresh=1 forces a live read from Braintree. While the circuit breaker is open the mirror is served
+    however old it is.
     """
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -109,12 +120,28 @@ class SubscriptionStatusView(APIView):
         if braintree_user.subscription_id == "" or braintree_user.subscription_id is None:
             return Response({'user_not_subscribed':True},status=status.HTTP_200_OK)
 
-        # Further cases will require info from braintree
-        try:
-            subscription_obj = SubscriptionManager.fetch_subscription_from_braintree(braintree_user)
-        except BraintreeError:
-            LOGGER.exception("Could not fetch user info from braintree!")
-            return Response({'errors': ["Something went wrong. Please try again later"]},status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # Further cases need the subscription details, from the local mirror unless it is stale or a refresh is asked for
+        subscription_obj = None
+        if request.query_params.get('refresh') not in ('1', 'true'):
+            subscription_obj = get_fresh_mirror(braintree_user.subscription_id)
+        if subscription_obj is None:
+            try:
+                subscription_obj = SubscriptionManager.fetch_subscription_from_braintree(braintree_user)
+            except BraintreeUnavailableError:
+                subscription_obj = get_mirror(braintree_user.subscription_id)
+                if subscription_obj is None:
+                    return Response({'errors': ["Subscription details are unavailable. Please try again later"]},
+                                    status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                LOGGER.warning("Braintree unavailable, serving the mirrored subscription %s from %s",
+                               braintree_user.subscription_id, subscription_obj.time_refreshed)
+            except BraintreeError:
+                LOGGER.exception("Could not fetch user info from braintree!")
+                return Response({'errors': ["Something went wrong. Please try again later"]},status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            else:
+                try:
+                    store_subscription(subscription_obj)
+                except Exception:
+                    LOGGER.exception("Could not mirror subscription %s", braintree_user.subscription_id)
 
         sub_status = SubscriptionManager.convert_subscription_status_to_string(subscription_obj.status)
         first_billing_date = subscription_obj.billing_period_start_date
@@ -160,13 +187,70 @@ class SubscriptionChangePaymentMethodView(APIView):
 
 class PlanInfoView(APIView):
     """
-    Retrieve information about the subscription plan for the app. All users will share the same plan.
+    Retrieve information about the subscription plan for the app. All users will share the same plan. Served from the
+    plan catalog, so this keeps working while the circuit breaker is open unless no plans were ever loaded.
     """
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self,request,format='json'):
         plan = SubscriptionManager.get_subscription_plan()
-        if plan is None:
+        if plan is None and breaker.is_open:
+            return Response({'errors':['Subscription plan is unavailable. Please try again later']},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        elif plan is None:
             return Response({'errors':['No subscription plan found']},status=status.HTTP_404_NOT_FOUND)
         else:
-            return Response(plan,status=status.HTTP_200_OK)
\ No newline at end of file
+            return Response(plan,status=status.HTTP_200_OK)
+
+
+class SubscriptionWebhookView(APIView):
+    """
+    Receives subscription webhooks from Braintree. Notifications are only verified and stored here, and applied later
+    by the process_subscription_webhooks command, so Braintree always gets a quick answer.
+    """
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self,request,format='json'):
+        # Braintree checks the endpoint when it is registered by sending a challenge
+        challenge = request.query_params.get('bt_challenge')
+        if not challenge:
+            return Response({'errors':['No challenge provided']},status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return HttpResponse(braintree.WebhookNotification.verify(challenge),content_type='text/plain')
+        except Exception:
+            return Response({'errors':['Invalid challenge']},status=status.HTTP_400_BAD_REQUEST)
+
+    def post(self,request,format='json'):
+        signature = request.data.get('bt_signature')
+        payload = request.data.get('bt_payload')
+        if not signature or not payload:
+            return Response({'errors':['Missing signature or payload']},status=status.HTTP_400_BAD_REQUEST)
+        try:
+            receive_notification(signature, payload)
+        except WebhookError as e:
+            LOGGER.warning("Rejected webhook: %s", e)
+            return Response({'errors':['Invalid signature']},status=status.HTTP_400_BAD_REQUEST)
+        return Response({},status=status.HTTP_200_OK)
+
+
+
+class ClientTokenPoolMetricsView(APIView):
+    """Fill level and hit rate of this process's client token pool, for staff only"""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self,request,format='json'):
+        return Response(client_tokens.as_dict(),status=status.HTTP_200_OK)
+
+
+class BraintreeTransportMetricsView(APIView):
+    """
+    Latency histograms and retries of this process's calls to Braintree, by operation, and the state of its circuit
+    breaker, for staff only
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self,request,format='json'):
+        data = transport.metrics.as_dict()
+        data['circuit_breaker'] = breaker.as_dict()
+        return Response(data,status=status.HTTP_200_OK)
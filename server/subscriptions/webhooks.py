@@ -0,0 +1,148 @@
+"""
+Incremental reconciliation from Braintree's subscription webhooks. SubscriptionWebhookView verifies each notification
+and appends it to the SubscriptionNotification inbox; process_notifications then applies the inbox in batches.
+
+Notifications can arrive late, out of order or more than once, so they are treated as a hint that a subscription has
+changed rather than as the change itself: the worker fetches the subscription's current state and applies that. This
+makes processing idempotent, so a notification which is processed twice (by a retry or by two workers at once) does no
+harm. Several notifications for one subscription in a batch cost a single fetch.
+"""
+import time
+import logging
+
+import braintree
+from braintree.exceptions.invalid_signature_error import InvalidSignatureError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+import settings
+from gateway import get_gateway
+from mirror import replace_mirrors
+from models import BraintreeUser, SubscriptionNotification
+from reconciliation import ReconciliationReport, reconcile_subscriptions
+from subscription_manager import SubscriptionManager
+
+LOGGER = logging.getLogger(__name__)
+
+Kind = braintree.WebhookNotification.Kind
+SUBSCRIPTION_KINDS = (
+    Kind.SubscriptionCanceled,
+    Kind.SubscriptionChargedSuccessfully,
+    Kind.SubscriptionChargedUnsuccessfully,
+    Kind.SubscriptionExpired,
+    Kind.SubscriptionTrialEnded,
+    Kind.SubscriptionWentActive,
+    Kind.SubscriptionWentPastDue,
+)
+
+
+class WebhookError(Exception):
+    """Raised for notifications which don't come from Braintree"""
+    pass
+
+
+def receive_notification(signature, payload):
+    """
+    Verify a webhook and add it to the inbox. Returns the stored SubscriptionNotification, or None for notifications
+    which aren't about subscriptions or have already been received.
+    """
+    try:
+        notification = braintree.WebhookNotification.parse(signature, payload)
+    except InvalidSignatureError as e:
+        raise WebhookError(str(e))
+    if notification.kind not in SUBSCRIPTION_KINDS:
+        LOGGER.info("Ignoring %s webhook", notification.kind)
+        return None
+    timestamp = notification.timestamp
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, timezone.utc)
+    try:
+        with transaction.atomic():
+            return SubscriptionNotification.objects.create(kind=notification.kind,
+                                                           subscription_id=notification.subscription.id,
+                                                           timestamp=timestamp, payload=payload)
+    except IntegrityError:
+        LOGGER.info("Duplicate %s webhook for subscription %s", notification.kind, notification.subscription.id)
+        return None
+
+
+def _record(notifications, error=None):
+    """Mark notifications as processed, or count a failed attempt against them"""
+    pks = [notification.pk for notification in notifications]
+    if error is None:
+        SubscriptionNotification.objects.filter(pk__in=pks).update(time_processed=timezone.now())
+    else:
+        SubscriptionNotification.objects.filter(pk__in=pks).update(attempts=F('attempts') + 1, last_error=error)
+
+
+def process_notifications(batch_size=None, gateway=None):
+    """Apply every unprocessed notification in the inbox, one batch at a time. Returns a ReconciliationReport"""
+    batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+    gateway = gateway or get_gateway()
+    report = ReconciliationReport()
+    start = time.time()
+    last_pk = 0
+    while True:
+        notifications = list(SubscriptionNotification.objects
+                             .filter(time_processed__isnull=True, attempts__lt=settings.WEBHOOK_MAX_ATTEMPTS,
+                                     pk__gt=last_pk)
+                             .order_by('pk')[:batch_size])
+        if not notifications:
+            break
+        last_pk = notifications[-1].pk
+        by_subscription = {}
+        for notification in notifications:
+            by_subscription.setdefault(notification.subscription_id, []).append(notification)
+        braintree_users = dict((braintree_user.subscription_id, braintree_user) for braintree_user in
+                               BraintreeUser.objects.filter(subscription_id__in=list(by_subscription)))
+
+        for subscription_id, pending in by_subscription.items():
+            braintree_user = braintree_users.get(subscription_id)
+            if braintree_user is None:
+                # Already cancelled here, or not one of ours
+                _record(pending)
+                continue
+            report.checked += 1
+            try:
+                subscription = gateway.find_subscription(subscription_id)
+                with transaction.atomic():
+                    changed = SubscriptionManager.apply_braintree_state(braintree_user, subscription)
+                    if changed:
+                        braintree_user.save(update_fields=changed)
+                    replace_mirrors([subscription])
+                    _record(pending)
+            except Exception as e:
+                error = '%s: %s' % (e.__class__.__name__, e)
+                LOGGER.error("Could not apply webhooks for subscription %s: %s", subscription_id, error)
+                report.add_failure(braintree_user, error)
+                _record(pending, error)
+                continue
+            if changed:
+                report.changed += 1
+        if len(notifications) < batch_size:
+            break
+    report.elapsed = time.time() - start
+    if report.checked:
+        LOGGER.info("Applied subscription webhooks: %s", report)
+    return report
+
+
+def drifted_users():
+    """
+    Subscribed users whose state may have drifted from Braintree despite the webhooks: active users whose billing
+    period has ended without a renewal being seen, and inactive users who still have a subscription (past due).
+    """
+    now = timezone.now()
+    return (BraintreeUser.objects.exclude(subscription_id="").exclude(subscription_id=None)
+            .exclude(active=True, expiry_date__gt=now))
+
+
+def sweep(workers=None, timeout=None, batch_size=None, gateway=None):
+    """
+    The cheap periodic check used alongside webhooks: apply any notifications still in the inbox, then reconcile only
+    the users in drifted_users. Returns a ReconciliationReport for the sweep.
+    """
+    process_notifications(gateway=gateway)
+    return reconcile_subscriptions(workers=workers, timeout=timeout, batch_size=batch_size, gateway=gateway,
+                                   braintree_users=drifted_users())